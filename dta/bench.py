@@ -0,0 +1,386 @@
+"""
+Benchmark of network loading speed, in simulated seconds per wall-clock second, for the loading engines on the
+project network.  Run as python -m dta.bench [horizon [engine ...]], where engines are 'numpy', 'numba' and
+'reference' (numpy and numba, where installed, by default; the reference engine is slow on long horizons).
+Numba compile time is excluded by loading a short horizon first.
+
+python -m dta.bench corridor [horizon [interchanges ...]] instead measures how partitioned loading scales on
+synthetic corridors (dta.corridor) of the given numbers of interchanges, split into 1 (a FastEngine in one
+process), 2 and 4 contiguous parts.  Speedups need as many free cores as parts.
+
+python -m dta.bench size [horizon ...] measures how a corridor's size drives cost: for corridors of 1 to 32
+interchanges and each horizon (900 and 3600 seconds by default) it reports the network's size, the time to
+build it, to load it with the fast engine and to run one TDSP search from a freeway origin, the peak memory
+traced over building and loading, and, on corridors of up to ENUMERATION_LIMIT interchanges (simple paths grow
+exponentially with the corridor's length), the number of simple paths from that origin and the time to
+enumerate them.
+
+python -m dta.bench suite [output.json [baseline.json [threshold]]] runs the benchmark suite: link updates for
+each link model, each node model's proportions and transition flows, TDSP and findAllShortestPaths,
+calculateTravelTimes, dta_env.reset and a full episode, each timed separately (the best of SUITE_REPEATS runs)
+on the project network or on a single link over SUITE_HORIZON seconds.  Results are printed and, given an
+output file, written to it as JSON; given a baseline file written the same way, any benchmark slower than its
+baseline by more than the threshold (0.25, i.e. 25%, by default) is flagged as a regression and the suite exits
+with a nonzero status.
+
+python -m dta.bench memory [horizon [engine ...]] records memory across a dta_env episode (warmup, then 300
+second intervals through the horizon) with each of the given loading engines ('reference' and 'fast' by
+default), each in a fresh worker process: the memory traced by tracemalloc and the process's peak resident set
+size after reset and after each step, then the largest allocation sites and Network.memoryReport's breakdown
+by structure (of at least 0.01 MB) at the end of the episode.
+
+python -m dta.bench replication [replications [workers ...]] times oldProject's ramp meter replications (one
+vehicle every 3.5 seconds, reference engine) run on one thread per replication, as oldProject used to, and with
+replication.replicate on each number of worker processes (1 and one per CPU by default), and reports each run's
+speedup over the threads.  Threads run one at a time under the GIL, so processes gain only with free cores.
+Follow-up: the speedup on a multi-core machine has not been measured yet (it has only been run on one CPU,
+where the threads took 28.3 s and the processes 24-25 s); run this there and record the results here.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import platform
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import numpy
+import numpy.random as random
+from . import linkModel
+from .conformance import projectNetwork
+from .corridor import Corridor
+from .dta_env import dta_env
+from .kernels import HAVE_NUMBA
+from .oldProject import indivSim
+from .replication import replicate, replicationSeeds
+
+EXIT_FAILURE = -1
+
+ENUMERATION_LIMIT = 4
+SIZES = [1, 2, 4, 8, 16, 32]
+
+SUITE_HORIZON = 600
+SUITE_REPEATS = 3
+REGRESSION_THRESHOLD = 0.25
+LINK_MODELS = [linkModel.PointQueueLink, linkModel.SpatialQueueLink, linkModel.CellTransmissionModelLink,
+               linkModel.LinkTransmissionModelLink]
+
+ENGINES = {
+    'reference' : ('reference', None),
+    'numpy' : ('fast', False),
+    'numba' : ('fast', True)
+}
+
+def loadingSpeed(engine, horizon, seed=1883):
+    """
+    Loads the project network over the horizon with the given engine (a key of ENGINES) and returns the
+    simulated seconds per wall-clock second.
+    """
+    name, jit = ENGINES[engine]
+    if jit:
+        warmup = projectNetwork(10, seed)
+        warmup.setEngine(name, jit)
+        warmup.loadNetwork()
+    net = projectNetwork(horizon, seed)
+    net.setEngine(name, jit)
+    start = time.perf_counter()
+    net.loadNetwork(range(horizon), True)
+    elapsed = time.perf_counter() - start
+    return horizon * net.timestep / elapsed
+
+def corridorSpeed(numInterchanges, numParts, horizon, seed=1883):
+    """
+    Loads a corridor of numInterchanges interchanges over the horizon, in numParts parts (or with the Numba
+    kernels in one process, for one part), and returns the simulated seconds per wall-clock second.
+    """
+    net = Corridor(numInterchanges, horizon, seed)
+    if numParts == 1:
+        net.setEngine('fast', True)
+    else:
+        net.setEngine('partitioned', parts=numParts)
+    net.loadNetwork(range(1), True)
+    start = time.perf_counter()
+    net.loadNetwork(range(1, horizon), False)
+    elapsed = time.perf_counter() - start
+    if numParts > 1:
+        net.engine.close()
+    return (horizon - 1) * net.timestep / elapsed
+
+def corridorScaling(args):
+    horizon = int(args[0]) if len(args) > 0 else 1800
+    sizes = [int(n) for n in args[1:]] if len(args) > 1 else [8, 32]
+    if not HAVE_NUMBA:
+        print("Numba is not installed; partitioned loading would run interpreted")
+        return
+    corridorSpeed(2, 1, 10)
+    print("Interchanges,Parts,Horizon,Cores,Simulated seconds per wall second")
+    for n in sizes:
+        for parts in (1, 2, 4):
+            print("{},{},{},{},{:.1f}".format(n, parts, horizon, os.cpu_count(), corridorSpeed(n, parts, horizon)))
+
+def corridorCosts(numInterchanges, horizon, jit, seed=1883):
+    """
+    Builds and loads a corridor of numInterchanges interchanges over the horizon, and returns a dictionary of
+    its size and of the times (in seconds) and peak traced memory (in MB) it took.
+    """
+    start = time.perf_counter()
+    net = Corridor(numInterchanges, horizon, seed)
+    costs = {'build' : time.perf_counter() - start}
+    net.setEngine('fast', jit)
+    start = time.perf_counter()
+    net.loadNetwork(range(horizon), True)
+    costs['load'] = time.perf_counter() - start
+    start = time.perf_counter()
+    net.TDSP(net.node['NB', 'origin'], 0)
+    costs['TDSP'] = time.perf_counter() - start
+    if numInterchanges <= ENUMERATION_LIMIT:
+        start = time.perf_counter()
+        costs['paths'] = len(net.enumeratePaths(net.node['NB', 'origin']))
+        costs['enumeration'] = time.perf_counter() - start
+    costs.update(links=net.numLinks, nodes=net.numNodes, ODs=len(net.ODs))
+
+    # tracing slows Python down several times, so memory is measured on a separate run
+    tracemalloc.start()
+    net = Corridor(numInterchanges, horizon, seed)
+    net.setEngine('fast', jit)
+    net.loadNetwork(range(horizon), True)
+    costs['memory'] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return costs
+
+def sizeScaling(args):
+    horizons = [int(h) for h in args] if len(args) > 0 else [900, 3600]
+    corridorCosts(1, 10, HAVE_NUMBA)
+    print("Interchanges,Horizon,Links,Nodes,ODs,Build (s),Load (s),TDSP (s),Peak memory (MB),Paths,Enumeration (s)")
+    for horizon in horizons:
+        for n in SIZES:
+            costs = corridorCosts(n, horizon, HAVE_NUMBA)
+            print("{},{},{},{},{},{:.3f},{:.3f},{:.4f},{:.1f},{},{}".format(n, horizon, costs['links'], costs['nodes'],
+                  costs['ODs'], costs['build'], costs['load'], costs['TDSP'], costs['memory'], costs.get('paths', ''),
+                  "{:.3f}".format(costs['enumeration']) if 'enumeration' in costs else ''))
+
+def best(function, repeats=SUITE_REPEATS):
+    """
+    Calls function repeats times and returns the shortest time (in seconds) and the last result.
+    """
+    times = list()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def drivenLink(model, horizon):
+    """
+    A freeway link of the given model fed at two thirds of its capacity and discharging its sending flow, with
+    counts through the horizon.
+    """
+    link = model(1, 60, 15, 200, 2640, 1800, ID='link')
+    path = ('link',)
+    for t in range(horizon):
+        sendingFlow, receivingFlow = link.linkUpdate(t)
+        link.flowIn({path : min(receivingFlow, link.capacity * 2 / 3)})
+        link.flowOut({path : sendingFlow})
+    return link
+
+def linkBenchmarks(results, horizon):
+    for model in LINK_MODELS:
+        link = drivenLink(model, horizon)
+        def update():
+            for t in range(horizon):
+                link.linkUpdate(t)
+        results['linkUpdate ' + model.__name__] = {'seconds' : best(update)[0], 'calls' : horizon}
+
+def nodeBenchmarks(results, net, times):
+    """
+    Times calculateProportions and calculateTransitionFlows of every node in the loaded network net at each
+    of times, grouped by node model.  moveFlow changes the counts, so it is timed only as part of loading.
+    """
+    nodes = dict()
+    for i, node in enumerate(net.nodes):
+        if not hasattr(node, 'isCentroid'):
+            nodes.setdefault(type(node).__name__, list()).append(i)
+    for name, indices in sorted(nodes.items()):
+        def transitions():
+            for t in times:
+                for i in indices:
+                    node = net.nodes[i]
+                    proportion = node.calculateProportions(t)
+                    node.calculateTransitionFlows({net.links[ij] : net.links[ij].calculateSendingFlow(t) for ij in net.reverseStar[i]},
+                                                  {net.links[ij] : net.links[ij].calculateReceivingFlow(t) for ij in net.forwardStar[i]},
+                                                  proportion, t)
+        results['node ' + name] = {'seconds' : best(transitions)[0], 'calls' : len(times) * len(indices)}
+
+def episode(engine, warmup, interval, numIntervals, seed):
+    env = dta_env(interval, numIntervals, warmup, engine=engine)
+    actions = random.RandomState(seed).uniform(-1, 1, (numIntervals, env.action_dim))
+    env.reset(seed)
+    for a in actions:
+        env.step(a)
+
+def suite(horizon=SUITE_HORIZON, seed=1883):
+    """
+    Runs every benchmark of the suite and returns a dictionary of results, keyed by benchmark, each giving the
+    best time in seconds and the number of calls it covers.
+    """
+    results = dict()
+    linkBenchmarks(results, horizon)
+
+    net = projectNetwork(horizon, seed)
+    results['loadNetwork reference'] = {'seconds' : best(lambda: net.loadNetwork(range(horizon), True), 1)[0], 'calls' : horizon}
+    nodeBenchmarks(results, net, range(horizon // 2, horizon, 10))
+    results['calculateTravelTimes'] = {'seconds' : best(net.calculateTravelTimes)[0], 'calls' : 1}
+    origins = sorted(set(od.origin for od in net.ODs))
+    results['TDSP'] = {'seconds' : best(lambda: [net.TDSP(r, t) for r in origins for t in range(0, horizon, 10)])[0],
+                       'calls' : len(origins) * len(range(0, horizon, 10))}
+    results['findAllShortestPaths'] = {'seconds' : best(net.findAllShortestPaths, 1)[0], 'calls' : 1}
+
+    warmup, interval, numIntervals = horizon // 2, horizon // 4, 2
+    for engine in ('reference', 'fast'):
+        # the env (and its network, built from the spec) is built once, so only reset is timed
+        env = dta_env(interval, numIntervals, warmup, engine=engine)
+        results['dta_env.reset ' + engine] = {'seconds' : best(lambda: env.reset(seed))[0], 'calls' : 1}
+        results['episode ' + engine] = {'seconds' : best(lambda: episode(engine, warmup, interval, numIntervals, seed))[0],
+                                        'calls' : 1}
+    return results
+
+def compareBaseline(results, baseline, threshold):
+    """
+    Returns the names of benchmarks in both results and baseline whose times grew by more than threshold.
+    """
+    return [name for name in results if name in baseline and
+            results[name]['seconds'] > (1 + threshold) * baseline[name]['seconds']]
+
+def runSuite(args):
+    output = args[0] if len(args) > 0 else None
+    baselineFile = args[1] if len(args) > 1 else None
+    threshold = float(args[2]) if len(args) > 2 else REGRESSION_THRESHOLD
+    results = suite()
+    baseline = dict()
+    if baselineFile is not None:
+        with open(baselineFile) as f:
+            baseline = json.load(f)['benchmarks']
+    regressions = compareBaseline(results, baseline, threshold)
+    print("Benchmark,Calls,Seconds,Microseconds per call,Baseline seconds,Ratio,Regression")
+    for name, result in results.items():
+        base = baseline.get(name, {}).get('seconds')
+        print("{},{},{:.4f},{:.1f},{},{},{}".format(name, result['calls'], result['seconds'], 1e6 * result['seconds'] / result['calls'],
+              '' if base is None else "{:.4f}".format(base), '' if base is None else "{:.2f}".format(result['seconds'] / base),
+              'REGRESSION' if name in regressions else ''))
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump({'horizon' : SUITE_HORIZON, 'repeats' : SUITE_REPEATS,
+                       'environment' : {'python' : platform.python_version(), 'numpy' : numpy.__version__,
+                                        'numba' : HAVE_NUMBA, 'machine' : platform.machine(), 'cpus' : os.cpu_count()},
+                       'benchmarks' : results}, f, indent=2)
+    if len(regressions) > 0:
+        sys.exit(EXIT_FAILURE)
+
+def peakRSS():
+    """
+    The peak resident set size of this process so far, in MB (ru_maxrss is in kB on Linux).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def episodeMemory(engine, horizon, interval=300, seed=1883, top=5):
+    """
+    Runs a dta_env episode over the horizon with the given engine under tracemalloc, and returns the memory
+    measured at each stage (as rows of stage, traced MB, traced peak MB and peak RSS MB), the top allocation
+    sites at the end and the network's memory report.
+    """
+    warmup = horizon % interval + interval if horizon > interval else horizon
+    numIntervals = (horizon - warmup) // interval
+    tracemalloc.start()
+    env = dta_env(interval, max(numIntervals, 1), warmup, engine=engine)
+    env.reset(seed)
+    stages = [('reset',) + tuple(m / 2**20 for m in tracemalloc.get_traced_memory()) + (peakRSS(),)]
+    for k in range(numIntervals):
+        env.step()
+        stages.append(('step %d' % (k + 1),) + tuple(m / 2**20 for m in tracemalloc.get_traced_memory()) + (peakRSS(),))
+    sites = [(str(stat.traceback[0]), stat.size / 2**20) for stat in tracemalloc.take_snapshot().statistics('lineno')[:top]]
+    tracemalloc.stop()
+    return stages, sites, env.net.memoryReport()
+
+def memoryProfile(args):
+    horizon = int(args[0]) if len(args) > 0 else 1800
+    engines = args[1:] if len(args) > 1 else ['reference', 'fast']
+    results = dict()
+    for engine in engines:
+        with ProcessPoolExecutor(1) as pool:
+            results[engine] = pool.submit(episodeMemory, engine, horizon).result()
+    print("Engine,Horizon,Stage,Traced MB,Traced peak MB,Peak RSS MB")
+    for engine, (stages, sites, report) in results.items():
+        for stage in stages:
+            print("{},{},{},{:.1f},{:.1f},{:.1f}".format(engine, horizon, *stage))
+    for engine, (stages, sites, report) in results.items():
+        print("\n{} engine, largest allocation sites at the end of the episode:".format(engine))
+        for site, size in sites:
+            print("  {:.1f} MB {}".format(size, site))
+        print("{} engine, memoryReport ({:.1f} MB in all):".format(engine, report['total'] / 2**20))
+        for name, size in sorted(report['structures'].items(), key=lambda item: -item[1]):
+            if size >= 0.01 * 2**20:
+                print("  {:.2f} MB {}".format(size / 2**20, name))
+
+def threaded(simulate, seeds):
+    """
+    Runs simulate(seed) for every seed on its own thread, as oldProject.runSims did, and returns the results in
+    seed order.
+    """
+    results = [None] * len(seeds)
+    def run(j):
+        results[j] = simulate(seeds[j])
+    threads = [threading.Thread(target=run, args=(j,)) for j in range(len(seeds))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def replicationSpeedup(args):
+    cpus = os.cpu_count()
+    n = int(args[0]) if len(args) > 0 else 2 * cpus
+    workerCounts = [int(w) for w in args[1:]] if len(args) > 1 else sorted({1, cpus})
+    simulate = partial(indivSim, 7, 3000, 600)
+    seeds = replicationSeeds(n)
+    start = time.time()
+    reference = threaded(simulate, seeds)
+    threadTime = time.time() - start
+    print("Method,Workers,Replications,Seconds,Speedup over threads,Same results")
+    print("threads,{},{},{:.2f},1.00,yes".format(n, n, threadTime))
+    for workers in workerCounts:
+        start = time.time()
+        results = replicate(simulate, seeds, workers)
+        seconds = time.time() - start
+        same = all(results[k]['tstt'] == reference[k]['tstt'] for k in range(n))
+        print("processes,{},{},{:.2f},{:.2f},{}".format(workers, n, seconds, threadTime / seconds, 'yes' if same else 'no'))
+    print("({} CPUs)".format(cpus))
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'replication':
+        replicationSpeedup(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'memory':
+        memoryProfile(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'suite':
+        runSuite(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'corridor':
+        corridorScaling(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'size':
+        sizeScaling(sys.argv[2:])
+        return
+    horizon = int(sys.argv[1]) if len(sys.argv) > 1 else 3600
+    engines = sys.argv[2:] if len(sys.argv) > 2 else ['numpy'] + (['numba'] if HAVE_NUMBA else [])
+    print("Engine,Horizon,Simulated seconds per wall second")
+    for engine in engines:
+        if engine == 'numba' and not HAVE_NUMBA:
+            print("{},{},Numba is not installed".format(engine, horizon))
+            continue
+        print("{},{},{:.1f}".format(engine, horizon, loadingSpeed(engine, horizon)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import sys
+import traceback
+import numpy
+from numpy.lib.format import open_memmap
+from dta import nodeModel
+from dta import utils
+from .network import Network, ArrayOD, createLink
+
+# node kinds of the node table, inferred from the numbers of links entering and leaving each node
+ORIGIN, DESTINATION, SERIES, DIVERGE, MERGE = range(5)
+
+HEADER_FILE = 'header.npy'
+LINKS_FILE = 'links.npy'
+NODES_FILE = 'nodes.npy'
+ODS_FILE = 'ods.npy'
+DEMAND_FILE = 'demand.npy'
+
+OD_DTYPE = [('origin', 'i4'), ('destination', 'i4'), ('total', 'f8')]
+LINK_FIELDS = [('tail', 'i4'), ('head', 'i4'), ('freeFlowSpeed', 'f8'), ('backwardWaveSpeed', 'f8'),
+               ('jamDensity', 'f8'), ('length', 'f8'), ('capacity', 'f8'), ('priority', 'f8'), ('model', 'U3')]
+
+def nodeKinds(numNodes, links):
+    """
+    The kind of each node, from the tails and heads of the links (a sequence of (tail, head) pairs).
+    """
+    ins = numpy.zeros(numNodes, dtype=int)
+    outs = numpy.zeros(numNodes, dtype=int)
+    for tail, head in links:
+        outs[tail] += 1
+        ins[head] += 1
+    kinds = numpy.zeros(numNodes, dtype=numpy.int8)
+    for i in range(numNodes):
+        if ins[i] == 0:                       kinds[i] = ORIGIN
+        elif outs[i] == 0:                    kinds[i] = DESTINATION
+        elif ins[i] == 1 and outs[i] == 1:    kinds[i] = SERIES
+        elif ins[i] == 1:                     kinds[i] = DIVERGE
+        elif outs[i] == 1:                    kinds[i] = MERGE
+        else:
+            print("General intersections not yet implemented (node %d)" % (i + 1))
+            raise utils.BadFileFormatException
+    return kinds
+
+def convertNetworkFile(networkFile, directory):
+    """
+    Converts a text network file (the format of Network.readNetworkFile) into the binary format read by
+    BinaryNetwork, in the given directory.  Demand rows are written straight into the memory-mapped demand
+    matrix as they are read, so the whole table is never held in memory.
+    """
+    numODs = 0
+    header = None
+    links = list()
+    with open(networkFile, "r") as f:
+        for line in f:
+            if len(line.strip()) == 0 or line[0] == '#':
+                continue
+            if header is None:
+                inputs = line.split(",")
+                if len(inputs) != 4: raise utils.BadFileFormatException
+                header = (int(inputs[0]), int(inputs[1]), float(inputs[2]), int(inputs[3]))
+            elif len(links) < header[0]:
+                inputs = line.strip().split(",")
+                if len(inputs) != 10:
+                    print("Error reading link data line %s" % inputs)
+                    raise utils.BadFileFormatException
+                links.append((inputs[0], int(inputs[1]) - 1, int(inputs[2]) - 1) + tuple(float(x) for x in inputs[3:9]) + (inputs[9],))
+            else:
+                numODs += 1
+    if header is None:
+        print("Network file %s has no header" % networkFile)
+        raise utils.BadFileFormatException
+    numLinks, numNodes, timestep, timeHorizon = header
+
+    os.makedirs(directory, exist_ok=True)
+    numpy.save(os.path.join(directory, HEADER_FILE), numpy.array([numLinks, numNodes, timestep, timeHorizon], dtype=float))
+    width = max([len(link[0]) for link in links] + [1])
+    numpy.save(os.path.join(directory, LINKS_FILE), numpy.array(links, dtype=[('ID', 'U%d' % width)] + LINK_FIELDS))
+    numpy.save(os.path.join(directory, NODES_FILE), nodeKinds(numNodes, [(link[1], link[2]) for link in links]))
+
+    ods = numpy.zeros(numODs, dtype=OD_DTYPE)
+    demand = open_memmap(os.path.join(directory, DEMAND_FILE), mode='w+', dtype=numpy.int32, shape=(timeHorizon, numODs))
+    k = 0
+    lines = 0
+    with open(networkFile, "r") as f:
+        for line in f:
+            if len(line.strip()) == 0 or line[0] == '#':
+                continue
+            lines += 1
+            if lines <= 1 + numLinks:
+                continue
+            inputs = line.split(",")
+            if len(inputs) != 2 + timeHorizon:
+                print("Wrong number of demand values for OD pair")
+                raise utils.BadFileFormatException
+            rates = numpy.array(inputs[2:], dtype=numpy.int32)
+            ods[k] = (int(inputs[0]) - 1, int(inputs[1]) - 1, rates.sum())
+            demand[:, k] = rates
+            k += 1
+    demand.flush()
+    del demand
+    numpy.save(os.path.join(directory, ODS_FILE), ods)
+
+class BinaryNetwork(Network):
+    """
+    A network read from the binary format written by convertNetworkFile: a directory of .npy files holding
+    the header (numbers of links and nodes, timestep and time horizon), the link parameter table (in the units
+    and order of a text network file's link lines, with 0-based nodes), the node table (the kind of each node,
+    see nodeKinds), the OD index table (origin, destination and total demand) and the demand matrix, with one
+    row per time and one column per OD pair.  The demand matrix is memory-mapped, so opening a network reads
+    only the tables, and each OD's demandRates, or demandWindow for all OD pairs over a range of times, read
+    demand from disk as it is used.  Paths are set up as for any other network, with finalizeODs and
+    initializePathFlows.
+    """
+
+    def __init__(self, directory):
+        self.links = dict()
+        self.nodes = list()
+        self.ODs = list()
+        self.pathFlows = dict()
+        self.pathTravelTimes = dict()
+        self.linkPriorities = dict()
+        self.detectorPeriod = 1
+        self.engine = None
+        self.profile = None
+        self.gridlockWatch = None
+        self.gridlock = None
+
+        try:
+            numLinks, numNodes, self.timestep, timeHorizon = numpy.load(os.path.join(directory, HEADER_FILE))
+            links = numpy.load(os.path.join(directory, LINKS_FILE))
+            kinds = numpy.load(os.path.join(directory, NODES_FILE))
+            ods = numpy.load(os.path.join(directory, ODS_FILE))
+            self.demandMatrix = numpy.load(os.path.join(directory, DEMAND_FILE), mmap_mode='r')
+        except IOError:
+            print("\nError reading binary network %s" % directory)
+            traceback.print_exc(file=sys.stdout)
+            raise utils.BadFileFormatException
+        self.numLinks = int(numLinks)
+        self.numNodes = int(numNodes)
+        self.timeHorizon = int(timeHorizon)
+
+        for row in links:
+            ij = str(row['ID'])
+            link = createLink(str(row['model']), self.timestep, row['freeFlowSpeed'], row['backwardWaveSpeed'],
+                              row['jamDensity'], row['length'], row['capacity'], ij)
+            link.tail = int(row['tail'])
+            link.head = int(row['head'])
+            self.links[ij] = link
+            self.linkPriorities[ij] = float(row['priority'])
+
+        for k, od in enumerate(ods):
+            self.ODs.append(ArrayOD(int(od['origin']), int(od['destination']), self.demandMatrix[:, k]))
+        self.totalDemand = float(ods['total'].sum())
+
+        self.validate()
+        self.finalizeLinks()
+        self.buildNodes(kinds)
+
+    def buildNodes(self, kinds):
+        for i in range(self.numNodes):
+            inLinks = [self.links[ij] for ij in self.reverseStar[i]]
+            outLinks = [self.links[ij] for ij in self.forwardStar[i]]
+            if kinds[i] == ORIGIN:        self.nodes.append(nodeModel.OriginNode(inLinks, outLinks))
+            elif kinds[i] == DESTINATION: self.nodes.append(nodeModel.DestinationNode(inLinks, outLinks))
+            elif kinds[i] == SERIES:      self.nodes.append(nodeModel.SeriesNode(inLinks, outLinks))
+            elif kinds[i] == DIVERGE:     self.nodes.append(nodeModel.DivergeNode(inLinks, outLinks))
+            else:                         self.nodes.append(nodeModel.MergeNode(inLinks, outLinks,
+                                                               {self.links[ij] : self.linkPriorities[ij] for ij in self.reverseStar[i]}))
+
+    def demandWindow(self, start, end):
+        """
+        The demand of every OD pair at times start through end - 1, as an array with one row per time and one
+        column per OD pair (in the order of self.ODs), read from the memory-mapped matrix.
+        """
+        return numpy.asarray(self.demandMatrix[start:end])
@@ -0,0 +1,180 @@
+"""
+Conformance suite for the fast loading engine: loads each network with the reference engine and with forks
+using the fast engine, then compares cumulative link counts at every time, path-disaggregated counts at the
+end of each load, and the network's running totals.  It also checks that networks loaded together as scenarios of one engine
+match the same networks loaded alone, and that partitioned loading in worker processes matches a FastEngine with the
+same cut links.  Run as python -m dta.conformance [horizon [tolerance]];
+exits with a nonzero status if any difference exceeds the tolerance.
+"""
+import sys
+import time
+import numpy
+import numpy.random as random
+from .network import Network
+from .networkModel import NetworkModel, vectorizeConfig
+from .initConfig import getInitConfig
+from .volumes import getVolumes
+from .dta_env import applyActions
+from .corridor import Corridor
+from .fastEngine import FastEngine
+from .partition import signalParts
+from .kernels import HAVE_NUMBA
+
+EXIT_FAILURE = -1
+
+def projectNetwork(horizon, seed):
+    """
+    The project network with random demand, in the order dta_env.reset builds it.
+    """
+    net = NetworkModel(horizon)
+    net.reset()
+    net.setConfig(getInitConfig(net.timestep))
+    net.setDemand(getVolumes(net.timestep), random.RandomState(seed))
+    net.finalizeODs()
+    net.initializePathFlows()
+    return net
+
+def rampMeterNetwork(horizon, seed):
+    """
+    The single ramp meter network used by oldProject, metering one vehicle every 4 seconds.
+    """
+    net = Network(1/4, seed)
+    net.initializePathFlows()
+    return net
+
+def pathCounts(net, ij, t, downstream):
+    """
+    The path counts of link ij at time t, as (path, count) pairs, from the links or, if net has an engine, from it.
+    """
+    if net.engine is None:
+        link = net.links[ij]
+        return (link.downstreamPathCount[t] if downstream else link.upstreamPathCount[t]).items()
+    return [(path, net.engine.pathCount(ij, path, t, downstream)) for path in net.engine.paths if ij in path]
+
+def compare(reference, fast, t):
+    """
+    Returns the largest differences between the two networks' counts through time t.
+    """
+    differences = {'link counts' : 0.0, 'path counts' : 0.0}
+    for ij in reference.links:
+        link = reference.links[ij]
+        for referenceCounts, fastCounts in ((link.upstreamTotal, fast.links[ij].upstreamTotal),
+                                            (link.downstreamTotal, fast.links[ij].downstreamTotal)):
+            d = numpy.abs(numpy.array(referenceCounts[:t + 2]) - fastCounts[:t + 2]).max()
+            differences['link counts'] = max(differences['link counts'], d)
+        for downstream in (False, True):
+            for path, count in pathCounts(reference, ij, t + 1, downstream):
+                d = abs(count - fast.engine.pathCount(ij, path, t + 1, downstream))
+                differences['path counts'] = max(differences['path counts'], d)
+    for total in ('vehiclesInNetwork', 'totalLoaded', 'totalTerminated', 'TSTT', 'TFFT'):
+        differences[total] = abs(getattr(reference, total) - getattr(fast, total))
+    return differences
+
+def check(name, reference, ranges, tolerance, between=None):
+    """
+    Loads reference and fast-engine forks of it (with the NumPy methods, and with the Numba kernels if Numba is
+    installed) over each range in turn, calling between(net, k) on each before range k > 0, and prints the
+    differences after each range.  Returns True if all are within tolerance.
+    """
+    nets = {'reference' : reference}
+    for engine, jit in (('numpy', False), ('numba', True)):
+        if jit and not HAVE_NUMBA:
+            continue
+        nets[engine] = reference.fork()
+        nets[engine].setEngine('fast', jit)
+    passed = True
+    times = {engine : 0.0 for engine in nets}
+    for k, r in enumerate(ranges):
+        for engine, net in nets.items():
+            if between is not None and k > 0:
+                between(net, k)
+            start = time.time()
+            net.loadNetwork(r, k == 0)
+            times[engine] += time.time() - start
+        for engine in nets:
+            if engine == 'reference':
+                continue
+            differences = compare(reference, nets[engine], r[-1])
+            ok = all(d <= tolerance for d in differences.values())
+            passed = passed and ok
+            print("%s (%s), times %d-%d: %s %s" % (name, engine, r[0], r[-1],
+                  ', '.join("%s %.3g" % (key, d) for key, d in differences.items()), 'ok' if ok else 'FAILED'))
+    print("%s: %s" % (name, ', '.join("%s %.2fs" % (engine, times[engine]) for engine in nets)))
+    return passed
+
+def checkBatch(horizon, seeds, tolerance):
+    """
+    Loads the project network for several demand seeds as scenarios of one engine, and each seed alone, and
+    compares the counts of each scenario with its lone run.  Returns True if all are within tolerance.
+    """
+    passed = True
+    alone = list()
+    for seed in seeds:
+        net = projectNetwork(horizon, seed)
+        net.setEngine('fast', False)
+        net.loadNetwork(range(horizon), True)
+        alone.append(net)
+    for engine, jit in (('numpy', False), ('numba', True)):
+        if jit and not HAVE_NUMBA:
+            continue
+        nets = [projectNetwork(horizon, seed) for seed in seeds]
+        nets[0].setEngine('fast', jit, nets[1:])
+        nets[0].loadNetwork(range(horizon), True)
+        for k, seed in enumerate(seeds):
+            d = max(numpy.abs(alone[k].links[ij].upstreamTotal - nets[k].links[ij].upstreamTotal).max() for ij in nets[k].links)
+            d = max(d, abs(alone[k].TSTT - nets[k].TSTT), abs(alone[k].totalTerminated - nets[k].totalTerminated))
+            ok = d <= tolerance
+            passed = passed and ok
+            print("batch of %d (%s), scenario %d: largest difference %.3g %s" % (len(seeds), engine, k, d, 'ok' if ok else 'FAILED'))
+    return passed
+
+def checkPartitioned(name, make, parts, ranges, tolerance):
+    """
+    Loads the network returned by make() with a PartitionedEngine and with a FastEngine in this process given
+    the same cut links, over each range in turn, and compares them after each range.  Returns True if all
+    differences are within tolerance.
+    """
+    partitioned = make()
+    partitioned.setEngine('partitioned', parts=parts(partitioned) if callable(parts) else parts)
+    single = make()
+    single.engine = FastEngine(single, cutLinks=partitioned.engine.cutLinks)
+    passed = True
+    for k, r in enumerate(ranges):
+        partitioned.loadNetwork(r, k == 0)
+        single.loadNetwork(r, k == 0)
+        differences = compare(single, partitioned, r[-1])
+        ok = all(d <= tolerance for d in differences.values())
+        passed = passed and ok
+        print("%s (partitioned, %d parts), times %d-%d: %s %s" % (name, len(partitioned.engine.parts), r[0], r[-1],
+              ', '.join("%s %.3g" % (key, d) for key, d in differences.items()), 'ok' if ok else 'FAILED'))
+    partitioned.engine.close()
+    return passed
+
+def main():
+    horizon = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    tolerance = float(sys.argv[2]) if len(sys.argv) > 2 else 1e-6
+    interval = horizon // 3
+
+    ranges = [range(0, interval), range(interval, 2 * interval), range(2 * interval, horizon)]
+
+    # change signal and ramp meter settings between intervals, the same way on both networks
+    net = projectNetwork(horizon, 1883)
+    mins, maxs = net.constraintArrays()
+    config = vectorizeConfig(getInitConfig(net.timestep))
+    actions = random.RandomState(0).uniform(-1, 1, (len(ranges), len(config)))
+    configs = [applyActions(config, actions[k], 0.2 * config, mins, maxs) for k in range(len(ranges))]
+    def changeConfig(net, k):
+        net.setConfig(configs[k])
+
+    passed = check('project network', net, ranges, tolerance, changeConfig)
+    passed = check('ramp meter network', rampMeterNetwork(3600, 1883), ranges, tolerance) and passed
+    passed = checkBatch(horizon, [1883, 2019, 35541], tolerance) and passed
+    if HAVE_NUMBA:
+        # partitioned loading needs Numba
+        passed = checkPartitioned('project network', lambda: projectNetwork(horizon, 1883), signalParts, ranges, tolerance) and passed
+        passed = checkPartitioned('corridor', lambda: Corridor(6, horizon), 3, ranges, tolerance) and passed
+    if not passed:
+        sys.exit(EXIT_FAILURE)
+
+if __name__ == "__main__":
+    main()
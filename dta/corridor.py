@@ -0,0 +1,274 @@
+from dta import linkModel
+from dta import nodeModel
+from .network import Network, StochasticOD
+from .initConfig import getInitConfig
+import numpy
+
+# nodes of each interchange, in the order they are numbered; the ramp terminals are signalized like the project
+# network's wrx (west, serving the southbound ramps) and erx (east, serving the northbound ramps)
+INTERCHANGE_NODES = ['EB origin', 'WB origin', 'EB destination', 'WB destination',
+                     'NB diverge', 'NB meter', 'NB merge', 'SB diverge', 'SB meter', 'SB merge', 'west', 'east']
+
+class Corridor(Network):
+    """
+    A synthetic freeway corridor of numInterchanges chained diamond interchanges, built from the same link and
+    node models as NetworkModel, for measuring how loading, shortest paths and path enumeration scale beyond
+    the project network.  Interchanges are numbered northbound.  At each one the freeway diverges to an
+    off-ramp (XR), continues (C) and merges with a metered on-ramp (NRU, then NRD below the meter), and a cross
+    street passes over it between two signalized ramp terminals:
+
+        EB i I --> west terminal --EB i C--> east terminal --EB i O-->
+        <-- WB i O              <--WB i C--              <-- WB i I
+
+    The southbound ramps meet the west terminal and the northbound ramps the east one.  Links are named by
+    direction, interchange and role: freeway 'NB 3 U' (entering the interchange), 'NB 3 C', 'NB 3 XR',
+    'NB 3 NRU', 'NB 3 NRD' and 'NB D' (leaving the corridor); cross street 'EB 3 I', 'EB 3 C' and 'EB 3 O'.
+    Nodes are numbered interchange by interchange in the order of INTERCHANGE_NODES, after the two freeway
+    origins, so contiguous runs of node indices are contiguous stretches of the corridor.
+
+    Demand, in vehicles per hour: freewayVolume enters at each end of the freeway, of which throughShare
+    travels the whole corridor and the rest leaves at one of the first span exits; rampVolume enters each
+    on-ramp (half from each end of the cross street) and leaves at one of the next span exits (or at the
+    end of the freeway, if fewer remain); crossVolume crosses the freeway on each cross street direction.
+    Exiting trips leave to either end of the cross street.  Every OD pair has a single path, so
+    initializePathFlows assigns demand without shortest path searches.
+
+    Controllers are named 'NB ramp 3', 'SB ramp 3', 'wrx 3' and 'erx 3'; setConfig takes a dictionary of
+    their parameters, like NetworkModel's nested configuration dictionaries, and defaultConfig gives the
+    project network's ramp terminal timings at every interchange.
+    """
+
+    def __init__(self, numInterchanges, timeHorizon=3600, seed=1883, span=3, freewayVolume=2400, rampVolume=600,
+                 crossVolume=400, throughShare=0.7, meterRate=900):
+        self.links = dict()
+        self.nodes = list()
+        self.ODs = list()
+        self.pathFlows = dict()
+        self.pathTravelTimes = dict()
+
+        self.timestep = 1
+        self.timeHorizon = timeHorizon
+        self.numInterchanges = numInterchanges
+        self.linkPriorities = dict()
+        self.totalDemand = 0.0
+        self.detectorPeriod = 1
+        self.engine = None
+        self.profile = None
+        self.gridlockWatch = None
+        self.gridlock = None
+        self.meterRate = meterRate
+
+        self.build()
+        self.numLinks = len(self.links)
+        self.numNodes = len(self.nodes)
+        self.finalizeLinks()
+        self.setConfig(self.defaultConfig())
+        self.setDemand(span, freewayVolume, rampVolume, crossVolume, throughShare, numpy.random.RandomState(seed))
+
+    def addLink(self, ID, tail, head, speed, back, length, capacity):
+        link = linkModel.CellTransmissionModelLink(self.timestep, speed, back, 200, length, capacity, ID)
+        link.tail = tail
+        link.head = head
+        self.links[ID] = link
+
+    def build(self):
+        """
+        Numbers the nodes, lays out the links, then creates the Node objects.
+        """
+        freewaySpeed = 65
+        freewayBack = 35
+        rampSpeed = 45
+        rampBack = 30
+        crossSpeed = 45
+        crossBack = 30
+        spacing = 5280
+
+        N = self.numInterchanges
+        self.node = {('NB', 'origin') : 0, ('SB', 'origin') : 1}
+        for i in range(N):
+            for role in INTERCHANGE_NODES:
+                self.node[i, role] = len(self.node)
+        self.node['NB', 'destination'] = len(self.node)
+        self.node['SB', 'destination'] = len(self.node)
+        node = self.node
+
+        # the freeway, northbound through increasing interchange numbers and southbound back
+        self.routes = {'NB' : list(range(N)), 'SB' : list(reversed(range(N)))}
+        terminals = {'NB' : 'east', 'SB' : 'west'}
+        for d in self.routes:
+            upstream = node[d, 'origin']
+            for n, i in enumerate(self.routes[d]):
+                diverge, meter, merge, terminal = node[i, d + ' diverge'], node[i, d + ' meter'], node[i, d + ' merge'], node[i, terminals[d]]
+                self.addLink('%s %d U' % (d, i), upstream, diverge, freewaySpeed, freewayBack, spacing if n > 0 else 1500, 3200)
+                self.addLink('%s %d C' % (d, i), diverge, merge, freewaySpeed, freewayBack, 1500, 3200)
+                self.addLink('%s %d XR' % (d, i), diverge, terminal, rampSpeed, rampBack, 2640, 1600)
+                self.addLink('%s %d NRU' % (d, i), terminal, meter, rampSpeed, rampBack, 1140, 1600)
+                self.addLink('%s %d NRD' % (d, i), meter, merge, rampSpeed, rampBack, 1500, 1600)
+                upstream = merge
+            self.addLink('%s D' % d, upstream, node[d, 'destination'], freewaySpeed, freewayBack, 1500, 3200)
+
+        # the cross streets, eastbound from the west terminal to the east one and westbound back
+        for i in range(N):
+            self.addLink('EB %d I' % i, node[i, 'EB origin'], node[i, 'west'], crossSpeed, crossBack, 1500, 3200)
+            self.addLink('EB %d C' % i, node[i, 'west'], node[i, 'east'], crossSpeed, crossBack, 400, 3200)
+            self.addLink('EB %d O' % i, node[i, 'east'], node[i, 'EB destination'], crossSpeed, crossBack, 1500, 3200)
+            self.addLink('WB %d I' % i, node[i, 'WB origin'], node[i, 'east'], crossSpeed, crossBack, 1500, 3200)
+            self.addLink('WB %d C' % i, node[i, 'east'], node[i, 'west'], crossSpeed, crossBack, 400, 3200)
+            self.addLink('WB %d O' % i, node[i, 'west'], node[i, 'WB destination'], crossSpeed, crossBack, 1500, 3200)
+
+        # links were added freeway first, so the freeway comes first among each merge's incoming links
+        ins = [list() for i in node]
+        outs = [list() for i in node]
+        for ij in self.links:
+            outs[self.links[ij].tail].append(self.links[ij])
+            ins[self.links[ij].head].append(self.links[ij])
+        self.nodes = [None] * len(node)
+        for key, i in node.items():
+            role = key[1].split(' ')[-1]
+            if role == 'origin':
+                self.nodes[i] = nodeModel.OriginNode(ins[i], outs[i])
+            elif role == 'destination':
+                self.nodes[i] = nodeModel.DestinationNode(ins[i], outs[i])
+            elif role == 'diverge':
+                self.nodes[i] = nodeModel.DivergeNode(ins[i], outs[i])
+            elif role == 'meter':
+                self.nodes[i] = nodeModel.RampMeterNode(ins[i], outs[i])
+            elif role == 'merge':
+                self.nodes[i] = nodeModel.MergeNode(ins[i], outs[i], {ins[i][0] : 3, ins[i][1] : 1})
+            elif role == 'west':
+                self.nodes[i] = self.westTerminal(key[0])
+            elif role == 'east':
+                self.nodes[i] = self.eastTerminal(key[0])
+
+    def westTerminal(self, i):
+        """
+        The southbound ramp terminal, phased as the project network's wrx.
+        """
+        ebIn, wbIn, ramp = self.links['EB %d I' % i], self.links['WB %d C' % i], self.links['SB %d XR' % i]
+        ebOut, wbOut, onRamp = self.links['EB %d C' % i], self.links['WB %d O' % i], self.links['SB %d NRU' % i]
+
+        ring00 = nodeModel.Ring([(ebIn, ebOut), (wbIn, onRamp)], None)
+        ring01 = nodeModel.Ring([(wbIn, wbOut), (wbIn, wbOut)], 1.0)
+        barrier0 = nodeModel.Barrier([ring00, ring01], None)
+        ring10 = nodeModel.Ring([(ramp, ebOut), (ramp, ebOut)], 1.0)
+        ring11 = nodeModel.Ring([(ramp, onRamp), (ramp, onRamp)], 1.0)
+        barrier1 = nodeModel.Barrier([ring10, ring11], None)
+        permissivePhases = [(ramp, wbOut), (ebIn, onRamp)]
+        return nodeModel.FullyProtectedIntersectionNode([ebIn, wbIn, ramp], [ebOut, wbOut, onRamp], [barrier0, barrier1], permissivePhases)
+
+    def eastTerminal(self, i):
+        """
+        The northbound ramp terminal, phased as the project network's erx.
+        """
+        ebIn, wbIn, ramp = self.links['EB %d C' % i], self.links['WB %d I' % i], self.links['NB %d XR' % i]
+        ebOut, wbOut, onRamp = self.links['EB %d O' % i], self.links['WB %d C' % i], self.links['NB %d NRU' % i]
+
+        ring00 = nodeModel.Ring([(ebIn, ebOut), (ebIn, ebOut)], 1.0)
+        ring01 = nodeModel.Ring([(ebIn, onRamp), (wbIn, wbOut)], None)
+        barrier0 = nodeModel.Barrier([ring00, ring01], None)
+        ring10 = nodeModel.Ring([(ramp, onRamp), (ramp, onRamp)], 1.0)
+        ring11 = nodeModel.Ring([(ramp, wbOut), (ramp, wbOut)], 1.0)
+        barrier1 = nodeModel.Barrier([ring10, ring11], None)
+        permissivePhases = [(ramp, ebOut), (wbIn, onRamp)]
+        return nodeModel.FullyProtectedIntersectionNode([ebIn, wbIn, ramp], [ebOut, wbOut, onRamp], [barrier0, barrier1], permissivePhases)
+
+    def controllers(self):
+        """
+        The node index of each controller, by name.
+        """
+        controllers = dict()
+        for i in range(self.numInterchanges):
+            controllers['NB ramp %d' % i] = self.node[i, 'NB meter']
+            controllers['SB ramp %d' % i] = self.node[i, 'SB meter']
+            controllers['wrx %d' % i] = self.node[i, 'west']
+            controllers['erx %d' % i] = self.node[i, 'east']
+        return controllers
+
+    def defaultConfig(self):
+        initConfig = getInitConfig(self.timestep)
+        config = dict()
+        for name in self.controllers():
+            if 'ramp' in name:
+                config[name] = self.meterRate * self.timestep / 3600
+            else:
+                config[name] = dict(initConfig[name.split(' ')[0]])
+        return config
+
+    def setConfig(self, config):
+        """
+        Sets the parameters of the controllers named in config: a ramp meter rate in vehicles per timestep, or a
+        ramp terminal's parameter dictionary.
+        """
+        controllers = self.controllers()
+        for name in config:
+            self.nodes[controllers[name]].setParams(config[name])
+
+    def path(self, d, i, j, fromSide=None, toSide=None):
+        """
+        The links from entrance i in direction d (None for the freeway end) to exit j (None for the far freeway
+        end).  Trips entering on a ramp come from the fromSide end ('EB' or 'WB') of cross street i, and trips
+        leaving on a ramp go to the toSide end of cross street j.
+        """
+        route = self.routes[d]
+        path = list()
+        if i is not None:
+            path.append('%s %d I' % (fromSide, i))
+            # trips from the end of the cross street nearer the other direction's ramps cross the overpass
+            if (fromSide == 'EB') == (d == 'NB'):
+                path.append('%s %d C' % (fromSide, i))
+            path += ['%s %d NRU' % (d, i), '%s %d NRD' % (d, i)]
+        n = 0 if i is None else route.index(i) + 1
+        while n < len(route) and route[n] != j:
+            path += ['%s %d U' % (d, route[n]), '%s %d C' % (d, route[n])]
+            n += 1
+        if j is None:
+            path.append('%s D' % d)
+        else:
+            path += ['%s %d U' % (d, j), '%s %d XR' % (d, j)]
+            if (toSide == 'EB') == (d == 'SB'):
+                path.append('%s %d C' % (toSide, j))
+            path.append('%s %d O' % (toSide, j))
+        return tuple(path)
+
+    def setDemand(self, span, freewayVolume, rampVolume, crossVolume, throughShare, rng):
+        """
+        Draws Poisson demand for every OD pair (in vehicles per timestep) and assigns it to the pair's path.
+        """
+        hours = self.timestep / 3600
+        sides = ('EB', 'WB')
+        for d in self.routes:
+            route = self.routes[d]
+            exits = route[:span]
+            self.addOD(d, None, None, None, None, freewayVolume * throughShare * hours, rng)
+            for j in exits:
+                for toSide in sides:
+                    self.addOD(d, None, j, None, toSide, freewayVolume * (1 - throughShare) / (2 * len(exits)) * hours, rng)
+            for n, i in enumerate(route):
+                targets = [(j, toSide) for j in route[n + 1:n + 1 + span] for toSide in sides]
+                if len(targets) < 2 * span:
+                    targets.append((None, None))
+                for fromSide in sides:
+                    for j, toSide in targets:
+                        self.addOD(d, i, j, fromSide, toSide, rampVolume / (2 * len(targets)) * hours, rng)
+        for i in range(self.numInterchanges):
+            for side in sides:
+                od = StochasticOD(self.node[i, side + ' origin'], self.node[i, side + ' destination'], self.timeHorizon, crossVolume * hours, rng)
+                self.assign(od, ('%s %d I' % (side, i), '%s %d C' % (side, i), '%s %d O' % (side, i)))
+
+    def addOD(self, d, i, j, fromSide, toSide, rate, rng):
+        origin = self.node[d, 'origin'] if i is None else self.node[i, fromSide + ' origin']
+        destination = self.node[d, 'destination'] if j is None else self.node[j, toSide + ' destination']
+        self.assign(StochasticOD(origin, destination, self.timeHorizon, rate, rng), self.path(d, i, j, fromSide, toSide))
+
+    def assign(self, od, path):
+        od.paths = [path]
+        self.ODs.append(od)
+        self.pathFlows[path] = list(od.demandRates)
+        self.totalDemand += sum(od.demandRates)
+
+    def initializePathFlows(self):
+        """
+        Every OD pair has a single path, which carries all of its demand.
+        """
+        for od in self.ODs:
+            self.pathFlows[od.paths[0]] = list(od.demandRates)
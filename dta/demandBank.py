@@ -0,0 +1,106 @@
+"""
+Demand banks: pre-drawn demand matrices of the project network for a range of seeds, stored in one
+memory-mapped file so that episode resets read demand instead of drawing it, and parallel workers share the
+same pages read-only.  Build one with python -m dta.demandBank directory firstSeed numSeeds [horizon].
+"""
+import os
+import sys
+import json
+import numpy
+import numpy.random as random
+from numpy.lib.format import open_memmap
+from .networkModel import NetworkModel
+from .volumes import getVolumes
+
+DEMAND_FILE = 'demand.npy'
+SEEDS_FILE = 'seeds.npy'
+INFO_FILE = 'bank.json'
+
+class DemandBankException(Exception):
+    pass
+
+def bankError(message):
+    print(message)
+    raise DemandBankException
+
+def buildDemandBank(directory, seeds, timeHorizon, volumes=None, profile=None, dtype=numpy.uint16, network=None):
+    """
+    Draws the demand of network (by default the project network, NetworkModel) for each seed in seeds, as
+    setDemand draws it with random.RandomState(seed), volumes (by default volumes.getVolumes) and profile, and
+    writes the matrices into directory: demand.npy holds one matrix per seed (OD pairs by timesteps, in dtype,
+    filled in place through a memory map), seeds.npy the seeds, and bank.json the specification hash and time
+    horizon the bank was drawn for.
+    """
+    net = NetworkModel(timeHorizon) if network is None else network
+    volumes = getVolumes(net.timestep) if volumes is None else volumes
+    seeds = numpy.asarray(seeds, dtype=numpy.int64)
+    if len(numpy.unique(seeds)) != len(seeds):
+        bankError("Demand bank seeds must be distinct")
+    limit = numpy.iinfo(dtype).max
+
+    os.makedirs(directory, exist_ok=True)
+    bank = open_memmap(os.path.join(directory, DEMAND_FILE), mode='w+', dtype=dtype,
+                       shape=(len(seeds), len(net.spec['ODs']), timeHorizon))
+    for k, seed in enumerate(seeds):
+        net.setDemand(volumes, random.RandomState(seed), profile)
+        if net.demand.max() > limit:
+            bankError("Demand of seed %d exceeds the largest %s" % (seed, numpy.dtype(dtype).name))
+        bank[k] = net.demand
+    bank.flush()
+    del bank
+    numpy.save(os.path.join(directory, SEEDS_FILE), seeds)
+    with open(os.path.join(directory, INFO_FILE), 'w') as f:
+        json.dump({'spec' : net.spec.get('hash'), 'timeHorizon' : timeHorizon}, f)
+
+class DemandBank:
+    """
+    A demand bank written by buildDemandBank, opened read-only.  The demand matrix is memory-mapped, so
+    opening a bank reads only its seeds, and demand(seed) returns a view of one seed's matrix.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            with open(os.path.join(directory, INFO_FILE)) as f:
+                info = json.load(f)
+            seeds = numpy.load(os.path.join(directory, SEEDS_FILE))
+            self.matrix = numpy.load(os.path.join(directory, DEMAND_FILE), mmap_mode='r')
+        except IOError:
+            bankError("Error reading demand bank %s" % directory)
+        self.spec = info['spec']
+        self.timeHorizon = info['timeHorizon']
+        self.index = {int(seed) : k for k, seed in enumerate(seeds)}
+
+    def __contains__(self, seed):
+        return seed in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def check(self, network):
+        """
+        Raises DemandBankException unless the bank was drawn for network's specification and time horizon (the
+        draws fill each OD pair's row in turn, so demand drawn over a longer horizon is not the same demand).
+        """
+        if self.spec != network.spec.get('hash'):
+            bankError("Demand bank %s was drawn for another network specification" % self.directory)
+        if self.timeHorizon != network.timeHorizon:
+            bankError("Demand bank %s was drawn over %d timesteps, not the network's %d"
+                      % (self.directory, self.timeHorizon, network.timeHorizon))
+
+    def demand(self, seed):
+        """
+        The demand matrix drawn for seed, with one row per OD pair.
+        """
+        return self.matrix[self.index[seed]]
+
+def main():
+    directory = sys.argv[1]
+    firstSeed = int(sys.argv[2])
+    numSeeds = int(sys.argv[3])
+    timeHorizon = int(sys.argv[4]) if len(sys.argv) > 4 else 3600
+    buildDemandBank(directory, range(firstSeed, firstSeed + numSeeds), timeHorizon)
+    print("Wrote demand for seeds %d-%d over %d timesteps to %s" % (firstSeed, firstSeed + numSeeds - 1, timeHorizon, directory))
+
+if __name__ == "__main__":
+    main()
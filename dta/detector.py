@@ -0,0 +1,81 @@
+from copy import copy
+import numpy
+
+class Detector:
+   """
+   A virtual detector on a link.  During network loading it is sampled once per timestep and accumulates the
+   quantities reported by Link.averageSpeed and Link.enteredDuring (plus density), so they can be read at the
+   end of an interval without rescanning the link's counts.  Speed and density are only sampled every period
+   timesteps; entering flow is always counted exactly.
+   """
+
+   def __init__(self, link, period = 1):
+      self.link = link
+      self.period = period
+      self.reset(0)
+
+   def reset(self, t):
+      """
+      Starts a new sampling window at time t.
+      """
+      self.start = t
+      self.end = t
+      self.samples = 0
+      self.speedSum = 0.0
+      self.densitySum = 0.0
+      self.entered = 0
+
+   def sample(self, t):
+      """
+      Records time t; the link's counts must already extend through time t.
+      """
+      link = self.link
+      up = link.upstreamCount(t) - link.upstreamCount(t - 1)
+      self.entered += up
+      if (t - self.start) % self.period == 0:
+         density = link.density(t)
+         if density == 0:
+            self.speedSum += link.freeFlowSpeed
+         else:
+            self.speedSum += (0.5 * up + 0.5 * (link.downstreamCount(t) - link.downstreamCount(t - 1))) / density
+         self.densitySum += density
+         self.samples += 1
+      self.end = t + 1
+
+   def sampleRange(self, r, upstreamTotal, downstreamTotal):
+      """
+      Records every time in the contiguous range r at once, given the link's cumulative counts as arrays indexed
+      by time; equivalent to calling sample(t) for each t in r, for engines which fill the counts in bulk.
+      """
+      t = numpy.arange(r[0], r[-1] + 1)
+      up = upstreamTotal[t]
+      down = downstreamTotal[t]
+      upPrevious = numpy.where(t > 0, upstreamTotal[numpy.maximum(t - 1, 0)], 0.)
+      downPrevious = numpy.where(t > 0, downstreamTotal[numpy.maximum(t - 1, 0)], 0.)
+      self.entered += (up - upPrevious).sum()
+      sampled = (t - self.start) % self.period == 0
+      density = (up[sampled] - down[sampled]) / self.link.length
+      flow = 0.5 * (up - upPrevious)[sampled] + 0.5 * (down - downPrevious)[sampled]
+      with numpy.errstate(divide='ignore', invalid='ignore'):
+         speed = numpy.where(density == 0, self.link.freeFlowSpeed, flow / density)
+      self.speedSum += speed.sum()
+      self.densitySum += density.sum()
+      self.samples += int(sampled.sum())
+      self.end = r[-1] + 1
+
+   def covers(self, timeRange):
+      """
+      Returns True if the current window is exactly the given (contiguous) range of times.
+      """
+      return len(timeRange) > 0 and self.start == timeRange[0] and self.end == timeRange[-1] + 1
+
+   def averageSpeed(self):
+      return self.speedSum / self.samples if self.samples > 0 else self.link.freeFlowSpeed
+
+   def averageDensity(self):
+      return self.densitySum / self.samples if self.samples > 0 else 0.0
+
+   def fork(self, link):
+      detector = copy(self)
+      detector.link = link
+      return detector
@@ -0,0 +1,56 @@
+import numpy
+import numpy.random as random
+from .dta_env import dta_env
+
+class dta_batch_env():
+    """
+    Simulates several days of dta_env side by side in one process, e.g., to evaluate a policy over many
+    demand seeds.  Each scenario has its own demand realization and its own signal and ramp meter
+    configuration, but all share the network topology and are loaded together by a single fast engine
+    whose state has a leading scenario axis.  States, rewards and done flags come back as arrays with one
+    row per scenario, as from dta_vec_env.  demandBank (see dta_env) is shared by all scenarios.
+    """
+
+    def __init__(self, numScenarios, interval, numIntervals=1, warmup=900, detectorPeriod=1, rewardType='throughput', jit=None, demandBank=None):
+        self.numScenarios = numScenarios
+        self.interval = interval
+        self.numIntervals = numIntervals
+        self.envs = [dta_env(interval, numIntervals, warmup, detectorPeriod, rewardType, demandBank=demandBank) for _ in range(numScenarios)]
+        self.action_dim = self.envs[0].action_dim
+        self.state_dim = self.envs[0].state_dim
+        self.warmup = warmup
+
+        # the first scenario's network loads the others along with itself
+        self.net = self.envs[0].net
+        self.net.setEngine('fast', jit, [env.net for env in self.envs[1:]])
+
+    def reset(self, seeds=None):
+        """
+        Starts a new day in every scenario and returns the stacked initial states.  seeds may give one
+        demand seed per scenario (None entries, or no seeds, draw fresh demand).
+        """
+        if seeds is None:
+            seeds = [None] * self.numScenarios
+        for env, seed in zip(self.envs, seeds):
+            env.buildDay(seed)
+        self.net.loadNetwork(range(self.warmup), True)
+        return numpy.array([env.startDay() for env in self.envs])
+
+    def step(self, actions=None):
+        """
+        Applies one action per scenario (a row of actions, or None to keep every configuration), loads the
+        next interval in all scenarios at once, and returns stacked next states, rewards and done flags.
+        """
+        for k, env in enumerate(self.envs):
+            intv = env.startStep(None if actions is None else actions[k])
+        loaded, terminated = self.net.loadNetwork(intv, False)
+        loaded = numpy.atleast_1d(loaded)
+        terminated = numpy.atleast_1d(terminated)
+        states, rewards, dones = zip(*[env.finishStep(intv, loaded[k], terminated[k]) for k, env in enumerate(self.envs)])
+        return numpy.array(states), numpy.array(rewards), numpy.array(dones)
+
+    def random_action(self):
+        """
+        Generate one random action per scenario.
+        """
+        return random.uniform(-1., 1., (self.numScenarios, self.action_dim))
@@ -1,139 +1,218 @@
 from .volumes import getVolumes
 from .initConfig import getInitConfig
-from .networkModel import NetworkModel
+from .networkModel import NetworkModel, CONFIG_KEYS, vectorizeConfig, dictifyConfig
+from .demandBank import DemandBank
+import numpy
 import numpy.random as random
+from copy import copy
+
+# adaptive warmup: loaded in windows of WARMUP_WINDOW timesteps, and steady once the last STEADY_WINDOWS windows
+# agree with the STEADY_WINDOWS before them to within STEADY_TOLERANCE (see steadyState), and on every link to
+# within STEADY_TOLERANCE plus STEADY_SLACK vehicles, so that lightly used links are not held to their noise
+WARMUP_WINDOW = 60
+STEADY_WINDOWS = 3
+STEADY_TOLERANCE = 0.1
+STEADY_SLACK = 5
 
 class dta_env():
     """
     spec for DTA model environment that the RL algorithm will call
     """
 
-    def __init__(self,interval,numIntervals=1,warmup=900):
+    # dimensionality of action and state space, as properties for the RL model
+    action_dim = 20
+    state_dim = 81
+
+    def __init__(self,interval,numIntervals=1,warmup=900,detectorPeriod=1,rewardType='throughput',engine='reference',profile=False,demandBank=None,adaptiveWarmup=False,settle=None,gridlockPenalty=None):
+        """
+        rewardType selects the reward returned by step: 'throughput' scores vehicles terminated against
+        vehicles loaded, relative to the vehicles already in the network; 'tstt' is the interval's total
+        free-flow travel time minus its total system travel time.  engine selects the network loading
+        engine (see Network.setEngine).  If profile is set, step also returns an info dictionary whose
+        'profile' entry holds the interval's loading times by phase (see Network.setProfiling).  demandBank,
+        a DemandBank or the directory of one, supplies the demand of every seed it holds, so reset reads it
+        instead of drawing it; other seeds are drawn as usual.  With adaptiveWarmup, reset stops loading the
+        warmup once the network reaches steady state (see loadWarmup), with warmup as the longest warmup; the
+        warmup length used is kept in warmupUsed, and the episode's intervals follow it.  With settle, reset
+        instead initializes the network analytically through warmup - settle (see
+        NetworkModel.initializeSteadyState) and loads only the last settle timesteps of the warmup.  With
+        gridlockPenalty, step watches for gridlock or spillback (see Network.setGridlockDetection) and, on
+        finding it, stops loading and ends the episode with gridlockPenalty as the step's reward; the cause is
+        kept in net.gridlock.
+        """
         self.interval = interval
         self.numIntervals = numIntervals
         self.vols = getVolumes(1)
-        self.cfg = getInitConfig(1)
+        self.cfg = vectorizeConfig(getInitConfig(1))
         self.timeHorizon = warmup+(interval*numIntervals)
         self.warmup = warmup
+        self.adaptiveWarmup = adaptiveWarmup
+        self.warmupUsed = warmup
+        self.settle = settle
+        self.gridlockPenalty = gridlockPenalty
+        self.rewardType = rewardType
         self.net = NetworkModel(self.timeHorizon)
-
-        # dimensionality of action and state space, as properties for the RL model
-        self.action_dim = 20
-        self.state_dim = 81
-        self.action_mins = self.net.constraints()[0]
-        self.action_maxs = self.net.constraints()[1]
+        self.net.setDetectorPeriod(detectorPeriod)
+        self.net.setEngine(engine)
+        self.profile = profile
+        if profile:
+            self.net.setProfiling()
+        self.demandBank = DemandBank(demandBank) if isinstance(demandBank, str) else demandBank
+        if self.demandBank is not None:
+            self.demandBank.check(self.net)
+
+        self.action_mins, self.action_maxs = self.net.constraintArrays()
         
         self.action_max_increments = {
             'split' : 0.05, #percent
             'barrier' : 10., #timesteps
             'ramp' : 25/3600     #people per timestep
         }
+        # per-dimension increments, ordered as CONFIG_KEYS; barrier lengths at the ramp terminals are not controlled
+        incs = self.action_max_increments
+        fixed = {('wrx', 'barrier 0'), ('wrx', 'barrier 1'), ('erx', 'barrier 0'), ('erx', 'barrier 1')}
+        self.action_increments = numpy.array([0. if (c, p) in fixed else incs['ramp'] if p is None else incs[p.split()[0]]
+                                              for (c, p) in CONFIG_KEYS])
     
     def reset(self,seed=None):
         """
         resets the state of the model to the beginning of the/a day
         """
+        self.buildDay(seed)
+        if self.settle is not None:
+            start = max(self.warmup - self.settle, 0)
+            self.net.initializeSteadyState(start)
+            self.net.loadNetwork(range(start, self.warmup),False)
+            self.warmupUsed = self.warmup
+        elif self.adaptiveWarmup:
+            self.warmupUsed = self.loadWarmup()
+        else:
+            self.net.loadNetwork(range(self.warmup),True)
+            self.warmupUsed = self.warmup
+        return self.startDay()
+
+    def loadWarmup(self):
+        """
+        Loads the warmup in windows of WARMUP_WINDOW timesteps until the network's accumulation and flows are
+        steady (see steadyState), or through the whole warmup.  Returns the length of warmup loaded.
+        """
+        accumulation, inflow, outflow = list(), list(), list()
+        linkFlows, linkVehicles = list(), list()
+        t = 0
+        while t < self.warmup:
+            end = min(t + WARMUP_WINDOW, self.warmup)
+            loaded, terminated = self.net.loadNetwork(range(t, end), t == 0)
+            t = end
+            accumulation.append(self.net.vehiclesInNetwork)
+            inflow.append(loaded)
+            outflow.append(terminated)
+            # the detectors cover the window just loaded
+            detectors = [self.net.detectors[ij] for ij in self.net.links]
+            linkFlows.append([detector.entered for detector in detectors])
+            linkVehicles.append([detector.averageDensity() * detector.link.length for detector in detectors])
+            if steadyState(accumulation, inflow, outflow, linkFlows, linkVehicles):
+                break
+        return t
+
+    def buildDay(self,seed=None):
+        """
+        First part of reset: rebuilds the network with the current configuration and a new demand realization.
+        """
         self.net.reset()
         self.net.setConfig(self.cfg)
+        self.net.setGridlockDetection(enabled=False)
 
-        rng = random.RandomState(seed)
-
-        self.net.setDemand(self.vols,rng)
+        if self.demandBank is not None and seed is not None and seed in self.demandBank:
+            self.net.useDemand(self.demandBank.demand(seed))
+        else:
+            rng = random.RandomState(seed)
+            self.net.setDemand(self.vols,rng)
         self.net.finalizeODs()
         self.net.initializePathFlows()
 
-        self.net.loadNetwork(range(self.warmup),True)
-        self.net.calculateTravelTimes(range(self.warmup))
-        self.curTime = self.warmup
+    def startDay(self):
+        """
+        Last part of reset, once the warmup has been loaded: returns the initial state.
+        """
+        self.net.calculateTravelTimes(range(self.warmupUsed))
+        self.curTime = self.warmupUsed
         self.elapsedIntervals = 0
+        self.net.setGridlockDetection(enabled=self.gridlockPenalty is not None)
 
         # state = (self.elapsedIntervals,self.net.getState(),self.cfg) # fetch state
         state = [self.elapsedIntervals]
-        state.extend(self.net.getState(range(self.warmup)))
-        state.extend(vectorize(self.cfg))
+        state.extend(self.net.getState(range(self.warmupUsed)).tolist())
+        state.extend(self.cfg.tolist())
         return state
 
     
     def step(self, a=None):
         """
         In: what action (signal/ramp parameters) to use next
-        Out: next state, what the reward was from the last state, whether or not the day is over
+        Out: next state, what the reward was from the last state, whether or not the day is over (and, if
+        profiling, an info dictionary)
+        """
+        intv = self.startStep(a)
+        if self.profile:
+            self.net.profile.reset()
+        loaded, terminated = self.net.loadNetwork(intv,False)
+        if self.profile:
+            return self.finishStep(intv, loaded, terminated) + ({'profile' : self.net.profileStats()},)
+        return self.finishStep(intv, loaded, terminated)
+
+    def startStep(self, a=None):
+        """
+        First part of step: applies the action and records the running totals the reward is measured from.
+        Returns the interval to load.
         """
         #process actions
         if a is not None:
-            self.updateConfig(dictify(a))
-            # self.net.setConfig(a)
+            self.updateConfig(a)
 
         intv = range(self.curTime,self.curTime+self.interval)
-        starting = self.net.getTotalVehicles(self.curTime)
-        
-        loaded, terminated = self.net.loadNetwork(intv,False)
+        self.starting = self.net.vehiclesInNetwork
+        self.tstt = self.net.TSTT
+        self.tfft = self.net.TFFT
+        return intv
+
+    def finishStep(self, intv, loaded, terminated):
+        """
+        Last part of step, once intv has been loaded: returns the next state, reward and done flag.
+        """
         self.curTime += self.interval
         self.elapsedIntervals += 1
 
-        # self.net.calculateTravelTimes(intv)
-        # tstt = self.net.calculateTSTT(intv)
-        # tfft = self.net.calculateTFFT(intv)
-        # last_step_reward = tfft - tstt
-        # print(last_step_reward)
-        last_step_reward = (terminated - loaded)/(starting*loaded)
-
-        done = self.elapsedIntervals == self.numIntervals
+        if self.net.gridlock is not None:
+            last_step_reward = self.gridlockPenalty
+            done = True
+        else:
+            if self.rewardType == 'tstt':
+                last_step_reward = (self.net.TFFT - self.tfft) - (self.net.TSTT - self.tstt)
+            else:
+                last_step_reward = (terminated - loaded)/(self.starting*loaded)
+            done = self.elapsedIntervals == self.numIntervals
 
         next_state = [self.elapsedIntervals]
-        next_state.extend(self.net.getState(intv))
-        next_state.extend(vectorize(self.cfg))
+        next_state.extend(self.net.getState(intv).tolist())
+        next_state.extend(self.cfg.tolist())
         # next_state = (self.elapsedIntervals,self.net.getState(),self.cfg) # fetch state
 
         return next_state, last_step_reward, done
 
-    def updateConfig(self,actions):
-
-        deltas = self.getDeltas(actions)
-        
-        self.cfg['nb ramp'] += deltas['nb ramp']
-        self.cfg['sb ramp'] += deltas['sb ramp']
-
-        self.cfg['wx']['split 00'] += deltas['wx']['split 00']
-        self.cfg['wx']['split 01'] += deltas['wx']['split 01']
-        self.cfg['wx']['split 10'] += deltas['wx']['split 10']
-        self.cfg['wx']['split 11'] += deltas['wx']['split 11']
-        self.cfg['wx']['barrier 0'] += deltas['wx']['barrier 0']
-        self.cfg['wx']['barrier 1'] += deltas['wx']['barrier 1']
-
-        self.cfg['ex']['split 00'] += deltas['ex']['split 00']
-        self.cfg['ex']['split 01'] += deltas['ex']['split 01']
-        self.cfg['ex']['split 10'] += deltas['ex']['split 10']
-        self.cfg['ex']['split 11'] += deltas['ex']['split 11']
-        self.cfg['ex']['barrier 0'] += deltas['ex']['barrier 0']
-        self.cfg['ex']['barrier 1'] += deltas['ex']['barrier 1']
-
-        self.cfg['wrx']['split 00'] += deltas['wrx']['split 00']
-
-        self.cfg['erx']['split 01'] += deltas['erx']['split 01']
-
-        for key in self.cfg['wx']:
-            self.cfg['wx'][key] = max(self.action_mins['wx'][key],
-                                    min(self.action_maxs['wx'][key],self.cfg['wx'][key]))
-        for key in self.cfg['ex']:
-            self.cfg['ex'][key] = max(self.action_mins['ex'][key],
-                                    min(self.action_maxs['ex'][key],self.cfg['ex'][key]))
-        for key in self.cfg['erx']:
-            self.cfg['erx'][key] = max(self.action_mins['erx'][key],
-                                    min(self.action_maxs['erx'][key],self.cfg['erx'][key]))
-
-        for key in self.cfg['wrx']:
-            self.cfg['wrx'][key] = max(self.action_mins['wrx'][key],
-                                    min(self.action_maxs['wrx'][key],self.cfg['wrx'][key]))
-
-        self.cfg['nb ramp'] = max(self.action_mins['nb ramp'],
-                                min(self.action_maxs['nb ramp'],
-                                self.cfg['nb ramp']))
-    
-        self.cfg['sb ramp'] = max(self.action_mins['sb ramp'],
-                                min(self.action_maxs['sb ramp'],
-                                self.cfg['sb ramp']))
-        
+    def clone(self):
+        """
+        Returns an independent copy of the environment in its current state, so that a lookahead
+        controller can try candidate actions for an interval without replaying from reset.
+        """
+        env = copy(self)
+        env.cfg = self.cfg.copy()
+        env.net = self.net.fork()
+        if self.profile:
+            env.net.setProfiling()
+        return env
+
+    def updateConfig(self,action):
+        self.cfg = applyActions(self.cfg, action, self.action_increments, self.action_mins, self.action_maxs)
         self.net.setConfig(self.cfg)
 
 
@@ -141,144 +220,49 @@ class dta_env():
         """
         Generate a random action, to be used before RL model training has stabilized.
         """
-        rng = random.RandomState()
-
-        action = {
-            'nb ramp' : random.uniform(-1.,1.),
-            'sb ramp' : random.uniform(-1.,1.),
-
-            'wx' : {
-                'split 00' : random.uniform(-1.,1.),
-                'split 01' : random.uniform(-1.,1.),
-                'split 10' : random.uniform(-1.,1.),
-                'split 11' : random.uniform(-1.,1.),
-                'barrier 0': random.uniform(-1.,1.),
-                'barrier 1': random.uniform(-1.,1.)
-            },
-
-            'ex' : {
-                'split 00' : random.uniform(-1.,1.),
-                'split 01' : random.uniform(-1.,1.),
-                'split 10' : random.uniform(-1.,1.),
-                'split 11' : random.uniform(-1.,1.),
-                'barrier 0': random.uniform(-1.,1.),
-                'barrier 1': random.uniform(-1.,1.)
-            },
-            
-            'wrx' : {
-                'split 00' : random.uniform(-1.,1.),
-                'barrier 0': random.uniform(-1.,1.),
-                'barrier 1': random.uniform(-1.,1.)
-            },
-
-            'erx' : {
-                'split 01' : random.uniform(-1.,1.),
-                'barrier 0': random.uniform(-1.,1.),
-                'barrier 1': random.uniform(-1.,1.)
-            }
-        }
-
-
-        return vectorize(action)
-
-
-
-    def getDeltas(self,action):
-        deltas = dict()
-        incs = self.action_max_increments
-        
-        deltas['wx'] = {}
-
-        deltas['wx']['split 00'] = action['wx']['split 00'] * incs['split']
-        deltas['wx']['split 01'] = action['wx']['split 01'] * incs['split']
-        deltas['wx']['split 10'] = action['wx']['split 10'] * incs['split']
-        deltas['wx']['split 11'] = action['wx']['split 11'] * incs['split']
-
-        deltas['ex'] = {}
-        
-        deltas['ex']['split 00'] = action['ex']['split 00'] * incs['split']
-        deltas['ex']['split 01'] = action['ex']['split 01'] * incs['split']
-        deltas['ex']['split 10'] = action['ex']['split 10'] * incs['split']
-        deltas['ex']['split 11'] = action['ex']['split 11'] * incs['split']
+        return random.uniform(-1.,1.,self.action_dim)
 
-        deltas['wrx'] = {}
-        deltas['erx'] = {}
 
-        deltas['wrx']['split 00'] = action['wrx']['split 00'] * incs['split']
-        deltas['erx']['split 01'] = action['erx']['split 01'] * incs['split']
-
-        deltas['wx']['barrier 0'] = action['wx']['barrier 0'] * incs['barrier']
-        deltas['wx']['barrier 1'] = action['wx']['barrier 1'] * incs['barrier']
-        deltas['ex']['barrier 0'] = action['ex']['barrier 0'] * incs['barrier']
-        deltas['ex']['barrier 1'] = action['ex']['barrier 1'] * incs['barrier']
-
-        deltas['nb ramp'] = action['nb ramp'] * incs['ramp']
-        deltas['sb ramp'] = action['sb ramp'] * incs['ramp']
-
-        return deltas
+def steadyState(accumulation, inflow, outflow, linkFlows=None, linkVehicles=None, windows=STEADY_WINDOWS, tolerance=STEADY_TOLERANCE, slack=STEADY_SLACK):
+    """
+    Steady-state test over lists with one entry per loading window: the vehicles in the network at the end of
+    the window, and the vehicles loaded and terminated during it.  The network is steady once the mean
+    accumulation over the last windows windows is within tolerance of its mean over the windows before them,
+    and the vehicles terminated over all 2 * windows windows are within tolerance of the vehicles loaded (so
+    that the network is neither filling nor draining).  If given, linkFlows and linkVehicles hold one list per
+    window of each link's entering vehicles and average vehicles on it, and each link's means must agree the
+    same way, to within tolerance plus slack vehicles (so a queue growing on one link while others drain is
+    not taken for steady).
+    """
+    if len(accumulation) < 2 * windows:
+        return False
+    recent = sum(accumulation[-windows:]) / windows
+    earlier = sum(accumulation[-2 * windows:-windows]) / windows
+    loaded = sum(inflow[-2 * windows:])
+    if recent <= 0 or loaded <= 0:
+        return False
+    if abs(recent - earlier) > tolerance * recent or abs(loaded - sum(outflow[-2 * windows:])) > tolerance * loaded:
+        return False
+    for series in (linkFlows, linkVehicles):
+        if series is not None:
+            series = numpy.asarray(series[-2 * windows:], dtype=float)
+            recent = series[windows:].mean(axis=0)
+            earlier = series[:windows].mean(axis=0)
+            if numpy.any(numpy.abs(recent - earlier) > tolerance * recent + slack):
+                return False
+    return True
+
+def applyActions(cfg, action, increments, mins, maxs):
+    """
+    Scales actions in [-1,1] by the per-dimension increments, adds them to the configuration and clips
+    the result to its bounds.  All arguments are arrays ordered as CONFIG_KEYS; cfg and action may also
+    be stacked with one row per environment.
+    """
+    return numpy.clip(cfg + numpy.asarray(action, dtype=float) * increments, mins, maxs)
 
 def vectorize(action:dict):
-    vector = list()
-    vector.append(action['nb ramp'])
-    vector.append(action['sb ramp'])
-    
-    vector.append(action['wx']['split 00'])
-    vector.append(action['wx']['split 01'])
-    vector.append(action['wx']['split 10'])
-    vector.append(action['wx']['split 11'])
-    vector.append(action['wx']['barrier 0'])
-    vector.append(action['wx']['barrier 1'])
-    
-    vector.append(action['ex']['split 00'])
-    vector.append(action['ex']['split 01'])
-    vector.append(action['ex']['split 10'])
-    vector.append(action['ex']['split 11'])
-    vector.append(action['ex']['barrier 0'])
-    vector.append(action['ex']['barrier 1'])
-
-    vector.append(action['wrx']['split 00'])
-    vector.append(action['wrx']['barrier 0'])
-    vector.append(action['wrx']['barrier 1'])
-    
-    vector.append(action['erx']['split 01'])
-    vector.append(action['erx']['barrier 0'])
-    vector.append(action['erx']['barrier 1'])
-    return vector
+    return list(vectorizeConfig(action))
 
 
 def dictify(vector):
-    action = {
-        'nb ramp' : vector[0],
-        'sb ramp' : vector[1],
-
-        'wx' : {
-            'split 00' : vector[2],
-            'split 01' : vector[3],
-            'split 10' : vector[4],
-            'split 11' : vector[5],
-            'barrier 0': vector[6],
-            'barrier 1': vector[7]
-        },
-
-        'ex' : {
-            'split 00' : vector[8],
-            'split 01' : vector[9],
-            'split 10' : vector[10],
-            'split 11' : vector[11],
-            'barrier 0': vector[12],
-            'barrier 1': vector[13]
-        },
-        
-        'wrx' : {
-            'split 00' : vector[14],
-            'barrier 0': vector[15],
-            'barrier 1': vector[16]
-        },
-
-        'erx' : {
-            'split 01' : vector[17],
-            'barrier 0': vector[18],
-            'barrier 1': vector[19]
-        }
-    }
-    return action
\ No newline at end of file
+    return dictifyConfig(vector)
\ No newline at end of file
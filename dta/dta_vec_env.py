@@ -0,0 +1,173 @@
+from multiprocessing import Process, Pipe, RawArray
+import numpy
+import numpy.random as random
+from .dta_env import dta_env
+from . import utils
+
+RESET = b'r'
+STEP = b's'
+CLOSE = b'c'
+DONE = b'd'
+
+class SharedBuffers:
+    """
+    Preallocated shared-memory arrays through which dta_vec_env and its workers exchange seeds, actions,
+    states, rewards and done flags.  Row i of each array is the slot for worker i.  The raw buffers are
+    created once in the parent and inherited by the workers, so nothing is serialized when stepping.
+    """
+
+    def __init__(self, numEnvs, stateDim, actionDim):
+        self.numEnvs = numEnvs
+        self.stateDim = stateDim
+        self.actionDim = actionDim
+        self.raw = {
+            'seeds' : RawArray('q', numEnvs),
+            'actions' : RawArray('d', numEnvs * actionDim),
+            'hasAction' : RawArray('b', numEnvs),
+            'states' : RawArray('d', numEnvs * stateDim),
+            'rewards' : RawArray('d', numEnvs),
+            'dones' : RawArray('b', numEnvs)
+        }
+        self.attach()
+
+    def attach(self):
+        """
+        (Re)creates the NumPy views on the raw buffers; called again in each worker after it starts.
+        """
+        self.seeds = numpy.frombuffer(self.raw['seeds'], dtype=numpy.int64)
+        self.actions = numpy.frombuffer(self.raw['actions'], dtype=numpy.float64).reshape(self.numEnvs, self.actionDim)
+        self.hasAction = numpy.frombuffer(self.raw['hasAction'], dtype=numpy.int8)
+        self.states = numpy.frombuffer(self.raw['states'], dtype=numpy.float64).reshape(self.numEnvs, self.stateDim)
+        self.rewards = numpy.frombuffer(self.raw['rewards'], dtype=numpy.float64)
+        self.dones = numpy.frombuffer(self.raw['dones'], dtype=numpy.int8)
+
+    def __getstate__(self):
+        return {'numEnvs' : self.numEnvs, 'stateDim' : self.stateDim, 'actionDim' : self.actionDim, 'raw' : self.raw}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.attach()
+
+def worker(remote, parentRemote, envArgs, seedSequence, buffers, i):
+    """
+    Runs one dta_env in a worker process.  Commands arrive as single bytes over the pipe; all data is
+    read from and written to slot i of the shared buffers.
+    """
+    parentRemote.close()
+    env = dta_env(**envArgs)
+    rng = random.default_rng(seedSequence)
+    try:
+        while True:
+            cmd = remote.recv_bytes()
+            if cmd == RESET:
+                seed = int(buffers.seeds[i])
+                if seed < 0:
+                    seed = int(rng.integers(2**31 - 1))
+                buffers.states[i] = env.reset(seed)
+            elif cmd == STEP:
+                action = buffers.actions[i].copy() if buffers.hasAction[i] else None
+                state, reward, done = env.step(action)
+                buffers.states[i] = state
+                buffers.rewards[i] = reward
+                buffers.dones[i] = done
+            elif cmd == CLOSE:
+                break
+            remote.send_bytes(DONE)
+    finally:
+        remote.close()
+
+class dta_vec_env():
+    """
+    Runs several dta_env instances in worker processes and steps them together.  Observations and
+    rewards come back stacked into arrays with one row per environment.  All workers share the same
+    interval and episode length, so they finish their episodes together and are reset together.
+    demandBank, the directory of a DemandBank, supplies the demand of the seeds it holds to every worker.
+    Any other keyword arguments (engine, rewardType, detectorPeriod, settle and so on) are passed on to
+    every worker's dta_env, except profile, whose info dictionaries would not come back from the workers.
+    With gridlockPenalty, a worker's episode can end early, so reset once any done flag is set.
+    """
+
+    def __init__(self, numEnvs, interval, numIntervals=1, warmup=900, seed=None, demandBank=None, **envKwargs):
+        if envKwargs.get('profile'):
+            print("Profiling is not supported in worker processes; profile a dta_env directly.")
+            raise utils.NotYetAttemptedException
+        self.numEnvs = numEnvs
+        self.interval = interval
+        self.numIntervals = numIntervals
+        self.action_dim = dta_env.action_dim
+        self.state_dim = dta_env.state_dim
+        # a demand bank is passed as its directory, so each worker maps the same file read-only
+        envArgs = dict(envKwargs, interval=interval, numIntervals=numIntervals, warmup=warmup, demandBank=demandBank)
+
+        self.buffers = SharedBuffers(numEnvs, self.state_dim, self.action_dim)
+
+        # each worker draws its episode seeds from its own stream, so runs are reproducible given seed
+        seedSequences = random.SeedSequence(seed).spawn(numEnvs)
+
+        self.remotes, workerRemotes = zip(*[Pipe() for _ in range(numEnvs)])
+        self.processes = list()
+        for i in range(numEnvs):
+            process = Process(target=worker, args=(workerRemotes[i], self.remotes[i], envArgs, seedSequences[i], self.buffers, i),
+                              daemon=True)
+            process.start()
+            workerRemotes[i].close()
+            self.processes.append(process)
+
+        self.waiting = False
+        self.closed = False
+
+    def send(self, cmd):
+        for remote in self.remotes:
+            remote.send_bytes(cmd)
+
+    def wait(self):
+        for remote in self.remotes:
+            remote.recv_bytes()
+
+    def reset(self, seeds=None):
+        """
+        Resets every environment and returns the stacked initial states.  seeds may give one demand seed
+        per environment; otherwise each worker draws the next seed from its own stream.
+        """
+        if seeds is None:
+            self.buffers.seeds[:] = -1
+        else:
+            self.buffers.seeds[:] = [-1 if seed is None else seed for seed in seeds]
+        self.send(RESET)
+        self.wait()
+        return self.buffers.states.copy()
+
+    def step_async(self, actions=None):
+        """
+        Sends one action per environment (or None to keep the current configuration) and returns
+        immediately, so the caller can do other work while the workers simulate the interval.
+        """
+        if actions is None:
+            self.buffers.hasAction[:] = 0
+        else:
+            self.buffers.actions[:] = actions
+            self.buffers.hasAction[:] = 1
+        self.send(STEP)
+        self.waiting = True
+
+    def step_wait(self):
+        """
+        Waits for the steps sent by step_async and returns stacked next states, rewards and done flags.
+        """
+        self.wait()
+        self.waiting = False
+        return self.buffers.states.copy(), self.buffers.rewards.copy(), self.buffers.dones.astype(bool)
+
+    def step(self, actions=None):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self.step_wait()
+        self.send(CLOSE)
+        for process in self.processes:
+            process.join()
+        self.closed = True
@@ -0,0 +1,208 @@
+"""
+Replication experiments comparing scenarios (e.g. signal or ramp meter settings) with common random numbers:
+every scenario is simulated with the same demand seeds, so differences between scenarios are estimated from
+paired replications, and an optional control variate with a known mean (such as the ramp travel time of the
+queueing approximation used by oldProject) further reduces their variance.  Replications run in a process
+pool, in batches, until every confidence interval is narrower than a target or a replication limit is
+reached.  Run as python -m dta.experiment [halfWidth [maxReplications]] for the ramp meter study of
+oldProject.
+"""
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+import scipy.stats
+from .network import Network
+from .dta_env import dta_env
+from .replication import replicate, replicationSeeds
+
+ALPHA = 0.05
+MIN_REPLICATIONS = 10
+MAX_REPLICATIONS = 200
+BATCH = 10
+
+class RampMeterRun:
+    """
+    One replication of the ramp meter network (Network(vehsPerTimestep, seed)): returns the total system
+    travel time ('tstt') and total ramp travel time ('trtt') over times start through end - 1.
+    """
+
+    def __init__(self, vehsPerTimestep, freeVol=3000, rampVol=600, start=900, end=2700, engine='fast'):
+        self.vehsPerTimestep = vehsPerTimestep
+        self.freeVol = freeVol
+        self.rampVol = rampVol
+        self.start = start
+        self.end = end
+        self.engine = engine
+
+    def __call__(self, seed):
+        net = Network(self.vehsPerTimestep, seed, self.freeVol, self.rampVol)
+        net.initializePathFlows()
+        net.setEngine(self.engine)
+        net.loadNetwork()
+        return {'tstt' : net.calculateTSTT(range(self.start, self.end)), 'trtt' : net.rampTravelTime(self.start, self.end)}
+
+    def rampTravelTimeMean(self, rampFreeFlowTime=80):
+        """
+        The expected total ramp travel time, treating the meter as an M/D/1 queue (as oldProject does): arrivals at
+        rampVol per hour, one departure every 1 / vehsPerTimestep seconds, plus the ramp's free-flow time.
+        """
+        arrivalRate = self.rampVol / 3600
+        serviceTime = 1 / self.vehsPerTimestep
+        rho = arrivalRate * serviceTime
+        waitInQueue = rho / (2 * arrivalRate * (1 - rho))
+        return (waitInQueue + serviceTime + rampFreeFlowTime) * self.rampVol * (self.end - self.start) / 3600
+
+class EnvRun:
+    """
+    One day of dta_env with a fixed configuration (a vector as from vectorizeConfig; by default the initial
+    configuration): returns the summed step rewards ('reward'), total system travel time ('tstt') and vehicles
+    terminated ('throughput') after the warmup.
+    """
+
+    def __init__(self, config=None, interval=300, numIntervals=12, warmup=900, rewardType='throughput', engine='fast'):
+        self.config = config
+        self.envArgs = {'interval' : interval, 'numIntervals' : numIntervals, 'warmup' : warmup,
+                        'rewardType' : rewardType, 'engine' : engine}
+
+    def __call__(self, seed):
+        env = dta_env(**self.envArgs)
+        if self.config is not None:
+            env.cfg = numpy.array(self.config, dtype=float)
+        env.reset(seed)
+        tstt = env.net.TSTT
+        terminated = env.net.totalTerminated
+        reward = 0.0
+        done = False
+        while not done:
+            state, stepReward, done = env.step()[:3]
+            reward += stepReward
+        return {'reward' : reward, 'tstt' : env.net.TSTT - tstt, 'throughput' : env.net.totalTerminated - terminated}
+
+def confidenceInterval(x, alpha=ALPHA):
+    """
+    The mean of the sample x and the half-width of its two-sided 1 - alpha confidence interval.
+    """
+    x = numpy.asarray(x, dtype=float)
+    n = len(x)
+    return x.mean(), scipy.stats.t.ppf(1 - alpha / 2, n - 1) * x.std(ddof=1) / math.sqrt(n)
+
+def controlVariate(x, y, mu, alpha=ALPHA):
+    """
+    The control variate estimate of the mean of x, using the paired sample y of a control whose mean is mu: the
+    mean of x - lambda (y - mu), with lambda = Cov(x, y) / Var(y) estimated from the sample.  Returns the
+    estimate, the half-width of its confidence interval (with n - 2 degrees of freedom, since lambda is
+    estimated) and lambda.
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    n = len(x)
+    varY = y.var(ddof=1)
+    lam = numpy.cov(x, y)[0, 1] / varY if varY > 0 else 0.0
+    w = x - lam * (y - mu)
+    # the variance of the controlled mean, inflated for the estimated lambda
+    variance = w.var(ddof=2) * (1 / n + (y.mean() - mu) ** 2 / ((n - 1) * varY)) if varY > 0 else w.var(ddof=1) / n
+    return w.mean(), scipy.stats.t.ppf(1 - alpha / 2, n - 2) * math.sqrt(variance), lam
+
+def estimate(x, y=None, mu=None, alpha=ALPHA):
+    """
+    A dictionary with the 'mean' and 'halfWidth' of x, controlled by y with mean mu if both are given (adding the
+    control's coefficient 'lambda'), and the number of 'replications'.
+    """
+    if y is None or mu is None:
+        mean, halfWidth = confidenceInterval(x, alpha)
+        return {'mean' : float(mean), 'halfWidth' : float(halfWidth), 'replications' : len(x)}
+    mean, halfWidth, lam = controlVariate(x, y, mu, alpha)
+    return {'mean' : float(mean), 'halfWidth' : float(halfWidth), 'lambda' : float(lam), 'replications' : len(x)}
+
+def runExperiment(scenarios, measure, baseline=None, control=None, controlMeans=None, halfWidth=None, relative=False,
+                  alpha=ALPHA, minReplications=MIN_REPLICATIONS, maxReplications=MAX_REPLICATIONS, batch=BATCH,
+                  seed=1883, workers=None):
+    """
+    Runs replications of each scenario, a dictionary of callables that simulate one replication for a demand seed
+    and return a dictionary of measures (e.g. RampMeterRun or EnvRun; they must be picklable), with common
+    random numbers: replication j of every scenario uses the j-th seed drawn from seed.
+
+    Estimates the mean of measure for every scenario and, if baseline names one of them, the mean difference
+    between each other scenario and the baseline from the paired replications.  If control names a measure
+    and controlMeans gives its known mean for some scenarios, those scenarios' means (and differences between
+    two such scenarios) are estimated with the control variate.
+
+    Replications run in batches of batch per scenario in a pool of workers processes, from minReplications
+    until every estimate of interest (the differences if there is a baseline, else the means) has a confidence
+    interval half-width of at most halfWidth (relative to the magnitude of its mean if relative), or until
+    maxReplications.  With no halfWidth, exactly minReplications are run.
+
+    Returns a dictionary with the 'seeds' used, the 'samples' of each scenario (structured arrays with one row
+    per replication, see replication.results), the 'means' and 'differences' estimates by scenario (see estimate), and whether the
+    target was 'converged'.
+    """
+    controlMeans = dict() if controlMeans is None else controlMeans
+    if halfWidth is None:
+        maxReplications = minReplications
+    seeds = replicationSeeds(maxReplications, seed)
+    samples = dict()
+
+    def estimates():
+        means = dict()
+        differences = dict()
+        for name in scenarios:
+            x = samples[name][measure]
+            y = samples[name][control] if control is not None else None
+            means[name] = estimate(x, y, controlMeans.get(name), alpha)
+        if baseline is not None:
+            base = samples[baseline]
+            for name in scenarios:
+                if name == baseline:
+                    continue
+                x = samples[name][measure] - base[measure]
+                y = samples[name][control] - base[control] if control is not None else None
+                mu = None
+                if name in controlMeans and baseline in controlMeans:
+                    mu = controlMeans[name] - controlMeans[baseline]
+                differences[name] = estimate(x, y, mu, alpha)
+        return means, differences
+
+    def narrow(results):
+        return all(result['halfWidth'] <= halfWidth * (abs(result['mean']) if relative else 1) for result in results.values())
+
+    n = 0
+    converged = False
+    with ProcessPoolExecutor(workers) as pool:
+        while n < maxReplications:
+            count = min(maxReplications, max(minReplications, n + batch)) - n
+            for name in scenarios:
+                rows = replicate(scenarios[name], seeds[n:n + count], workers, pool=pool)
+                samples[name] = rows if name not in samples else numpy.concatenate([samples[name], rows])
+            n += count
+            means, differences = estimates()
+            if halfWidth is not None and narrow(differences if baseline is not None else means):
+                converged = True
+                break
+    return {'seeds' : seeds[:n], 'samples' : samples, 'means' : means, 'differences' : differences, 'converged' : converged}
+
+def main():
+    halfWidth = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    maxReplications = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_REPLICATIONS
+
+    # no meter (one vehicle every 1e-15 seconds), and one vehicle every 2.5 to 5.5 seconds
+    scenarios = {'none' : RampMeterRun(1 / 0.5e-15)}
+    controlMeans = dict()
+    for i in range(5, 12):
+        name = '%.1f' % (0.5 * i)
+        scenarios[name] = RampMeterRun(1 / (0.5 * i))
+        controlMeans[name] = scenarios[name].rampTravelTimeMean()
+    result = runExperiment(scenarios, 'tstt', 'none', 'trtt', controlMeans, halfWidth, maxReplications=maxReplications)
+
+    print("Meter headway,Mean TSTT,TSTT CI,Difference from no meter,Difference CI,Replications")
+    for name in scenarios:
+        mean = result['means'][name]
+        difference = result['differences'].get(name)
+        print("%s,%.1f,%.1f,%s,%s,%d" % (name, mean['mean'], mean['halfWidth'],
+              '--' if difference is None else '%.1f' % difference['mean'],
+              '--' if difference is None else '%.1f' % difference['halfWidth'], mean['replications']))
+    if halfWidth is not None and not result['converged']:
+        print("Confidence intervals did not narrow to %g within %d replications" % (halfWidth, maxReplications))
+
+if __name__ == "__main__":
+    main()
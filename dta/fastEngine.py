@@ -0,0 +1,624 @@
+import numpy
+from dta import linkModel
+from dta import nodeModel
+from dta import kernels
+
+# link model codes
+PQ = 0
+SQ = 1
+CTM = 2
+LTM = 3
+
+# node model codes
+ORIGIN = 0
+DESTINATION = 1
+SERIES = 2
+METER = 3
+DIVERGE = 4
+MERGE = 5
+SIGNAL = 6
+
+class FastEngine:
+   """
+   An alternative network loading engine for a Network.  Instead of Link/Node/Cell objects and dictionaries of
+   path counts, it compiles the network into flat arrays and runs the loading loop over those:
+
+      links -------------- parameter arrays indexed by link (in the order of network.links), a model code per link,
+                           and the cells of all cell transmission model links in one array
+      slots -------------- one slot per (path, link) pair over all paths carrying flow; the slots of each link are
+                           contiguous, from slotStart[l] to slotStart[l+1]
+      up, down ----------- cumulative counts by scenario, time and slot
+      upTotal, downTotal - cumulative counts by scenario, link and time, shared with the Link objects so that
+                           upstreamCount, downstreamCount and everything built on them keep working
+      nodes -------------- a model code, incoming and outgoing link indices, and for each incoming slot the
+                           position of the path's next link among the node's outgoing links
+
+   The state carries a leading scenario axis.  Usually there is one scenario, the engine's own network, but
+   several networks with the same topology (e.g., with different demand realizations or signal settings) can be
+   loaded together as scenarios: loading the first one loads them all, each step advancing every scenario.  Each
+   scenario network gets its own link totals, detectors, running totals and ramp meter flows, as if loaded alone.
+
+   It reproduces the reference engine in Network.loadNetwork step by step (including when sending flows are
+   recomputed and how getEntryTime/getFlowComposition pick path compositions), up to floating point summation
+   order; dta.conformance checks this.  Signal and ramp meter timing is still read from the Node objects, so
+   setConfig works unchanged.  Path-disaggregated counts only live here: the links' upstreamPathCount and
+   downstreamPathCount are left empty while the engine is in use.
+   """
+
+   def __init__(self, network, tolerance = 0.01, jit = None, scenarios = None, cutLinks = None):
+      """
+      jit chooses between the NumPy methods below and the loop kernels in dta.kernels, compiled by Numba; by
+      default the kernels are used whenever Numba is installed.  scenarios lists further networks to load along
+      with network; their own engines should be left unset.
+
+      cutLinks lists IDs of links whose inflow is held back each timestep until every node has moved flow, so
+      the node at their downstream end always sees them as they were at the start of the timestep, wherever
+      the two ends come in the node order.  This is how dta.partition loads subnetworks side by side; with
+      cut links the results are no longer those of the reference engine, though they differ only in the
+      timestep at which vehicles crossing a cut link become available downstream.
+      """
+      self.network = network
+      self.scenarios = [network] + list(scenarios if scenarios is not None else [])
+      self.tolerance = tolerance
+      self.jit = kernels.HAVE_NUMBA if jit is None else jit
+      self.cutLinks = list(cutLinks if cutLinks is not None else [])
+
+   def compile(self):
+      """
+      Builds the link, slot, node and demand tables from the current network, links and path flows.
+      """
+      net = self.network
+      self.linkIDs = list(net.links)
+      links = [net.links[ij] for ij in self.linkIDs]
+      self.numLinks = len(links)
+      self.linkIndex = {link : l for l, link in enumerate(links)}
+      L = self.numLinks
+      for scenario in self.scenarios:
+         if list(scenario.links) != self.linkIDs or len(scenario.nodes) != len(net.nodes):
+            print("Scenario networks must share the engine network's topology.")
+            raise linkModel.NotYetAttemptedException
+
+      # link parameters
+      self.kind = numpy.zeros(L, dtype=int)
+      self.capacity = numpy.zeros(L)
+      self.upstreamCapacity = numpy.zeros(L)
+      self.maxVehicles = numpy.zeros(L)
+      self.length = numpy.zeros(L)
+      self.freeFlowSpeed = numpy.zeros(L)
+      self.freeFlowTime = numpy.zeros(L, dtype=int)
+      self.backwardWaveTime = numpy.zeros(L, dtype=int)
+      self.firstCell = -numpy.ones(L, dtype=int)
+      self.lastCell = -numpy.ones(L, dtype=int)
+      cellCapacity, cellMaxVehicles, cellDelta, pairFrom, pairTo = [], [], [], [], []
+      for l, link in enumerate(links):
+         if isinstance(link, linkModel.CellTransmissionModelLink): self.kind[l] = CTM
+         elif isinstance(link, linkModel.PointQueueLink): self.kind[l] = PQ
+         elif isinstance(link, linkModel.SpatialQueueLink): self.kind[l] = SQ
+         elif isinstance(link, linkModel.LinkTransmissionModelLink): self.kind[l] = LTM
+         else:
+            print("Link model %s is not supported by the fast engine." % type(link).__name__)
+            raise linkModel.NotYetAttemptedException
+         self.capacity[l] = link.capacity
+         self.upstreamCapacity[l] = getattr(link, 'upstreamCapacity', link.capacity)
+         self.maxVehicles[l] = link.maxVehicles
+         self.length[l] = link.length
+         self.freeFlowSpeed[l] = link.freeFlowSpeed
+         self.freeFlowTime[l] = link.freeFlowTime
+         self.backwardWaveTime[l] = link.backwardWaveTime
+         if self.kind[l] == CTM:
+            self.firstCell[l] = len(cellCapacity)
+            for c, cell in enumerate(link.cells):
+               if c > 0:
+                  pairFrom.append(len(cellCapacity) - 1)
+                  pairTo.append(len(cellCapacity))
+               cellCapacity.append(cell.capacity)
+               cellMaxVehicles.append(cell.maxVehicles)
+               cellDelta.append(cell.delta)
+            self.lastCell[l] = len(cellCapacity) - 1
+      self.cellCapacity = numpy.array(cellCapacity)
+      self.cellMaxVehicles = numpy.array(cellMaxVehicles)
+      self.cellDelta = numpy.array(cellDelta)
+      self.pairFrom = numpy.array(pairFrom, dtype=int)
+      self.pairTo = numpy.array(pairTo, dtype=int)
+      self.ctmLinks = numpy.flatnonzero(self.kind == CTM)
+      self.cut = numpy.zeros(L, dtype=bool)
+      for ij in self.cutLinks:
+         self.cut[self.linkIndex[net.links[ij]]] = True
+      self.cutIndices = numpy.flatnonzero(self.cut)
+
+      # slots for every (path, link) pair of the paths carrying flow in any scenario
+      self.paths = list()
+      for scenario in self.scenarios:
+         for path in scenario.pathFlows:
+            if not hasattr(scenario.pathFlows[path], '__len__'):
+               print("Streamed demand is only loaded by the reference engine.")
+               raise linkModel.NotYetAttemptedException
+            if path not in self.paths and any(flow > 0 for flow in scenario.pathFlows[path]):
+               self.paths.append(path)
+      linkSlots = [list() for l in range(L)]
+      for p, path in enumerate(self.paths):
+         for j, ij in enumerate(path):
+            linkSlots[self.linkIndex[net.links[ij]]].append((p, j))
+      self.slotStart = numpy.zeros(L + 1, dtype=int)
+      slotOf = dict()
+      for l in range(L):
+         for pj in linkSlots[l]:
+            slotOf[pj] = len(slotOf)
+         self.slotStart[l + 1] = len(slotOf)
+      self.numSlots = len(slotOf)
+      self.slotIndex = slotOf
+      self.nextSlot = -numpy.ones(self.numSlots, dtype=int)
+      self.outLocal = -numpy.ones(self.numSlots, dtype=int)
+      for (p, j), s in slotOf.items():
+         if j + 1 < len(self.paths[p]):
+            self.nextSlot[s] = slotOf[(p, j + 1)]
+      self.firstSlot = numpy.array([slotOf[(p, 0)] for p in range(len(self.paths))], dtype=int)
+      self.pathFreeFlowTime = numpy.array([sum(net.links[ij].freeFlowTime for ij in path) for path in self.paths], dtype=float)
+      self.demand = numpy.zeros((len(self.scenarios), len(self.paths), net.timeHorizon))
+      for k, scenario in enumerate(self.scenarios):
+         for p, path in enumerate(self.paths):
+            if path in scenario.pathFlows:
+               flows = scenario.pathFlows[path][:net.timeHorizon]
+               self.demand[k, p, :len(flows)] = flows
+
+      # nodes
+      self.nodeKind = list()
+      self.nodeIn = list()
+      self.nodeOut = list()
+      self.priorities = list()
+      for i, node in enumerate(net.nodes):
+         ins = numpy.array([self.linkIndex[link] for link in node.upstreamLinks], dtype=int)
+         outs = numpy.array([self.linkIndex[link] for link in node.downstreamLinks], dtype=int)
+         if isinstance(node, nodeModel.OriginNode): kind = ORIGIN
+         elif isinstance(node, nodeModel.DestinationNode): kind = DESTINATION
+         elif isinstance(node, nodeModel.RampMeterNode): kind = METER
+         elif isinstance(node, nodeModel.SeriesNode): kind = SERIES
+         elif isinstance(node, nodeModel.DivergeNode): kind = DIVERGE
+         elif isinstance(node, nodeModel.MergeNode): kind = MERGE
+         elif isinstance(node, nodeModel.FullyProtectedIntersectionNode): kind = SIGNAL
+         else:
+            print("Node type %s is not supported by the fast engine." % type(node).__name__)
+            raise nodeModel.WrongNodeTypeException
+         self.nodeKind.append(kind)
+         self.nodeIn.append(ins)
+         self.nodeOut.append(outs)
+         self.priorities.append([node.priority[link] for link in node.upstreamLinks] if kind == MERGE else None)
+         outPosition = {o : b for b, o in enumerate(outs)}
+         for l in ins:
+            for s in range(self.slotStart[l], self.slotStart[l + 1]):
+               if self.nextSlot[s] >= 0:
+                  nextLink = numpy.searchsorted(self.slotStart, self.nextSlot[s], side='right') - 1
+                  self.outLocal[s] = outPosition.get(nextLink, -1)
+      # for each incoming slot of a node: whether the path continues, the outgoing link position, and the next slot
+      self.slotMoves = dict()
+      self.slotOutMatrix = dict()
+      for ins, outs in zip(self.nodeIn, self.nodeOut):
+         for l in ins:
+            outLocal = self.outLocal[self.slotStart[l]:self.slotStart[l + 1]]
+            valid = outLocal >= 0
+            self.slotMoves[l] = (valid, numpy.where(valid, outLocal, 0),
+                                 self.nextSlot[self.slotStart[l]:self.slotStart[l + 1]][valid])
+            self.slotOutMatrix[l] = (outLocal[:, None] == numpy.arange(len(outs))).astype(float)
+      self.loadingNodes = [i for i in range(len(net.nodes)) if self.nodeKind[i] not in (ORIGIN, DESTINATION)]
+      self.destinationNodes = [i for i in range(len(net.nodes)) if self.nodeKind[i] == DESTINATION]
+      self.originLinks = numpy.array([l for l, link in enumerate(links) if hasattr(net.nodes[link.tail], 'isCentroid')], dtype=int)
+      self.meters = [i for i in range(len(net.nodes)) if self.nodeKind[i] == METER]
+      self.signals = [i for i in range(len(net.nodes)) if self.nodeKind[i] == SIGNAL]
+
+      # the same node tables flattened for the kernels
+      self.inStart = numpy.cumsum([0] + [len(ins) for ins in self.nodeIn])
+      self.inLinks = numpy.concatenate(self.nodeIn + [numpy.zeros(0, dtype=int)]).astype(int)
+      self.outStart = numpy.cumsum([0] + [len(outs) for outs in self.nodeOut])
+      self.outLinks = numpy.concatenate(self.nodeOut + [numpy.zeros(0, dtype=int)]).astype(int)
+      self.priorityArray = numpy.concatenate([numpy.array(priority if priority is not None else [0] * len(ins), dtype=float)
+                                              for priority, ins in zip(self.priorities, self.nodeIn)] + [numpy.zeros(0)])
+      self.meterIndex = -numpy.ones(len(net.nodes), dtype=int)
+      self.meterIndex[self.meters] = numpy.arange(len(self.meters))
+      self.signalIndex = -numpy.ones(len(net.nodes), dtype=int)
+      self.signalIndex[self.signals] = numpy.arange(len(self.signals))
+
+   def reset(self):
+      """
+      Allocates empty counts for the whole time horizon and attaches the link totals to the links.  Cell contents
+      are taken from the Cell objects, as the reference engine does not clear them either.
+      """
+      K = len(self.scenarios)
+      rows = self.network.timeHorizon + 2
+      self.up = numpy.zeros((K, rows, self.numSlots))
+      self.down = numpy.zeros((K, rows, self.numSlots))
+      self.upTotal = numpy.zeros((K, self.numLinks, rows))
+      self.downTotal = numpy.zeros((K, self.numLinks, rows))
+      self.upLength = numpy.ones((K, self.numLinks), dtype=int)
+      self.downLength = numpy.ones((K, self.numLinks), dtype=int)
+      self.inflow = numpy.zeros((K, self.numSlots))
+      self.deferred = numpy.zeros((K, self.numLinks))
+      self.scenarioRange = numpy.arange(K)
+      self.cellVehicles = numpy.zeros((K, len(self.cellCapacity)))
+      for k, scenario in enumerate(self.scenarios):
+         for l in self.ctmLinks:
+            cells = scenario.links[self.linkIDs[l]].cells
+            self.cellVehicles[k, self.firstCell[l]:self.lastCell[l] + 1] = [cell.vehicles for cell in cells]
+      self.attach()
+
+   def attach(self):
+      for k, scenario in enumerate(self.scenarios):
+         for l, ij in enumerate(self.linkIDs):
+            scenario.links[ij].upstreamTotal = self.upTotal[k, l]
+            scenario.links[ij].downstreamTotal = self.downTotal[k, l]
+
+   def fork(self, network):
+      """
+      Returns a copy of this engine for a forked network; tables are shared and the state arrays are copied.  Any
+      further scenario networks are forked along with it.
+      """
+      scenarios = [scenario.fork() for scenario in self.scenarios[1:]]
+      if not hasattr(self, 'up'):
+         return FastEngine(network, self.tolerance, self.jit, scenarios, self.cutLinks)
+      engine = FastEngine.__new__(FastEngine)
+      engine.__dict__.update(self.__dict__)
+      engine.network = network
+      engine.scenarios = [network] + scenarios
+      engine.linkIndex = {network.links[ij] : l for l, ij in enumerate(self.linkIDs)}
+      for name in ('up', 'down', 'upTotal', 'downTotal', 'upLength', 'downLength', 'inflow', 'deferred', 'cellVehicles'):
+         setattr(engine, name, getattr(self, name).copy())
+      engine.attach()
+      return engine
+
+   def loadNetwork(self, r, init):
+      """
+      Loads every scenario over the times in r, as Network.loadNetwork does (which calls this after its own
+      initialization), and returns the vehicles loaded and terminated: numbers with one scenario, otherwise
+      arrays with one entry per scenario.
+      """
+      for scenario in self.scenarios[1:]:
+         scenario.startLoading(r, init)
+      if init:
+         self.compile()
+         self.reset()
+      K = len(r)
+      loaded = numpy.zeros((len(self.scenarios), K))
+      terminated = numpy.zeros((len(self.scenarios), K))
+      freeFlowTravelTime = numpy.zeros((len(self.scenarios), K))
+      meterFlows = numpy.zeros((len(self.scenarios), K, len(self.meters)))
+      if K > 0:
+         phaseStart, phaseIn, phaseOut = self.signalPhases(r)
+         vpts = numpy.array([[getattr(node, 'vpts', numpy.nan) for node in scenario.nodes] for scenario in self.scenarios])
+         if self.jit and list(r) == list(range(r[0], r[-1] + 1)):
+            self.loadCompiled(r, phaseStart, phaseIn, phaseOut, vpts, loaded, terminated, freeFlowTravelTime, meterFlows)
+         else:
+            phases = (phaseStart, phaseIn, phaseOut)
+            for n, t in enumerate(r):
+               self.step(t, n, phases, vpts, loaded, terminated, freeFlowTravelTime, meterFlows)
+
+      for k, scenario in enumerate(self.scenarios):
+         for n in range(K):
+            scenario.TSTT += scenario.vehiclesInNetwork
+            scenario.TFFT += freeFlowTravelTime[k, n]
+            scenario.totalLoaded += loaded[k, n]
+            scenario.totalTerminated += terminated[k, n]
+            scenario.vehiclesInNetwork += loaded[k, n] - terminated[k, n]
+         for m, i in enumerate(self.meters):
+            scenario.nodes[i].flows.extend(meterFlows[k, :, m].tolist())
+         for l in self.ctmLinks:
+            for c, cell in enumerate(scenario.links[self.linkIDs[l]].cells):
+               cell.vehicles = self.cellVehicles[k, self.firstCell[l] + c]
+         if K > 0:
+            for l, ij in enumerate(self.linkIDs):
+               scenario.detectors[ij].sampleRange(r, self.upTotal[k, l], self.downTotal[k, l])
+      if len(self.scenarios) == 1:
+         return loaded[0].sum(), terminated[0].sum()
+      return loaded.sum(axis=1), terminated.sum(axis=1)
+
+   def signalPhases(self, r):
+      """
+      Signal timing does not depend on flows, so the phases for every time in r are read from each scenario's Node
+      objects before loading.  The phases of the signal with index s (in self.signals) at the n-th time of r in
+      scenario k are phaseIn/phaseOut[q] for q from phaseStart[(n * K + k) * numSignals + s] up to the next entry,
+      as positions among the node's incoming and outgoing links; active phases come before permissive ones.
+      """
+      phaseStart, phaseIn, phaseOut = [0], [], []
+      positions = [[({link : a for a, link in enumerate(scenario.nodes[i].upstreamLinks)},
+                     {link : b for b, link in enumerate(scenario.nodes[i].downstreamLinks)}) for i in self.signals]
+                   for scenario in self.scenarios]
+      for t in r:
+         for k, scenario in enumerate(self.scenarios):
+            for s, i in enumerate(self.signals):
+               node = scenario.nodes[i]
+               ins, outs = positions[k][s]
+               for (inLink, outLink) in node.getActivePhases(t) + list(node.getPermissivePhases(t)):
+                  phaseIn.append(ins[inLink])
+                  phaseOut.append(outs[outLink])
+               phaseStart.append(len(phaseIn))
+      return numpy.array(phaseStart, dtype=int), numpy.array(phaseIn, dtype=int), numpy.array(phaseOut, dtype=int)
+
+   def loadCompiled(self, r, phaseStart, phaseIn, phaseOut, vpts, loaded, terminated, freeFlowTravelTime, meterFlows):
+      """
+      The loading loop of loadNetwork, with dta.kernels.load.
+      """
+      kernels.load(r[0], r[-1] + 1, self.tolerance,
+                   self.kind, self.capacity, self.upstreamCapacity, self.maxVehicles, self.freeFlowTime,
+                   self.backwardWaveTime, self.firstCell, self.lastCell,
+                   self.cellCapacity, self.cellMaxVehicles, self.cellDelta, self.pairFrom, self.pairTo,
+                   self.slotStart, self.nextSlot, self.outLocal, self.firstSlot, self.demand, self.pathFreeFlowTime,
+                   numpy.array(self.nodeKind, dtype=int), self.inStart, self.inLinks, self.outStart, self.outLinks,
+                   self.priorityArray, vpts, self.meterIndex, self.signalIndex,
+                   numpy.array(self.loadingNodes, dtype=int), numpy.array(self.destinationNodes, dtype=int),
+                   self.originLinks, self.cut, len(self.signals), phaseStart, phaseIn, phaseOut,
+                   self.cellVehicles, self.up, self.down, self.upTotal, self.downTotal, self.upLength, self.downLength,
+                   self.deferred, loaded, terminated, freeFlowTravelTime, meterFlows)
+
+   def step(self, t, n, phases, vpts, loaded, terminated, freeFlowTravelTime, meterFlows):
+      """
+      Advances all scenarios by one timestep t (the n-th of the range being loaded) with the NumPy methods.
+      """
+      sendingFlow, receivingFlow = self.linkUpdate(t)
+      for i in self.loadingNodes:
+         meterFlow = self.nodeUpdate(i, t, n, sendingFlow, receivingFlow, phases, vpts[:, i])
+         if self.meterIndex[i] >= 0:
+            meterFlows[:, n, self.meterIndex[i]] = meterFlow
+      self.releaseInflows()
+      loaded[:, n], freeFlowTravelTime[:, n] = self.loadTrips(t)
+      terminated[:, n] = self.terminateTrips(t, sendingFlow)
+
+   def linkUpdate(self, t):
+      """
+      Link.linkUpdate for all links and scenarios at once: returns arrays of sending and receiving flows indexed
+      by scenario and link, then moves flow between the cells of cell transmission model links.
+      """
+      links = numpy.arange(self.numLinks)
+      upNow = self.upTotal[:, :, t]
+      downNow = self.downTotal[:, :, t]
+      lagged = t + 1 - self.freeFlowTime
+      upLagged = numpy.where(lagged >= 0, self.upTotal[:, links, numpy.maximum(lagged, 0)], 0.)
+      lagged = t + 1 - self.backwardWaveTime
+      downLagged = numpy.where(lagged >= 0, self.downTotal[:, links, numpy.maximum(lagged, 0)], 0.)
+
+      sendingFlow = numpy.minimum(upLagged - downNow, self.capacity)
+      receivingFlow = numpy.select([self.kind == PQ, self.kind == SQ, self.kind == LTM],
+                                   [numpy.broadcast_to(self.upstreamCapacity, upNow.shape),
+                                    numpy.maximum(0, numpy.minimum(self.maxVehicles - (upNow - downNow), self.upstreamCapacity)),
+                                    numpy.minimum(downLagged + self.maxVehicles - upNow, self.capacity)])
+      if len(self.ctmLinks) > 0:
+         v = self.cellVehicles
+         last = self.lastCell[self.ctmLinks]
+         first = self.firstCell[self.ctmLinks]
+         sendingFlow[:, self.ctmLinks] = numpy.maximum(0, numpy.minimum(v[:, last], self.cellCapacity[last]))
+         receivingFlow[:, self.ctmLinks] = numpy.maximum(0, numpy.minimum(self.cellDelta[first] * (self.cellMaxVehicles[first] - v[:, first]),
+                                                                          self.cellCapacity[first]))
+         self.cellUpdate()
+      return sendingFlow, receivingFlow
+
+   def cellUpdate(self):
+      v = self.cellVehicles
+      send = numpy.maximum(0, numpy.minimum(v[:, self.pairFrom], self.cellCapacity[self.pairFrom]))
+      receive = numpy.maximum(0, numpy.minimum(self.cellDelta[self.pairTo] * (self.cellMaxVehicles[self.pairTo] - v[:, self.pairTo]),
+                                               self.cellCapacity[self.pairTo]))
+      flow = numpy.minimum(send, receive)
+      # the reference engine adds each cell's inflow before removing its outflow
+      v[:, self.pairTo] += flow
+      v[:, self.pairFrom] -= flow
+
+   def currentSendingFlow(self, l, sendingFlow):
+      """
+      Link.calculateSendingFlow as called during node updates, i.e., after cell flows have moved.
+      """
+      if self.kind[l] == CTM:
+         c = self.lastCell[l]
+         return numpy.maximum(0, numpy.minimum(self.cellVehicles[:, c], self.cellCapacity[c]))
+      return sendingFlow[:, l]
+
+   def disaggregateSendingFlow(self, l, t, sendingFlow):
+      """
+      Node.calculateDisaggregateSendingFlows for one link: the sending flow split over the link's slots, with one
+      row per scenario.
+      """
+      a, b = self.slotStart[l], self.slotStart[l + 1]
+      K = len(self.scenarios)
+      sending = sendingFlow > 0
+      if not sending.any() or a == b:
+         return numpy.zeros((K, b - a))
+      n = self.upLength[0, l]
+      startTime = numpy.zeros(K, dtype=int)
+      endTime = numpy.zeros(K, dtype=int)
+      for k in numpy.flatnonzero(sending):
+         counts = self.upTotal[k, l, :n]
+         exited = self.downTotal[k, l, t]
+         # Link.getEntryTime, rounding down and up
+         startTime[k] = max(numpy.searchsorted(counts, exited + self.tolerance, side='left') - 1, 0)
+         endTime[k] = numpy.searchsorted(counts, exited + sendingFlow[k] - self.tolerance, side='right')
+      # Link.getFlowComposition
+      endTime = numpy.maximum(numpy.minimum(numpy.minimum(endTime, startTime + 1), n - 1), startTime)
+      composition = self.up[self.scenarioRange, endTime, a:b] - self.up[self.scenarioRange, startTime, a:b]
+      total = composition.sum(axis=1)
+      positive = total > 0
+      composition[positive] *= (sendingFlow[positive] / total[positive])[:, None]
+      composition[~sending] = 0
+      return composition
+
+   def nodeUpdate(self, i, t, n, sendingFlow, receivingFlow, phases, vpts):
+      """
+      Moves flow through node i in every scenario; returns the ramp meter flows for meter nodes.
+      """
+      ins = self.nodeIn[i]
+      outs = self.nodeOut[i]
+      nOut = len(outs)
+      K = len(self.scenarios)
+
+      # proportions, from the disaggregate sending flows
+      current = [self.currentSendingFlow(l, sendingFlow) for l in ins]
+      disaggregate = [self.disaggregateSendingFlow(l, t, s) for l, s in zip(ins, current)]
+      proportion = numpy.empty((K, len(ins), nOut))
+      for a, l in enumerate(ins):
+         flows = disaggregate[a] @ self.slotOutMatrix[l]
+         total = flows.sum(axis=1, keepdims=True)
+         proportion[:, a] = 1.0 / nOut
+         numpy.divide(flows, total, out=proportion[:, a], where=total > 0)
+
+      transitionFlows, meterFlow = self.transitionFlows(i, n, sendingFlow, receivingFlow, proportion, phases, vpts)
+
+      # move flow
+      inflow = self.inflow
+      for o in outs:
+         inflow[:, self.slotStart[o]:self.slotStart[o + 1]] = 0
+      for a, l in enumerate(ins):
+         valid, b, nextSlots = self.slotMoves[l]
+         denominator = (current[a][:, None] * proportion[:, a, :])[:, b]
+         moves = valid & (denominator > 0)
+         moving = numpy.zeros(denominator.shape)
+         moving[moves] = (disaggregate[a] * transitionFlows[:, a, b])[moves] / denominator[moves]
+         self.flowOut(l, moving)
+         inflow[:, nextSlots] = moving[:, valid]
+      for o in outs:
+         self.flowIn(o, inflow[:, self.slotStart[o]:self.slotStart[o + 1]])
+      return meterFlow
+
+   def transitionFlows(self, i, n, sendingFlow, receivingFlow, proportion, phases, vpts):
+      """
+      calculateTransitionFlows of node i in every scenario, returned as an array indexed by scenario, incoming and
+      outgoing link position, along with the ramp meter flows (None for other nodes).
+      """
+      kind = self.nodeKind[i]
+      ins = self.nodeIn[i]
+      outs = self.nodeOut[i]
+      K = len(self.scenarios)
+      transitionFlows = numpy.zeros((K, len(ins), len(outs)))
+      meterFlow = None
+
+      if kind == SERIES:
+         transitionFlows[:, 0, 0] = numpy.minimum(sendingFlow[:, ins[0]], receivingFlow[:, outs[0]])
+
+      elif kind == METER:
+         meterFlow = numpy.minimum(numpy.minimum(vpts, sendingFlow[:, ins[0]]), receivingFlow[:, outs[0]])
+         transitionFlows[:, 0, 0] = meterFlow
+
+      elif kind == DIVERGE:
+         s = sendingFlow[:, ins[0]]
+         movingFraction = numpy.ones(K)
+         for b, o in enumerate(outs):
+            denominator = s * proportion[:, 0, b]
+            nonzero = denominator != 0
+            movingFraction[nonzero] = numpy.minimum(movingFraction[nonzero], receivingFlow[nonzero, o] / denominator[nonzero])
+         for b in range(len(outs)):
+            transitionFlows[:, 0, b] = movingFraction * proportion[:, 0, b] * s
+
+      elif kind == MERGE:
+         priority = self.priorities[i]
+         for k in range(K):
+            s = [sendingFlow[k, l] for l in ins]
+            r = receivingFlow[k, outs[0]]
+            activeLinks = list(range(len(ins)))
+            while len(activeLinks) > 0 and r > 0:
+               totalPriority = 0
+               for a in activeLinks:
+                  totalPriority += priority[a]
+               flowMovedThisIteration = 0
+               inactivatedLinks = list()
+               for a in activeLinks:
+                  additionalFlow = min(s[a], priority[a] / float(totalPriority) * r)
+                  transitionFlows[k, a, 0] += additionalFlow
+                  flowMovedThisIteration += additionalFlow
+                  s[a] -= additionalFlow
+                  if s[a] == 0:
+                     inactivatedLinks.append(a)
+               r -= flowMovedThisIteration
+               for a in inactivatedLinks:
+                  activeLinks.remove(a)
+
+      elif kind == SIGNAL:
+         phaseStart, phaseIn, phaseOut = phases
+         numSignals = len(self.signals)
+         for k in range(K):
+            r = receivingFlow[k, outs].copy()
+            q = (n * K + k) * numSignals + self.signalIndex[i]
+            for a, b in zip(phaseIn[phaseStart[q]:phaseStart[q + 1]], phaseOut[phaseStart[q]:phaseStart[q + 1]]):
+               flow = min(sendingFlow[k, ins[a]], r[b])
+               transitionFlows[k, a, b] = flow
+               r[b] -= flow
+
+      return transitionFlows, meterFlow
+
+   def flowIn(self, l, pathFlows):
+      a, b = self.slotStart[l], self.slotStart[l + 1]
+      row = self.upLength[0, l]
+      self.up[:, row, a:b] = self.up[:, row - 1, a:b] + pathFlows
+      total = pathFlows.sum(axis=1)
+      self.upTotal[:, l, row] = self.upTotal[:, l, row - 1] + total
+      if self.cut[l]:
+         self.deferred[:, l] = total
+         return
+      self.upLength[:, l] += 1
+      if self.kind[l] == CTM:
+         self.cellVehicles[:, self.firstCell[l]] += total
+
+   def releaseInflows(self):
+      """
+      Counts the inflow that flowIn held back on cut links this timestep.
+      """
+      cut = self.cutIndices
+      self.upLength[:, cut] += 1
+      ctm = cut[self.kind[cut] == CTM]
+      self.cellVehicles[:, self.firstCell[ctm]] += self.deferred[:, ctm]
+
+   def flowOut(self, l, pathFlows):
+      a, b = self.slotStart[l], self.slotStart[l + 1]
+      row = self.downLength[0, l]
+      self.down[:, row, a:b] = self.down[:, row - 1, a:b] + pathFlows
+      total = pathFlows.sum(axis=1)
+      self.downTotal[:, l, row] = self.downTotal[:, l, row - 1] + total
+      self.downLength[:, l] += 1
+      if self.kind[l] == CTM:
+         self.cellVehicles[:, self.lastCell[l]] -= total
+      return total
+
+   def loadTrips(self, t):
+      """
+      Returns the vehicles loaded in each scenario and their total free flow travel time.
+      """
+      if t < self.demand.shape[2]:
+         flows = numpy.where(self.demand[:, :, t] > 0, self.demand[:, :, t], 0.)
+      else:
+         flows = numpy.zeros(self.demand.shape[:2])
+      inflow = self.inflow
+      for l in self.originLinks:
+         inflow[:, self.slotStart[l]:self.slotStart[l + 1]] = 0
+      inflow[:, self.firstSlot] = flows
+      for l in self.originLinks:
+         self.flowIn(l, inflow[:, self.slotStart[l]:self.slotStart[l + 1]])
+      return flows.sum(axis=1), flows @ self.pathFreeFlowTime
+
+   def terminateTrips(self, t, sendingFlow):
+      terminated = numpy.zeros(len(self.scenarios))
+      for i in self.destinationNodes:
+         for l in self.nodeIn[i]:
+            s = self.currentSendingFlow(l, sendingFlow)
+            terminated += self.flowOut(l, self.disaggregateSendingFlow(l, t, s))
+      return terminated
+
+   def memoryReport(self):
+      """
+      Returns the bytes held by the engine's arrays, as a dictionary with the bytes of each array ('structures'),
+      and the bytes of the counts kept for each link ('links', keyed by link ID) and for each path ('paths',
+      keyed by path: its slots' counts and its demand).  Counts are only allocated by an initializing load.
+      """
+      structures = {name : value.nbytes for name, value in self.__dict__.items()
+                    if isinstance(value, numpy.ndarray) and not isinstance(value.base, numpy.ndarray)}
+      report = {'structures' : structures, 'links' : dict(), 'paths' : dict()}
+      if not hasattr(self, 'up'):
+         return report
+      K, rows = self.up.shape[:2]
+      column = K * rows * self.up.itemsize
+      for l, ij in enumerate(self.linkIDs):
+         report['links'][ij] = int(2 * column * (self.slotStart[l + 1] - self.slotStart[l] + 1))
+      for p, path in enumerate(self.paths):
+         report['paths'][path] = int(2 * column * len(path) + self.demand[:, p].nbytes)
+      return report
+
+   def pathCount(self, ij, path, t, downstream = False, scenario = 0):
+      """
+      Returns the cumulative count of vehicles on the given path entering (or, if downstream, leaving) link ij
+      through time t; the engine's equivalent of link.upstreamPathCount[t][path].
+      """
+      p = self.paths.index(path) if path in self.paths else None
+      if p is None or ij not in path:
+         return 0
+      return (self.down if downstream else self.up)[scenario, t, self.slotIndex[(p, list(path).index(ij))]]
@@ -0,0 +1,377 @@
+"""
+Loop-style kernels for FastEngine, compiled with Numba when it is installed.  Each function mirrors the NumPy
+method of FastEngine with the same name (moveNodes runs nodeUpdate over a list of nodes), working on one scenario's
+arrays one element at a time, which Numba turns into machine code; load runs a whole range of timesteps for every
+scenario in one call.  The phase functions take the links, cell pairs, nodes or paths to work on, so that
+dta.partition can run them on one part of the network at a time.  Without Numba, HAVE_NUMBA is False
+and FastEngine keeps to its NumPy methods (these functions still work, but interpreted they are slow).
+"""
+import numpy
+
+try:
+   from numba import njit
+   HAVE_NUMBA = True
+except ImportError:
+   HAVE_NUMBA = False
+   def njit(*args, **kwargs):
+      if len(args) == 1 and callable(args[0]):
+         return args[0]
+      return lambda function: function
+
+# model codes, as in fastEngine
+PQ = 0
+SQ = 1
+CTM = 2
+LTM = 3
+SERIES = 2
+METER = 3
+DIVERGE = 4
+MERGE = 5
+SIGNAL = 6
+
+@njit(cache=True)
+def linkUpdate(t, links, kind, capacity, upstreamCapacity, maxVehicles, freeFlowTime, backwardWaveTime, firstCell, lastCell,
+               cellCapacity, cellMaxVehicles, cellDelta, cellVehicles, upTotal, downTotal, sendingFlow, receivingFlow):
+   for l in links:
+      if kind[l] == CTM:
+         c = lastCell[l]
+         sendingFlow[l] = max(0., min(cellVehicles[c], cellCapacity[c]))
+         c = firstCell[l]
+         receivingFlow[l] = max(0., min(cellDelta[c] * (cellMaxVehicles[c] - cellVehicles[c]), cellCapacity[c]))
+         continue
+      lagged = t + 1 - freeFlowTime[l]
+      upLagged = upTotal[l, lagged] if lagged >= 0 else 0.
+      sendingFlow[l] = min(upLagged - downTotal[l, t], capacity[l])
+      if kind[l] == PQ:
+         receivingFlow[l] = upstreamCapacity[l]
+      elif kind[l] == SQ:
+         receivingFlow[l] = max(0., min(maxVehicles[l] - (upTotal[l, t] - downTotal[l, t]), upstreamCapacity[l]))
+      else:
+         lagged = t + 1 - backwardWaveTime[l]
+         downLagged = downTotal[l, lagged] if lagged >= 0 else 0.
+         receivingFlow[l] = min(downLagged + maxVehicles[l] - upTotal[l, t], capacity[l])
+
+@njit(cache=True)
+def cellUpdate(pairs, pairFrom, pairTo, cellCapacity, cellMaxVehicles, cellDelta, cellVehicles, flow):
+   for k in pairs:
+      c, d = pairFrom[k], pairTo[k]
+      send = max(0., min(cellVehicles[c], cellCapacity[c]))
+      receive = max(0., min(cellDelta[d] * (cellMaxVehicles[d] - cellVehicles[d]), cellCapacity[d]))
+      flow[k] = min(send, receive)
+   # the reference engine adds each cell's inflow before removing its outflow
+   for k in pairs:
+      cellVehicles[pairTo[k]] += flow[k]
+   for k in pairs:
+      cellVehicles[pairFrom[k]] -= flow[k]
+
+@njit(cache=True)
+def searchLeft(counts, n, value):
+   """
+   First index below n whose count is at least value (n if none), as numpy.searchsorted(side='left').
+   """
+   low, high = 0, n
+   while low < high:
+      middle = (low + high) // 2
+      if counts[middle] < value:
+         low = middle + 1
+      else:
+         high = middle
+   return low
+
+@njit(cache=True)
+def searchRight(counts, n, value):
+   """
+   First index below n whose count exceeds value (n if none), as numpy.searchsorted(side='right').
+   """
+   low, high = 0, n
+   while low < high:
+      middle = (low + high) // 2
+      if counts[middle] <= value:
+         low = middle + 1
+      else:
+         high = middle
+   return low
+
+@njit(cache=True)
+def currentSendingFlow(l, kind, lastCell, cellCapacity, cellVehicles, sendingFlow):
+   if kind[l] == CTM:
+      c = lastCell[l]
+      return max(0., min(cellVehicles[c], cellCapacity[c]))
+   return sendingFlow[l]
+
+@njit(cache=True)
+def disaggregateSendingFlow(l, t, s, tolerance, slotStart, upLength, upTotal, downTotal, up, disaggregate):
+   a, b = slotStart[l], slotStart[l + 1]
+   for k in range(a, b):
+      disaggregate[k] = 0.
+   if not s > 0 or a == b:
+      return
+   n = upLength[l]
+   exited = downTotal[l, t]
+   startTime = max(searchLeft(upTotal[l], n, exited + tolerance) - 1, 0)
+   endTime = max(min(searchRight(upTotal[l], n, exited + s - tolerance), startTime + 1, n - 1), startTime)
+   total = 0.
+   for k in range(a, b):
+      disaggregate[k] = up[endTime, k] - up[startTime, k]
+      total += disaggregate[k]
+   if total > 0:
+      scale = s / total
+      for k in range(a, b):
+         disaggregate[k] *= scale
+
+@njit(cache=True)
+def flowIn(l, pathFlows, slotStart, kind, firstCell, up, upTotal, upLength, cellVehicles, cut, deferred):
+   row = upLength[l]
+   total = 0.
+   for k in range(slotStart[l], slotStart[l + 1]):
+      up[row, k] = up[row - 1, k] + pathFlows[k]
+      total += pathFlows[k]
+   upTotal[l, row] = upTotal[l, row - 1] + total
+   if cut[l]:
+      deferred[l] = total
+      return
+   upLength[l] += 1
+   if kind[l] == CTM:
+      cellVehicles[firstCell[l]] += total
+
+@njit(cache=True)
+def releaseInflows(links, kind, firstCell, upLength, cellVehicles, deferred):
+   """
+   Counts the inflow that flowIn held back on the given cut links this timestep.
+   """
+   for l in links:
+      upLength[l] += 1
+      if kind[l] == CTM:
+         cellVehicles[firstCell[l]] += deferred[l]
+
+@njit(cache=True)
+def flowOut(l, pathFlows, slotStart, kind, lastCell, down, downTotal, downLength, cellVehicles):
+   row = downLength[l]
+   total = 0.
+   for k in range(slotStart[l], slotStart[l + 1]):
+      down[row, k] = down[row - 1, k] + pathFlows[k]
+      total += pathFlows[k]
+   downTotal[l, row] = downTotal[l, row - 1] + total
+   downLength[l] += 1
+   if kind[l] == CTM:
+      cellVehicles[lastCell[l]] -= total
+   return total
+
+@njit(cache=True)
+def transitionFlows(kind, ins, outs, priority, vpts, phaseIn, phaseOut, sendingFlow, receivingFlow, proportion,
+                    transition, remaining):
+   """
+   Fills transition[:len(ins), :len(outs)] for one node and returns the ramp meter flow (0 for other nodes).
+   """
+   nIn, nOut = len(ins), len(outs)
+   for a in range(nIn):
+      for b in range(nOut):
+         transition[a, b] = 0.
+   meterFlow = 0.
+
+   if kind == SERIES:
+      transition[0, 0] = min(sendingFlow[ins[0]], receivingFlow[outs[0]])
+
+   elif kind == METER:
+      meterFlow = min(vpts, sendingFlow[ins[0]], receivingFlow[outs[0]])
+      transition[0, 0] = meterFlow
+
+   elif kind == DIVERGE:
+      s = sendingFlow[ins[0]]
+      movingFraction = 1.
+      for b in range(nOut):
+         if s * proportion[0, b] != 0:
+            movingFraction = min(movingFraction, receivingFlow[outs[b]] / (s * proportion[0, b]))
+      for b in range(nOut):
+         transition[0, b] = movingFraction * proportion[0, b] * s
+
+   elif kind == MERGE:
+      # remaining holds each incoming link's unmoved sending flow; NaN marks inactive links
+      for a in range(nIn):
+         remaining[a] = sendingFlow[ins[a]]
+      r = receivingFlow[outs[0]]
+      active = nIn
+      while active > 0 and r > 0:
+         totalPriority = 0.
+         for a in range(nIn):
+            if remaining[a] == remaining[a]:
+               totalPriority += priority[a]
+         flowMovedThisIteration = 0.
+         for a in range(nIn):
+            if remaining[a] == remaining[a]:
+               additionalFlow = min(remaining[a], priority[a] / totalPriority * r)
+               transition[a, 0] += additionalFlow
+               flowMovedThisIteration += additionalFlow
+               remaining[a] -= additionalFlow
+         r -= flowMovedThisIteration
+         for a in range(nIn):
+            if remaining[a] == 0:
+               remaining[a] = numpy.nan
+               active -= 1
+
+   elif kind == SIGNAL:
+      for b in range(nOut):
+         remaining[b] = receivingFlow[outs[b]]
+      for q in range(len(phaseIn)):
+         a, b = phaseIn[q], phaseOut[q]
+         flow = min(sendingFlow[ins[a]], remaining[b])
+         transition[a, b] = flow
+         remaining[b] -= flow
+
+   return meterFlow
+
+@njit(cache=True)
+def nodeScratch(nodeInStart, nodeOutStart):
+   """
+   Work arrays for moveNodes, large enough for any node.
+   """
+   maxIn, maxOut = 1, 1
+   for i in range(len(nodeInStart) - 1):
+      maxIn = max(maxIn, nodeInStart[i + 1] - nodeInStart[i])
+      maxOut = max(maxOut, nodeOutStart[i + 1] - nodeOutStart[i])
+   return numpy.zeros((maxIn, maxOut)), numpy.zeros((maxIn, maxOut)), numpy.zeros(maxIn), numpy.zeros(max(maxIn, maxOut))
+
+@njit(cache=True)
+def moveNodes(t, n, k, K, tolerance, nodes,
+              kind, lastCell, firstCell, cellCapacity, slotStart, nextSlot, outLocal,
+              nodeKind, nodeInStart, nodeIn, nodeOutStart, nodeOut, priority, vpts, meterIndex, signalIndex,
+              numSignals, phaseStart, phaseIn, phaseOut,
+              cellVehicles, up, down, upTotal, downTotal, upLength, downLength, cut, deferred, meterFlows,
+              sendingFlow, receivingFlow, disaggregate, inflow, proportion, transition, current, remaining):
+   """
+   Moves flow through the given nodes, in order.
+   """
+   for i in nodes:
+      ins = nodeIn[nodeInStart[i]:nodeInStart[i + 1]]
+      outs = nodeOut[nodeOutStart[i]:nodeOutStart[i + 1]]
+      nOut = len(outs)
+
+      # proportions, from the disaggregate sending flows
+      for a in range(len(ins)):
+         l = ins[a]
+         current[a] = currentSendingFlow(l, kind, lastCell, cellCapacity, cellVehicles, sendingFlow)
+         disaggregateSendingFlow(l, t, current[a], tolerance, slotStart, upLength, upTotal, downTotal, up, disaggregate)
+         for b in range(nOut):
+            proportion[a, b] = 0.
+         for s in range(slotStart[l], slotStart[l + 1]):
+            if outLocal[s] >= 0:
+               proportion[a, outLocal[s]] += disaggregate[s]
+         total = 0.
+         for b in range(nOut):
+            total += proportion[a, b]
+         for b in range(nOut):
+            proportion[a, b] = proportion[a, b] / total if total > 0 else 1.0 / nOut
+
+      first, last = 0, 0
+      if signalIndex[i] >= 0:
+         q = (n * K + k) * numSignals + signalIndex[i]
+         first, last = phaseStart[q], phaseStart[q + 1]
+      meterFlow = transitionFlows(nodeKind[i], ins, outs, priority[nodeInStart[i]:nodeInStart[i + 1]], vpts[i],
+                                  phaseIn[first:last], phaseOut[first:last], sendingFlow, receivingFlow, proportion,
+                                  transition, remaining)
+      if meterIndex[i] >= 0:
+         meterFlows[n, meterIndex[i]] = meterFlow
+
+      # move flow
+      for o in outs:
+         for s in range(slotStart[o], slotStart[o + 1]):
+            inflow[s] = 0.
+      for a in range(len(ins)):
+         l = ins[a]
+         for s in range(slotStart[l], slotStart[l + 1]):
+            moving = 0.
+            b = outLocal[s]
+            if b >= 0:
+               denominator = current[a] * proportion[a, b]
+               if denominator > 0:
+                  moving = disaggregate[s] * transition[a, b] / denominator
+               inflow[nextSlot[s]] = moving
+            disaggregate[s] = moving
+         flowOut(l, disaggregate, slotStart, kind, lastCell, down, downTotal, downLength, cellVehicles)
+      for o in outs:
+         flowIn(o, inflow, slotStart, kind, firstCell, up, upTotal, upLength, cellVehicles, cut, deferred)
+
+@njit(cache=True)
+def loadTrips(t, n, originLinks, paths, kind, firstCell, slotStart, firstSlot, demand, pathFreeFlowTime,
+              cellVehicles, up, upTotal, upLength, cut, deferred, loaded, freeFlowTravelTime, inflow):
+   """
+   Loads the given paths' demand onto the given origin links (which must include each path's first link).
+   """
+   for l in originLinks:
+      for s in range(slotStart[l], slotStart[l + 1]):
+         inflow[s] = 0.
+   loadedNow = 0.
+   freeFlowNow = 0.
+   if t < demand.shape[1]:
+      for p in paths:
+         flow = demand[p, t]
+         if flow > 0:
+            inflow[firstSlot[p]] = flow
+            loadedNow += flow
+            freeFlowNow += flow * pathFreeFlowTime[p]
+   for l in originLinks:
+      flowIn(l, inflow, slotStart, kind, firstCell, up, upTotal, upLength, cellVehicles, cut, deferred)
+   loaded[n] = loadedNow
+   freeFlowTravelTime[n] = freeFlowNow
+
+@njit(cache=True)
+def terminateTrips(t, n, destinationNodes, tolerance, kind, lastCell, cellCapacity, slotStart, nodeInStart, nodeIn,
+                   cellVehicles, up, down, upTotal, downTotal, upLength, downLength, terminated,
+                   sendingFlow, disaggregate):
+   terminatedNow = 0.
+   for i in destinationNodes:
+      for l in nodeIn[nodeInStart[i]:nodeInStart[i + 1]]:
+         s = currentSendingFlow(l, kind, lastCell, cellCapacity, cellVehicles, sendingFlow)
+         disaggregateSendingFlow(l, t, s, tolerance, slotStart, upLength, upTotal, downTotal, up, disaggregate)
+         terminatedNow += flowOut(l, disaggregate, slotStart, kind, lastCell, down, downTotal, downLength, cellVehicles)
+   terminated[n] = terminatedNow
+
+@njit(cache=True)
+def load(t0, t1, tolerance,
+         kind, capacity, upstreamCapacity, maxVehicles, freeFlowTime, backwardWaveTime, firstCell, lastCell,
+         cellCapacity, cellMaxVehicles, cellDelta, pairFrom, pairTo,
+         slotStart, nextSlot, outLocal, firstSlot, demand, pathFreeFlowTime,
+         nodeKind, nodeInStart, nodeIn, nodeOutStart, nodeOut, priority, vpts, meterIndex, signalIndex,
+         loadingNodes, destinationNodes, originLinks, cut, numSignals, phaseStart, phaseIn, phaseOut,
+         cellVehicles, up, down, upTotal, downTotal, upLength, downLength, deferred,
+         loaded, terminated, freeFlowTravelTime, meterFlows):
+   """
+   Loads every scenario over times t0 to t1 - 1; per-scenario arrays (demand, vpts, the state and the results)
+   have a leading scenario axis, and each timestep advances all scenarios before moving on.  Results for time t
+   are written at index t - t0, and signal phases are laid out as in FastEngine.signalPhases.  Each timestep
+   updates links and cells, moves flow through the loading nodes in order, counts the inflow held back on cut
+   links, then loads and terminates trips.
+   """
+   K = up.shape[0]
+   links = numpy.arange(len(kind))
+   pairs = numpy.arange(len(pairFrom))
+   paths = numpy.arange(demand.shape[1])
+   cutLinks = numpy.flatnonzero(cut)
+   sendingFlow = numpy.zeros(len(kind))
+   receivingFlow = numpy.zeros(len(kind))
+   cellFlow = numpy.zeros(len(pairFrom))
+   disaggregate = numpy.zeros(len(nextSlot))
+   inflow = numpy.zeros(len(nextSlot))
+   proportion, transition, current, remaining = nodeScratch(nodeInStart, nodeOutStart)
+
+   for t in range(t0, t1):
+      n = t - t0
+      for k in range(K):
+         linkUpdate(t, links, kind, capacity, upstreamCapacity, maxVehicles, freeFlowTime, backwardWaveTime, firstCell,
+                    lastCell, cellCapacity, cellMaxVehicles, cellDelta, cellVehicles[k], upTotal[k], downTotal[k],
+                    sendingFlow, receivingFlow)
+         cellUpdate(pairs, pairFrom, pairTo, cellCapacity, cellMaxVehicles, cellDelta, cellVehicles[k], cellFlow)
+         moveNodes(t, n, k, K, tolerance, loadingNodes,
+                   kind, lastCell, firstCell, cellCapacity, slotStart, nextSlot, outLocal,
+                   nodeKind, nodeInStart, nodeIn, nodeOutStart, nodeOut, priority, vpts[k], meterIndex, signalIndex,
+                   numSignals, phaseStart, phaseIn, phaseOut,
+                   cellVehicles[k], up[k], down[k], upTotal[k], downTotal[k], upLength[k], downLength[k], cut,
+                   deferred[k], meterFlows[k],
+                   sendingFlow, receivingFlow, disaggregate, inflow, proportion, transition, current, remaining)
+         releaseInflows(cutLinks, kind, firstCell, upLength[k], cellVehicles[k], deferred[k])
+         loadTrips(t, n, originLinks, paths, kind, firstCell, slotStart, firstSlot, demand[k], pathFreeFlowTime,
+                   cellVehicles[k], up[k], upTotal[k], upLength[k], cut, deferred[k], loaded[k], freeFlowTravelTime[k],
+                   inflow)
+         terminateTrips(t, n, destinationNodes, tolerance, kind, lastCell, cellCapacity, slotStart, nodeInStart, nodeIn,
+                        cellVehicles[k], up[k], down[k], upTotal[k], downTotal[k], upLength[k], downLength[k],
+                        terminated[k], sendingFlow, disaggregate)
@@ -1,3 +1,4 @@
+from copy import copy
 from .units import *
 
 class Link:
@@ -32,10 +33,17 @@ class Link:
       self.backwardWaveTime = int((self.length/self.backwardWaveSpeed + timestep - 1) / timestep) 
 
       # initialize dictionaries and counts
-      self.upstreamPathCount = list()
-      self.downstreamPathCount = list()
-      self.upstreamPathCount.append(dict())
-      self.downstreamPathCount.append(dict())
+      self.resetCounts()
+
+   def resetCounts(self):
+      """
+      Clears the cumulative counts.  upstreamPathCount and downstreamPathCount hold one dictionary of counts per path
+      for each time; upstreamTotal and downstreamTotal hold the same counts summed over paths.
+      """
+      self.upstreamPathCount = [dict()]
+      self.downstreamPathCount = [dict()]
+      self.upstreamTotal = [0]
+      self.downstreamTotal = [0]
 
    def calculateSendingFlow(self, t):
       pass
@@ -56,10 +64,7 @@ class Link:
       """
       if t < 0:
          return 0
-      count = 0
-      for path in self.upstreamPathCount[t].keys():
-         count += self.upstreamPathCount[t][path]
-      return count
+      return self.upstreamTotal[t]
 
    def downstreamCount(self, t):
       """
@@ -67,10 +72,7 @@ class Link:
       """
       if t < 0:
          return 0
-      count = 0
-      for path in self.downstreamPathCount[t].keys():
-         count += self.downstreamPathCount[t][path]
-      return count
+      return self.downstreamTotal[t]
 
    def vehiclesOnLink(self, t):
       """
@@ -90,6 +92,7 @@ class Link:
       # Then add new inflows
       for path in pathFlows or []:
          self.upstreamPathCount[-1][path] = pathFlows[path] + self.upstreamPathCount[-1].setdefault(path, 0)
+      self.upstreamTotal.append(self.upstreamTotal[-1] + (sum(pathFlows.values()) if pathFlows else 0))
 
    def flowOut(self, pathFlows):
       """
@@ -104,14 +107,17 @@ class Link:
       # Then add new outflows
       for path in pathFlows or []:
          self.downstreamPathCount[-1][path] = pathFlows[path] + self.downstreamPathCount[-1].setdefault(path, 0)
+      self.downstreamTotal.append(self.downstreamTotal[-1] + (sum(pathFlows.values()) if pathFlows else 0))
 
    def getFlowComposition(self, startTime, endTime):
       """
       Returns the total number of vehicles entering a link between startTime and endTime (inclusive), disaggregated by path.
-      These values are returned in a dictionary with paths as keys.
+      These values are returned in a dictionary with paths as keys.  A sending flow smaller than getEntryTime's tolerance
+      can round endTime to before startTime; the composition is then empty (all zeroes) rather than negative, so that no
+      flow moves backwards and the counts stay nondecreasing.
       """
       startTime = int(startTime)
-      endTime = min(int(endTime), startTime + 1)
+      endTime = min(max(int(endTime), startTime), startTime + 1)
             
       pathCounts = dict()
       totalFlow = 0
@@ -173,5 +179,20 @@ class Link:
          cumulativeVehicles += self.downstreamCount(t) - self.downstreamCount(t-1)
       return cumulativeVehicles
 
+   def fork(self):
+      """
+      Returns a copy of this link which can be loaded independently of the original.  Link parameters are shared;
+      the count lists are copied, but the per-timestep dictionaries in them are not, since they are never changed
+      once written (getFlowComposition only adds zero entries).
+      """
+      link = copy(self)
+      link.upstreamPathCount = list(self.upstreamPathCount)
+      link.downstreamPathCount = list(self.downstreamPathCount)
+      link.upstreamTotal = list(self.upstreamTotal)
+      link.downstreamTotal = list(self.downstreamTotal)
+      if hasattr(self, 'travelTime'):
+         link.travelTime = list(self.travelTime)
+      return link
+
    def __hash__(self):
       return hash(self.ID)
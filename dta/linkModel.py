@@ -1,3 +1,4 @@
+from copy import copy
 from .link import Link
 from .units import *
 
@@ -97,6 +98,11 @@ class CellTransmissionModelLink(Link):
          
       return (sendingFlow, receivingFlow)
 
+   def fork(self):
+      link = Link.fork(self)
+      link.cells = [copy(cell) for cell in self.cells]
+      return link
+
    def flowIn(self, pathFlows):
       Link.flowIn(self, pathFlows)
       totalIn = sum(pathFlows.values())
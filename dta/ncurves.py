@@ -0,0 +1,103 @@
+"""
+Cumulative count (N-curve) analysis of links and ramp meters.  A curve is an array whose k-th entry counts the
+vehicles passing a point in the first k timesteps (so it starts at 0, as a link's upstreamTotal and
+downstreamTotal do).  Given a link's upstream and downstream curves, vehicles are on the link between them, and
+with FIFO the horizontal distance between the curves at vehicle n is the n-th vehicle's travel time, so totals
+over vehicles are areas between the curves, computed here over whole arrays at once.
+
+Measures over a window of entry times (start through end - 1) count only the vehicles entering then, by clipping
+both curves to the counts at start and end; vehicles that have not left by the end of the curves are counted
+until then.  Times are in timesteps.
+"""
+import numpy
+
+def cumulative(flows):
+    """
+    The curve of a sequence of flows per timestep (e.g. an OD pair's demandRates or a meter's flows).
+    """
+    return numpy.concatenate(([0.0], numpy.cumsum(numpy.asarray(flows, dtype=float))))
+
+def linkCurves(link, end=None):
+    """
+    The upstream and downstream curves of a link through time end, by default over all the times loaded (links
+    loaded by a fast engine hold counts over the whole time horizon, so pass end if loading stopped earlier).
+    """
+    if end is None:
+        end = min(len(link.upstreamTotal), len(link.downstreamTotal)) - 1
+    return numpy.asarray(link.upstreamTotal[:end + 1], dtype=float), numpy.asarray(link.downstreamTotal[:end + 1], dtype=float)
+
+def meterCurves(node):
+    """
+    The curves of vehicles reaching a ramp meter's queue (entering its upstream link) and passing the meter
+    (leaving that link) over the times loaded, so that travel times between them include the wait at the meter.
+    """
+    return linkCurves(node.upstreamLinks[0], len(node.flows))
+
+def shift(curve, freeFlowTime):
+    """
+    The virtual arrival curve at the downstream end of a link: the upstream curve delayed by freeFlowTime.
+    """
+    if freeFlowTime <= 0:
+        return curve
+    return numpy.concatenate((numpy.zeros(freeFlowTime), curve[:len(curve) - freeFlowTime]))
+
+def clipped(up, down, start, end):
+    """
+    Both curves clipped to the vehicles entering at times start through end - 1.
+    """
+    end = len(up) - 1 if end is None else end
+    lower, upper = up[start], up[end]
+    return numpy.clip(up, lower, upper), numpy.clip(down, lower, upper)
+
+def totalTravelTime(up, down, start=0, end=None):
+    """
+    The total travel time of the vehicles entering at times start through end - 1: the area between the curves.
+    """
+    up, down = clipped(up, down, start, end)
+    return float((up[1:] - down[1:]).sum())
+
+def vehicleHours(up, down, timestep=1, start=0, end=None):
+    """
+    totalTravelTime in vehicle-hours, for a timestep in seconds.
+    """
+    return totalTravelTime(up, down, start, end) * timestep / 3600
+
+def totalDelay(up, down, freeFlowTime, start=0, end=None):
+    """
+    The total delay of the vehicles entering at times start through end - 1: the area between the virtual
+    arrival curve (see shift) and the downstream curve.
+    """
+    up, down = clipped(up, down, start, end)
+    return float((shift(up, freeFlowTime)[1:] - down[1:]).sum())
+
+def queueLength(up, down, freeFlowTime=0):
+    """
+    The vehicles queued at the end of each timestep: between the virtual arrival curve and the downstream curve
+    (with freeFlowTime 0, all vehicles on the link, as in Link.vehiclesOnLink).
+    """
+    return numpy.maximum(shift(up, freeFlowTime) - down, 0)[1:]
+
+def crossingTimes(curve, counts):
+    """
+    The times at which curve reaches each of counts, interpolating linearly within timesteps; nan where it never
+    does.
+    """
+    counts = numpy.asarray(counts, dtype=float)
+    k = numpy.searchsorted(curve, counts, 'left')
+    reached = (k < len(curve)) & (counts > 0)
+    k = numpy.clip(k, 1, len(curve) - 1)
+    before = curve[k - 1]
+    step = curve[k] - before
+    times = k - 1 + numpy.where(step > 0, (counts - before) / numpy.where(step > 0, step, 1), 1)
+    times = numpy.where(reached, times, numpy.nan)
+    return numpy.where(counts <= 0, 0.0, times)
+
+def travelTimes(up, down, vehicles=None):
+    """
+    The FIFO travel time of each vehicle, by default of every whole vehicle entering (taken at its midpoint,
+    vehicle n at count n - 0.5): the time the downstream curve reaches its count minus the time the upstream
+    curve does; nan for vehicles still on the link at the end of the curves.
+    """
+    if vehicles is None:
+        vehicles = numpy.arange(0.5, up[-1])
+    return crossingTimes(down, vehicles) - crossingTimes(up, vehicles)
@@ -6,7 +6,12 @@ from dta import linkModel
 import sys
 import traceback
 from dta import utils
+from dta import ncurves
 from dta import units
+from dta.detector import Detector
+from dta.fastEngine import FastEngine
+from dta.partition import PartitionedEngine
+from dta.profiler import Profile, NO_PROFILE
 import numpy.random
 
 INFINITY = 99999
@@ -14,6 +19,12 @@ NO_PATH = 'N/A'
 EXIT_FAILURE = -1
 IS_MISSING = -1
 
+# gridlock detection (see Network.setGridlockDetection): a window of timesteps, checked every GRIDLOCK_CHECK
+# timesteps, over which no more than GRIDLOCK_TOLERANCE vehicles moving counts as no flow
+GRIDLOCK_WINDOW = 300
+GRIDLOCK_CHECK = 60
+GRIDLOCK_TOLERANCE = 0.5
+
 class OD:
 	"""
 	The OD class has four attributes: the origin node, the destination node,
@@ -34,6 +45,91 @@ class StochasticOD(OD):
 		#TODO generate demand rates stochastically
 		super().__init__(origin,destination,demandRates)
 
+def createLink(model, timestep, uf, w, kj, L, qmax, ID):
+	"""
+	Creates a link of the model named as in network files ('PQ', 'SQ', 'CTM' or 'LTM').
+	"""
+	if	model == 'PQ':  return linkModel.PointQueueLink(timestep, uf, w, kj, L, qmax, qmax, ID)
+	elif model == 'SQ':  return linkModel.SpatialQueueLink(timestep, uf, w, kj, L, qmax, qmax, ID)
+	elif model == 'CTM': return linkModel.CellTransmissionModelLink(timestep, uf, w, kj, L, qmax, ID)
+	elif model == 'LTM': return linkModel.LinkTransmissionModelLink(timestep, uf, w, kj, L, qmax, ID)
+	print("Link model %s is not implemented." % model)
+	raise utils.BadFileFormatException
+
+class ArrayOD(OD):
+	"""
+	An OD pair whose demandRates are a row (or column) of a network's demand array, kept as a view of it
+	rather than copied into a list.
+	"""
+	def __init__(self, origin, destination, demandRates):
+		self.origin = origin
+		self.destination = destination
+		self.demandRates = demandRates
+		self.paths = list()
+
+class DemandStream:
+	"""
+	The demand of several OD pairs, read block by block from an iterable of arrays with one row per OD pair and
+	one column per timestep of the block (e.g. a generator drawing each block as it is needed).  Only the
+	current block is held, so demand takes the same memory however many timesteps are loaded; the rest of the
+	loading state does not (links' upstreamTotal and downstreamTotal and the path counts still hold a value per
+	timestep loaded), so streaming bounds the memory of demand only, not of loading.  Times must be
+	read in order: any time in the current block can be read again, but once a later block has been read the
+	earlier ones are gone, which also holds for forks of a network, since they share its stream.  After the
+	last block, demand is zero.
+	"""
+	def __init__(self, blocks):
+		self.blocks = iter(blocks)
+		self.block = None
+		self.start = 0
+		self.end = 0
+		self.exhausted = False
+
+	def column(self, t):
+		"""
+		The demand of every OD pair at time t, reading further blocks as needed.
+		"""
+		while t >= self.end and not self.exhausted:
+			block = next(self.blocks, None)
+			if block is None:
+				self.exhausted = True
+				self.block = numpy.zeros((0 if self.block is None else len(self.block), 1))
+				self.start = self.end
+			else:
+				self.block = numpy.asarray(block)
+				self.start = self.end
+				self.end += self.block.shape[1]
+		if t < self.start:
+			print("Demand at time %d has already been streamed past (the current block starts at %d)" % (t, self.start))
+			raise utils.NotYetAttemptedException
+		return self.block[:, 0] if self.exhausted else self.block[:, t - self.start]
+
+class StreamRates:
+	"""
+	One OD pair's row of a DemandStream, indexed by time like a list of demand rates, and scaled by share (so
+	that an OD pair's streamed demand can be split among its paths).  Used as a StreamOD's demandRates and as
+	the path flows of its paths.
+	"""
+	def __init__(self, stream, row, share = 1.0):
+		self.stream = stream
+		self.row = row
+		self.share = share
+
+	def __getitem__(self, t):
+		return self.share * self.stream.column(t)[self.row]
+
+class StreamOD(OD):
+	"""
+	An OD pair whose demandRates are read from a DemandStream (see StreamRates) rather than held for the whole
+	time horizon.  Only the reference loading engine reads streamed demand: the fast and partitioned engines
+	compile path flows into arrays over the time horizon and refuse it.
+	"""
+	def __init__(self, origin, destination, demandRates):
+		self.origin = origin
+		self.destination = destination
+		self.demandRates = demandRates
+		self.paths = list()
+
 class Network:
 	"""
 	The Network class has methods for reading a network, performing network loading, and
@@ -85,6 +181,11 @@ class Network:
 		self.numNodes = 5
 		self.linkPriorities = dict()
 		self.totalDemand = 0.0
+		self.detectorPeriod = 1
+		self.engine = None
+		self.profile = None
+		self.gridlockWatch = None
+		self.gridlock = None
 
 		freeSpeed = 60 #mph
 		freeBack = 30 #mph
@@ -108,6 +209,7 @@ class Network:
 		freeStart = nodeModel.OriginNode([],[freeIn])
 		rampStart = nodeModel.OriginNode([],[rampIn])
 		rampMeter = nodeModel.RampMeterNode([rampIn],[rampOut])
+		rampMeter.setParams(vehsPerTimestep)
 		merge = nodeModel.MergeNode([freeIn,rampOut],[freeOut],priorities)
 		freeEnd = nodeModel.DestinationNode([freeOut],[])
 		self.nodes = [freeStart,rampStart,rampMeter,merge,freeEnd]
@@ -231,56 +333,283 @@ class Network:
 				self.pathFlows[path] = [0 for t in range(0,self.timeHorizon)]
 		self.updatePathFlows(self.findAllShortestPaths(), 1.0)
 			  
+	def fork(self):
+		"""
+		Returns a copy of the network in its current loading state, which can be loaded independently of this one
+		(e.g., to try several candidate signal settings for one interval).  Topology, ODs, paths and path flows are
+		shared with the original; only the links, nodes and the state they carry are copied.
+		"""
+		net = copy(self)
+		links = {self.links[ij] : self.links[ij].fork() for ij in self.links}
+		net.links = {ij : links[self.links[ij]] for ij in self.links}
+		net.nodes = [node.fork(links) for node in self.nodes]
+		net.pathTravelTimes = {path : copy(self.pathTravelTimes[path]) for path in self.pathTravelTimes}
+		if hasattr(self, 'sendingFlow'):
+			net.sendingFlow = dict(self.sendingFlow)
+			net.receivingFlow = dict(self.receivingFlow)
+			net.detectors = {ij : self.detectors[ij].fork(net.links[ij]) for ij in self.detectors}
+		if self.engine is not None:
+			net.engine = self.engine.fork(net)
+		net.profile = None
+		return net
+
+	def setEngine(self, engine, jit = None, scenarios = None, parts = None):
+		"""
+		Chooses how loadNetwork moves flow: 'reference' uses the Link and Node objects directly, 'fast' uses a
+		FastEngine compiled from them at the next initializing load.  Results agree up to floating point
+		summation order (see dta.conformance).  jit and scenarios are passed on to FastEngine.  'partitioned'
+		loads the parts of the network given by parts in parallel processes (see dta.partition); its results
+		may differ slightly where flow crosses between parts.
+		"""
+		if engine == 'reference':
+			self.engine = None
+		elif engine == 'fast':
+			self.engine = FastEngine(self, jit = jit, scenarios = scenarios)
+		elif engine == 'partitioned':
+			self.engine = PartitionedEngine(self, parts, scenarios = scenarios)
+		else:
+			print("Unknown loading engine %s" % engine)
+			raise utils.NotYetAttemptedException
+
+	def setProfiling(self, enabled = True):
+		"""
+		Starts (or, with enabled False, stops) accumulating loading times by phase and by link and node model;
+		starting again clears them.  With the reference engine the phases are those of loadNetwork's loop, with
+		another engine only its total time is recorded.  Read the times with profileStats.
+		"""
+		self.profile = Profile() if enabled else None
+
+	def setGridlockDetection(self, window = GRIDLOCK_WINDOW, check = GRIDLOCK_CHECK, tolerance = GRIDLOCK_TOLERANCE, enabled = True):
+		"""
+		Starts (or, with enabled False, stops) watching for gridlock while loading: loadNetwork then loads in
+		steps of check timesteps, and stops early once the network is gridlocked over the last window timesteps
+		(see checkGridlock), recording why in self.gridlock (None if loading ran to the end).  window should be
+		longer than the longest path's free-flow time and signal cycle, so that a network just starting to load
+		or a long red is not taken for gridlock.  Only one scenario can be watched.
+		"""
+		self.gridlockWatch = (window, check, tolerance) if enabled else None
+
+	def checkGridlock(self, t, window = GRIDLOCK_WINDOW, tolerance = GRIDLOCK_TOLERANCE):
+		"""
+		Checks the link counts over the window timesteps before time t (once loaded through t - 1) for gridlock,
+		where moving no more than tolerance vehicles counts as no flow.  Returns None, or a dictionary with the
+		'time' t, the 'cause' and the stalled 'links' (IDs of links holding vehicles that none entered or left):
+			throughput -- no vehicles terminated while some are still in the network
+			spillback --- some link is stalled, so its receiving flow is pinned at zero by a blocked link
+							  downstream (or a signal phase or meter that never serves it)
+		"""
+		if t < window:
+			return None
+		stalled = list()
+		terminated = 0
+		for ij, link in self.links.items():
+			up, down = link.upstreamTotal, link.downstreamTotal
+			inflow = up[t] - up[t - window]
+			outflow = down[t] - down[t - window]
+			if hasattr(self.nodes[link.head], 'isDestination'):
+				terminated += outflow
+			if up[t] - down[t] > tolerance and inflow <= tolerance and outflow <= tolerance:
+				stalled.append(ij)
+		if terminated <= tolerance and self.vehiclesInNetwork > tolerance:
+			return {'time' : t, 'cause' : 'throughput', 'links' : stalled}
+		if len(stalled) > 0:
+			return {'time' : t, 'cause' : 'spillback', 'links' : stalled}
+		return None
+
+	def profileStats(self):
+		"""
+		Returns the times accumulated since profiling started, as described in Profile.stats, or None if
+		profiling is off.
+		"""
+		return None if self.profile is None else self.profile.stats()
+
+	def memoryReport(self):
+		"""
+		Returns the bytes taken by the loading histories and path tables, as a dictionary of dictionaries:
+			structures -- bytes of each kind of storage: the links' upstreamPathCount, downstreamPathCount,
+							  upstreamTotal, downstreamTotal, travelTime and cells, the network's pathFlows and
+							  pathTravelTimes, and, with an engine, each of its arrays (prefixed 'engine ')
+			links ------- bytes held by each link (keyed by link ID), including its counts in the engine
+			paths ------- bytes held for each path: its path flows, travel times and any engine counts and demand
+		and the overall 'total'.  Objects shared between structures (such as path tuples, or counts carried
+		over from one timestep's dictionary to the next) are counted once, under the first structure listed.
+		"""
+		seen = set()
+		structures = dict()
+		links = {ij : 0 for ij in self.links}
+		paths = dict()
+		for name in ('pathFlows', 'pathTravelTimes'):
+			table = getattr(self, name)
+			seen.add(id(table))
+			structures[name] = sys.getsizeof(table)
+			for path in table:
+				size = utils.deepSize(path, seen) + utils.deepSize(table[path], seen)
+				structures[name] += size
+				paths[path] = paths.get(path, 0) + size
+		for name in ('upstreamPathCount', 'downstreamPathCount', 'upstreamTotal', 'downstreamTotal', 'travelTime', 'cells'):
+			structures[name] = 0
+			for ij in self.links:
+				size = utils.deepSize(getattr(self.links[ij], name, None), seen)
+				structures[name] += size
+				links[ij] += size
+		if self.engine is not None and hasattr(self.engine, 'memoryReport'):
+			engine = self.engine.memoryReport()
+			for name, size in engine['structures'].items():
+				structures['engine ' + name] = size
+			for ij, size in engine['links'].items():
+				links[ij] += size
+			for path, size in engine['paths'].items():
+				paths[path] = paths.get(path, 0) + size
+		return {'structures' : structures, 'links' : links, 'paths' : paths, 'total' : sum(structures.values())}
+
+	def setDetectorPeriod(self, period):
+		"""
+		Sets how many timesteps apart detectors sample speed and density, starting with the next loading.
+		"""
+		self.detectorPeriod = period
+		if hasattr(self, 'detectors'):
+			for ij in self.detectors:
+				self.detectors[ij].period = period
+
 	def getTotalVehicles(self,t):
 		return sum(link.vehiclesOnLink(t) for link in self.links.values())
 
 	def loadNetwork(self,r=None,init=True):
 		"""
 		Implements the network loading algorithm described in Chapter 10 of the text, using calls
-		to the Link and Node objects.
+		to the Link and Node objects.  Each link's detector is restarted at the beginning of r and
+		sampled every timestep, so getState can read the interval's measurements afterwards.
+
+		Loading also keeps running totals since the last initialization, which can be read at any
+		interval boundary without rescanning links or paths:
+			vehiclesInNetwork -- vehicles currently on links
+			totalLoaded ------ vehicles loaded at origins
+			totalTerminated -- vehicles terminated at destinations
+			TSTT ------------- total system travel time (sum over timesteps of vehicles in the network),
+									 which matches calculateTSTT over the loaded times
+			TFFT ------------- total free-flow travel time of the loaded vehicles, matching calculateTFFT
 		"""
 		if r is None:
 			r = range(self.timeHorizon)
 
+		# 1. Initialize
+		self.startLoading(r, init)
+		self.gridlock = None
+
+		if self.gridlockWatch is not None:
+			return self.loadWatched(r, init)
+		return self.loadRange(r, init)
+
+	def loadRange(self, r, init):
+		"""
+		The loop of loadNetwork over r, once loading has started, by the engine or the Link and Node objects.
+		Each phase is timed into self.profile when profiling (see setProfiling); otherwise the timer does nothing.
+		"""
+		profile = self.profile if self.profile is not None else NO_PROFILE
+		clock = profile.clock
+		if self.engine is not None:
+			start = clock()
+			result = self.engine.loadNetwork(r, init)
+			profile.add('engine', type(self.engine).__name__, clock() - start, len(r))
+			return result
+
 		loaded = 0
 		terminated = 0
-
-		# 1. Initialize; use dict's to store sending and receiving flows for each link
-		if init:
-			self.sendingFlow = dict()
-			self.receivingFlow = dict()
-			for ij in self.links: # Reset all counts
-				self.links[ij].upstreamPathCount = list()
-				self.links[ij].downstreamPathCount = list()
-				self.links[ij].upstreamPathCount.append(dict())
-				self.links[ij].downstreamPathCount.append(dict())
-			
+		linkKinds = {ij : type(self.links[ij]).__name__ for ij in self.links}
+		nodeKinds = [type(node).__name__ for node in self.nodes]
 		for t in r:
-			# print(t)
+			self.TSTT += self.vehiclesInNetwork
+
 			# 2. Calculate sending and receiving flows for all links
 			for ij in self.links:
+				start = clock()
 				self.sendingFlow[ij], self.receivingFlow[ij] = self.links[ij].linkUpdate(t)
+				profile.add('linkUpdate', linkKinds[ij], clock() - start)
 
 			for i in range(self.numNodes):
 				# Ignore centroids for now
 				if hasattr(self.nodes[i], 'isCentroid'): continue
 
-				# 3. Calculate transition flows for all nodes			
-				self.nodes[i].proportion = self.nodes[i].calculateProportions(t)	
+				# 3. Calculate transition flows for all nodes
+				start = clock()
+				self.nodes[i].proportion = self.nodes[i].calculateProportions(t)
+				proportionsDone = clock()
 				transitionFlows =  self.nodes[i].calculateTransitionFlows( { self.links[ij] : self.sendingFlow[ij] for ij in self.reverseStar[i] },
 																			{ self.links[ij] : self.receivingFlow[ij] for ij in self.forwardStar[i] },
 																			self.nodes[i].proportion, t)
+				transitionsDone = clock()
 				# 4. Move flow
 				self.nodes[i].moveFlow(transitionFlows, t)
-				
+				profile.add('calculateProportions', nodeKinds[i], proportionsDone - start)
+				profile.add('calculateTransitionFlows', nodeKinds[i], transitionsDone - proportionsDone)
+				profile.add('moveFlow', nodeKinds[i], clock() - transitionsDone)
+
 			# 5. Load trips at origins
-			loaded += self.loadTrips(t)
-			
+			start = clock()
+			loadedNow = self.loadTrips(t)
+			profile.add('loadTrips', 'OriginNode', clock() - start)
+			loaded += loadedNow
+
 			# 6. Terminate trips at destinations
-			terminated += self.terminateTrips(t)
+			start = clock()
+			terminatedNow = self.terminateTrips(t)
+			profile.add('terminateTrips', 'DestinationNode', clock() - start)
+			terminated += terminatedNow
+
+			self.totalLoaded += loadedNow
+			self.totalTerminated += terminatedNow
+			self.vehiclesInNetwork += loadedNow - terminatedNow
+
+			# 7. Sample detectors
+			start = clock()
+			for ij in self.detectors:
+				self.detectors[ij].sample(t)
+			profile.add('sampleDetectors', 'Detector', clock() - start)
 
 		return loaded, terminated
-			
+
+	def loadWatched(self, r, init):
+		"""
+		The loop of loadNetwork with gridlock detection on (see setGridlockDetection): loads r a few timesteps at
+		a time, checking for gridlock after each, and stops at the first.
+		"""
+		window, check, tolerance = self.gridlockWatch
+		if self.engine is not None and len(self.engine.scenarios) > 1:
+			print("Gridlock detection watches a single scenario, but the engine loads %d." % len(self.engine.scenarios))
+			raise utils.NotYetAttemptedException
+		loaded = 0
+		terminated = 0
+		for start in range(0, len(r), check):
+			part = r[start:start + check]
+			loadedNow, terminatedNow = self.loadRange(part, init and start == 0)
+			loaded += loadedNow
+			terminated += terminatedNow
+			self.gridlock = self.checkGridlock(part[-1] + 1, window, tolerance)
+			if self.gridlock is not None:
+				break
+		return loaded, terminated
+
+	def startLoading(self, r, init):
+		"""
+		The first step of loadNetwork: if init, resets all counts, detectors and running totals (using dict's
+		to store sending and receiving flows for each link), then restarts the detectors at the beginning of r.
+		"""
+		if init:
+			self.sendingFlow = dict()
+			self.receivingFlow = dict()
+			for ij in self.links: # Reset all counts
+				self.links[ij].resetCounts()
+			self.detectors = {ij : Detector(self.links[ij], self.detectorPeriod) for ij in self.links}
+			self.pathFreeFlowTimes = {path : sum(self.links[ij].freeFlowTime for ij in path) for path in self.pathFlows}
+			self.vehiclesInNetwork = 0
+			self.totalLoaded = 0
+			self.totalTerminated = 0
+			self.TSTT = 0.0
+			self.TFFT = 0.0
+		if len(r) > 0:
+			for ij in self.detectors:
+				self.detectors[ij].reset(r[0])
+
 	def loadTrips(self, t):
 		"""
 		Places flow at the upstream ends of paths.  Does NOT check to see if the link can accommodate these
@@ -294,9 +623,11 @@ class Network:
 			
 		for OD in self.ODs:
 			for path in OD.paths:
-				if self.pathFlows[path][t] > 0:
-					inFlows[path[0]][path] = self.pathFlows[path][t]
-					loaded += self.pathFlows[path][t]
+				flow = self.pathFlows[path][t]
+				if flow > 0:
+					inFlows[path[0]][path] = flow
+					loaded += flow
+					self.TFFT += flow * self.pathFreeFlowTimes[path]
 					
 		for ij in self.links:
 			if hasattr(self.nodes[self.links[ij].tail], 'isCentroid'):
@@ -501,13 +832,7 @@ class Network:
 						kj = float(inputs[5])
 						L = float(inputs[6])
 						qmax = float(inputs[7])
-						if	inputs[9] == 'PQ':  newLink = linkModel.PointQueueLink(self.timestep, uf, w, kj, L, qmax, qmax, inputs[0])
-						elif inputs[9] == 'SQ':  newLink = linkModel.SpatialQueueLink(self.timestep, uf, w, kj, L, qmax, qmax, inputs[0])
-						elif inputs[9] == 'CTM': newLink = linkModel.CellTransmissionModelLink(self.timestep, uf, w, kj, L, qmax, inputs[0])
-						elif inputs[9] == 'LTM': newLink = linkModel.LinkTransmissionModelLink(self.timestep, uf, w, kj, L, qmax, inputs[0])
-						else: 
-							print("Link model %s is not implemented." % inputs[9])
-							raise utils.BadFileFormatException
+						newLink = createLink(inputs[9], self.timestep, uf, w, kj, L, qmax, inputs[0])
 						newLink.tail = int(inputs[1]) - 1  # Convert from 1-based (input file) to 0-based (internal)
 						newLink.head = int(inputs[2]) - 1  # Convert from 1-based (input file) to 0-based (internal)
 						self.links[inputs[0]] = newLink
@@ -628,38 +953,15 @@ class Network:
 		return demand
 
 	"""
-	Calculate the TRTT from the difference in cumulative entrances and exits
+	Calculate the TRTT from the difference in cumulative entrances and exits: the area between the ramp's
+	arrival and meter departure curves (see dta.ncurves) for the vehicles entering between the start and end
+	time, counting vehicles still queued when loading stopped until then
 	"""
 	def rampTravelTime(self, start = 0, end = None):
 		if end is None:
 			end = self.timeHorizon
-
-		rtt = 0.0
-		inputProfile = self.ODs[1].demandRates
-		outputProfile = self.nodes[2].flows
-
-		flowToIgnore = sum(inputProfile[0:start])
-		inputCursor = start
-
-		outFlow = 0.0
-		t = 0
-		while outFlow + outputProfile[t] <= flowToIgnore:
-			outFlow += outputProfile[t]
-			t += 1
-		sli = 0.0
-		while inputCursor < end and t < self.timeHorizon:
-			while sli < inputProfile[inputCursor] and t < self.timeHorizon:
-				sli += outputProfile[t]
-				rtt += outputProfile[t]*(t-inputCursor)
-				t += 1
-			oic = inputCursor
-			inputCursor += 1
-			while inputCursor < end and inputProfile[inputCursor] == 0:
-				inputCursor += 1
-			rtt -= (sli - inputProfile[oic])*(inputCursor-oic)
-			sli = sli - inputProfile[oic]
-			
-		return rtt
+		up, down = ncurves.meterCurves(self.nodes[2])
+		return ncurves.totalTravelTime(up, down, start, min(end, len(up) - 1))
 
 	"""
 	Calculate the total demand entering on the ramp between the start and end time
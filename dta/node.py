@@ -1,3 +1,4 @@
+from copy import copy
 from .units import *
 
 class Node:
@@ -6,6 +7,16 @@ class Node:
       self.upstreamLinks = list(upstreamLinks)
       self.downstreamLinks = list(downstreamLinks)
    
+   def fork(self, links):
+      """
+      Returns a copy of this node attached to forked links; links is a dictionary mapping each original Link object
+      to its fork.  Subclasses holding further link references or mutable state extend this.
+      """
+      node = copy(self)
+      node.upstreamLinks = [links[ij] for ij in self.upstreamLinks]
+      node.downstreamLinks = [links[ij] for ij in self.downstreamLinks]
+      return node
+
    def updateNode(self, t):
       """
       updateNode performs all the computations needed for a node during network loading: calculating sending/receiving
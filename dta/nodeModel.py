@@ -48,6 +48,11 @@ class RampMeterNode(SeriesNode):
    def setParams(self,param):
       self.vpts = float(param)
 
+   def fork(self, links):
+      node = SeriesNode.fork(self, links)
+      node.flows = list(self.flows)
+      return node
+
 class DivergeNode(Node):
 
    def __init__(self, upstreamLinks, downstreamLinks):
@@ -102,6 +107,11 @@ class MergeNode(Node):
       if min(priority.values()) <= 0:
          print("Merge nodes must have strictly positive priority values for incoming links.")
          raise WrongNodeTypeException
+
+   def fork(self, links):
+      node = Node.fork(self, links)
+      node.priority = {links[ij] : self.priority[ij] for ij in self.priority}
+      return node
    
    def calculateTransitionFlows(self, sendingFlow, receivingFlow, proportion, t=None):
       transitionFlows = dict()   
@@ -170,6 +180,14 @@ class FullyProtectedIntersectionNode(Node):
       
       return transitionFlows
 
+   def fork(self, links):
+      node = Node.fork(self, links)
+      node.barriers = [barrier.fork(links) for barrier in self.barriers]
+      if self.currentBarrier is not None:
+         node.currentBarrier = self.currentBarrier.fork(links)
+      node.permissivePhases = [(links[i], links[j]) for (i, j) in self.permissivePhases]
+      return node
+
    def getActivePhases(self,t):
       barrier = self.getCurrentBarrier(t)
       return [ring.getActivePhase(t) for ring in barrier.getRings()]
@@ -190,20 +208,20 @@ class FullyProtectedIntersectionNode(Node):
          barrier.start(t)
       return barrier
 
-   def setParams(self,params):
-      if 'barrier 0' in params:
-         self.barriers[0].length = max(0,params['barrier 0'])
-      if 'barrier 1' in params:
-         self.barriers[1].length = max(0,params['barrier 1'])
-
-      if 'split 00' in params:
-         self.barriers[0].rings[0].split = params['split 00']
-      if 'split 01' in params:
-         self.barriers[0].rings[1].split = params['split 01']
-      if 'split 10' in params:
-         self.barriers[1].rings[0].split = params['split 10']
-      if 'split 11' in params:
-         self.barriers[1].rings[1].split = params['split 11']
+   def setParams(self,params,names=None):
+      """
+      Sets barrier lengths ('barrier b') and ring splits ('split br') from a dictionary keyed by parameter name,
+      or from a sequence of values (e.g. a slice of a configuration array) for the parameters in names.
+      """
+      if names is None:
+         names = list(params)
+         params = [params[name] for name in names]
+      for name, value in zip(names, params):
+         kind, index = name.split()
+         if kind == 'barrier':
+            self.barriers[int(index)].length = max(0,value)
+         elif kind == 'split':
+            self.barriers[int(index[0])].rings[int(index[1])].split = value
 
 class Barrier:
 
@@ -223,6 +241,11 @@ class Barrier:
          length = self.length
       return Barrier(self.rings,length)
 
+   def fork(self, links):
+      barrier = copy(self)
+      barrier.rings = [ring.fork(links, barrier) for ring in self.rings]
+      return barrier
+
 class Ring:
    def __init__(self,phases,split):
       self.phases = phases
@@ -233,6 +256,12 @@ class Ring:
       ring.barrier = barrier
       return ring
 
+   def fork(self, links, barrier):
+      ring = copy(self)
+      ring.phases = [(links[i], links[j]) for (i, j) in self.phases]
+      ring.barrier = barrier
+      return ring
+
    def getActivePhase(self,t):
       transition = self.barrier.length*max(0.0,min(1.0,self.split))
       if transition < t - self.barrier.startTime:
@@ -1,10 +1,9 @@
 from .network import Network
+from .replication import replicate
 import scipy.stats
 import numpy
 import math
-import threading
-
-sem = threading.Semaphore()
+from functools import partial
 """
 This method runs a base scenario featuring no ramp meter and seven scenarios
 for ramp meter timings (ranging from 2.5 to 5.5 seconds), builds a confidence
@@ -21,7 +20,7 @@ def main():
         xi,yi,xci,yci,xa,xaci = runSims(i,True)
         print("{},{},{},{},{},{},{}".format(0.5*i,xi,yi,xci,yci,xa,xaci))
 
-def runSims(i,useVars):
+def runSims(i,useVars,workers=None):
     #Statistical values
     n = 35
     alpha = 0.05
@@ -36,20 +35,10 @@ def runSims(i,useVars):
     freeVol = 3000
     rampVol = 600
     
-    #Measurement storage
-    tstt = list()   #total system travel times
-    astt = list()   #average vehicle travel times
-    trtt = list()   #control variates (total ramp meter travel time)
-    artt = list()   #average ramp travel time
-
-    #Run n simulations in parallel
-    thds = []
-    for j in range(n):
-        t = threading.Thread(target=indivSim, args=(i, seeds, j, freeVol, rampVol, trtt, tstt, astt, artt))
-        thds.append(t)
-        t.start()
-    for t in thds:
-        t.join()
+    #Run n simulations in parallel worker processes; results come back in seed order
+    results = replicate(partial(indivSim, i, freeVol, rampVol), seeds[:n], workers)
+    tstt = results['tstt']   #total system travel times
+    trtt = results['trtt']   #control variates (total ramp meter travel time)
 
     #Develop confidence intervals and begin constructing control variate
     tstm = numpy.mean(tstt) #Xbar
@@ -90,9 +79,9 @@ def runSims(i,useVars):
                 None, \
                 None
 
-def indivSim(i, seeds, j, freeVol, rampVol, trtt, tstt, astt, artt):
+def indivSim(i, freeVol, rampVol, seed):
     #Initialize the network and load vehicles onto it
-    net = Network(1/(0.5*i),seeds[j],freeVol,rampVol)
+    net = Network(1/(0.5*i),seed,freeVol,rampVol)
     net.initializePathFlows()
     net.loadNetwork()
 
@@ -103,13 +92,8 @@ def indivSim(i, seeds, j, freeVol, rampVol, trtt, tstt, astt, artt):
     td = net.demand(900,2700)
     rd = net.rampDemand(900,2700)
 
-    #Store the metrics
-    sem.acquire()
-    trtt.append(rtt)
-    tstt.append(t)
-    astt.append(t/td)
-    artt.append(rtt/rd)
-    sem.release()
+    #Return the metrics (average vehicle and average ramp travel times as well)
+    return {'tstt' : t, 'trtt' : rtt, 'astt' : t/td, 'artt' : rtt/rd}
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
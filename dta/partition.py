@@ -0,0 +1,294 @@
+"""
+Spatially partitioned network loading: the network is split into parts (e.g., freeway mainline and arterial, or
+stretches of a long corridor), each loaded by its own worker process, with the engine state in shared memory.
+A link belongs to the part of its downstream node; links whose upstream node is a loading node of another part
+are cut links.  Each timestep runs in three phases, separated by barriers:
+
+   links ---- every part updates its links and cells, computing their sending and receiving flows
+   nodes ---- every part moves flow through its nodes in the network's node order; flow entering a cut link is
+              written to the link's counts, but only counted (in the link's length of counts and its first
+              cell) in the next phase, so the part downstream sees the link as it was at the start of the step
+   trips ---- every part counts the held-back inflow of its cut links, loads trips onto its origin links and
+              terminates trips at its destinations
+
+Sending and receiving flows and path-disaggregated counts are read across parts straight from shared memory,
+so nothing is copied between processes while loading.  The results equal those of a FastEngine given the same
+cut links, in one process; for exactly the reference engine's results, do not partition.
+"""
+from multiprocessing import Process, Pipe, RawArray, Barrier
+import traceback
+import numpy
+from dta import kernels
+from dta import utils
+from dta.fastEngine import FastEngine
+
+class PartitionException(Exception):
+   pass
+
+def loadingNodes(network):
+   return [i for i, node in enumerate(network.nodes) if not hasattr(node, 'isCentroid')]
+
+def nodeParts(network, parts):
+   """
+   Returns the part of every node, given parts as lists of loading node indices.  Each destination joins the
+   part of the node upstream of its first incoming link (part 0 if that is an origin); origins have part -1.
+   """
+   nodePart = -numpy.ones(len(network.nodes), dtype=int)
+   for p, nodes in enumerate(parts):
+      if len(nodes) == 0:
+         print("Partition part %d has no nodes" % p)
+         raise PartitionException
+      nodePart[list(nodes)] = p
+   for i in loadingNodes(network):
+      if sum(i in nodes for nodes in parts) != 1:
+         print("Node %d must be in exactly one part of the partition" % i)
+         raise PartitionException
+   for i, node in enumerate(network.nodes):
+      if hasattr(node, 'isDestination'):
+         nodePart[i] = max(nodePart[node.upstreamLinks[0].tail], 0)
+   return nodePart
+
+def cutLinks(network, parts):
+   """
+   The IDs of links whose two ends are loading nodes in different parts.
+   """
+   nodePart = nodeParts(network, parts)
+   loading = set(loadingNodes(network))
+   return [ij for ij, link in network.links.items()
+           if link.tail in loading and link.head in loading and nodePart[link.tail] != nodePart[link.head]]
+
+def contiguousParts(network, numParts):
+   """
+   Splits the loading nodes, in node order, into numParts runs with about the same number of incident links.
+   """
+   nodes = loadingNodes(network)
+   if numParts > len(nodes):
+      print("Cannot split %d loading nodes into %d parts" % (len(nodes), numParts))
+      raise PartitionException
+   weights = numpy.cumsum([len(network.nodes[i].upstreamLinks) + len(network.nodes[i].downstreamLinks) for i in nodes])
+   starts = [0]
+   for p in range(1, numParts):
+      start = numpy.searchsorted(weights, weights[-1] * p / numParts, side='right')
+      # keep every part nonempty, however uneven the weights
+      starts.append(int(min(max(start, starts[-1] + 1), len(nodes) - numParts + p)))
+   starts.append(len(nodes))
+   return [nodes[starts[p]:starts[p + 1]] for p in range(numParts)]
+
+def signalParts(network):
+   """
+   Two parts: signalized intersections, and everything else (for the project network, the arterial and the
+   freeway with its ramp meters).
+   """
+   nodes = loadingNodes(network)
+   signals = [i for i in nodes if hasattr(network.nodes[i], 'barriers')]
+   return [[i for i in nodes if i not in signals], signals]
+
+class SharedState:
+   """
+   Arrays in shared memory, created from initial arrays in the parent and inherited by the workers; the NumPy
+   views are attributes named as in the dictionary they were made from.
+   """
+
+   def __init__(self, arrays):
+      self.layout = {name : (array.shape, array.dtype.str) for name, array in arrays.items()}
+      self.raw = {name : RawArray(array.dtype.char, max(array.size, 1)) for name, array in arrays.items()}
+      self.attach()
+      for name, array in arrays.items():
+         getattr(self, name)[...] = array
+
+   def attach(self):
+      for name, (shape, dtype) in self.layout.items():
+         size = int(numpy.prod(shape))
+         setattr(self, name, numpy.frombuffer(self.raw[name], dtype=dtype)[:size].reshape(shape))
+
+   def __getstate__(self):
+      return {'layout' : self.layout, 'raw' : self.raw}
+
+   def __setstate__(self, state):
+      self.__dict__.update(state)
+      self.attach()
+
+class Partition:
+   """
+   What one worker needs to load part p: the engine's link, slot, node and demand tables, and the links, cell
+   pairs, loading nodes, destinations, origin links, paths and cut links it updates.
+   """
+   TABLES = ('tolerance', 'kind', 'capacity', 'upstreamCapacity', 'maxVehicles', 'freeFlowTime', 'backwardWaveTime',
+             'firstCell', 'lastCell', 'cellCapacity', 'cellMaxVehicles', 'cellDelta', 'pairFrom', 'pairTo',
+             'slotStart', 'nextSlot', 'outLocal', 'firstSlot', 'demand', 'pathFreeFlowTime', 'inStart', 'inLinks',
+             'outStart', 'outLinks', 'priorityArray', 'meterIndex', 'signalIndex', 'cut')
+
+   def __init__(self, engine, p, nodePart):
+      for name in self.TABLES:
+         setattr(self, name, getattr(engine, name))
+      self.p = p
+      self.nodeKind = numpy.array(engine.nodeKind, dtype=int)
+      self.numSignals = len(engine.signals)
+      linkPart = nodePart[[engine.network.links[ij].head for ij in engine.linkIDs]]
+      cellLink = numpy.zeros(len(self.cellCapacity), dtype=int)
+      for l in engine.ctmLinks:
+         cellLink[self.firstCell[l]:self.lastCell[l] + 1] = l
+      slotLink = numpy.searchsorted(self.slotStart, numpy.arange(engine.numSlots), side='right') - 1
+      self.links = numpy.flatnonzero(linkPart == p)
+      self.pairs = numpy.flatnonzero(linkPart[cellLink[self.pairFrom]] == p)
+      self.nodes = numpy.array([i for i in engine.loadingNodes if nodePart[i] == p], dtype=int)
+      self.destinations = numpy.array([i for i in engine.destinationNodes if nodePart[i] == p], dtype=int)
+      self.originLinks = numpy.array([l for l in engine.originLinks if linkPart[l] == p], dtype=int)
+      self.paths = numpy.flatnonzero(linkPart[slotLink[self.firstSlot]] == p)
+      self.cutIn = numpy.array([l for l in engine.cutIndices if linkPart[l] == p], dtype=int)
+
+   def load(self, t0, t1, phaseStart, phaseIn, phaseOut, vpts, state, barrier):
+      """
+      Loads this part over times t0 to t1 - 1 in step with the other workers.
+      """
+      K = state.up.shape[0]
+      cellFlow = numpy.zeros(len(self.pairFrom))
+      disaggregate = numpy.zeros(len(self.nextSlot))
+      inflow = numpy.zeros(len(self.nextSlot))
+      proportion, transition, current, remaining = kernels.nodeScratch(self.inStart, self.outStart)
+      loaded = state.loaded[self.p, :, t0:t1]
+      terminated = state.terminated[self.p, :, t0:t1]
+      freeFlowTravelTime = state.freeFlowTravelTime[self.p, :, t0:t1]
+      meterFlows = state.meterFlows[:, t0:t1]
+
+      for t in range(t0, t1):
+         n = t - t0
+         for k in range(K):
+            kernels.linkUpdate(t, self.links, self.kind, self.capacity, self.upstreamCapacity, self.maxVehicles,
+                               self.freeFlowTime, self.backwardWaveTime, self.firstCell, self.lastCell,
+                               self.cellCapacity, self.cellMaxVehicles, self.cellDelta, state.cellVehicles[k],
+                               state.upTotal[k], state.downTotal[k], state.sendingFlow[k], state.receivingFlow[k])
+            kernels.cellUpdate(self.pairs, self.pairFrom, self.pairTo, self.cellCapacity, self.cellMaxVehicles,
+                               self.cellDelta, state.cellVehicles[k], cellFlow)
+         barrier.wait()
+         for k in range(K):
+            kernels.moveNodes(t, n, k, K, self.tolerance, self.nodes,
+                              self.kind, self.lastCell, self.firstCell, self.cellCapacity, self.slotStart,
+                              self.nextSlot, self.outLocal, self.nodeKind, self.inStart, self.inLinks, self.outStart,
+                              self.outLinks, self.priorityArray, vpts[k], self.meterIndex, self.signalIndex,
+                              self.numSignals, phaseStart, phaseIn, phaseOut,
+                              state.cellVehicles[k], state.up[k], state.down[k], state.upTotal[k], state.downTotal[k],
+                              state.upLength[k], state.downLength[k], self.cut, state.deferred[k], meterFlows[k],
+                              state.sendingFlow[k], state.receivingFlow[k], disaggregate, inflow, proportion,
+                              transition, current, remaining)
+         barrier.wait()
+         for k in range(K):
+            kernels.releaseInflows(self.cutIn, self.kind, self.firstCell, state.upLength[k], state.cellVehicles[k],
+                                   state.deferred[k])
+            kernels.loadTrips(t, n, self.originLinks, self.paths, self.kind, self.firstCell, self.slotStart,
+                              self.firstSlot, self.demand[k], self.pathFreeFlowTime, state.cellVehicles[k],
+                              state.up[k], state.upTotal[k], state.upLength[k], self.cut, state.deferred[k],
+                              loaded[k], freeFlowTravelTime[k], inflow)
+            kernels.terminateTrips(t, n, self.destinations, self.tolerance, self.kind, self.lastCell,
+                                   self.cellCapacity, self.slotStart, self.inStart, self.inLinks,
+                                   state.cellVehicles[k], state.up[k], state.down[k], state.upTotal[k],
+                                   state.downTotal[k], state.upLength[k], state.downLength[k], terminated[k],
+                                   state.sendingFlow[k], disaggregate)
+
+def worker(remote, parentRemote, partition, state, barrier):
+   """
+   Loads one part whenever the engine sends a range; replies None when done, or the traceback of an error
+   (after breaking the barrier, so the other workers stop too).  None from the engine closes the worker.
+   """
+   parentRemote.close()
+   try:
+      while True:
+         command = remote.recv()
+         if command is None:
+            break
+         try:
+            partition.load(*command, state, barrier)
+            remote.send(None)
+         except Exception:
+            barrier.abort()
+            remote.send(traceback.format_exc())
+   finally:
+      remote.close()
+
+class PartitionedEngine(FastEngine):
+   """
+   A FastEngine whose loading loop runs in one worker process per part.  parts is either a list of lists of
+   loading node indices or a number of parts for contiguousParts.  The state arrays live in shared memory, so
+   everything FastEngine offers after loading (link totals, pathCount, detectors, running totals) works as
+   usual; loads over ranges that are not contiguous run in this process with the NumPy methods.  Workers start
+   at each initializing load; forks are FastEngines with the same cut links (so they load identically, in one
+   process).  The workers run the loop kernels, so Numba must be installed.
+   """
+
+   def __init__(self, network, parts, tolerance = 0.01, scenarios = None):
+      if not kernels.HAVE_NUMBA:
+         print("Partitioned loading needs Numba: without it the workers would run the loop kernels interpreted.")
+         raise utils.NotYetAttemptedException
+      if isinstance(parts, int):
+         parts = contiguousParts(network, parts)
+      self.parts = parts
+      self.processes = list()
+      FastEngine.__init__(self, network, tolerance, True, scenarios, cutLinks(network, parts))
+
+   def reset(self):
+      """
+      Allocates the state in shared memory and (re)starts the workers.
+      """
+      FastEngine.reset(self)
+      self.close()
+      K = len(self.scenarios)
+      P = len(self.parts)
+      rows = self.network.timeHorizon + 2
+      arrays = {name : getattr(self, name) for name in ('up', 'down', 'upTotal', 'downTotal', 'upLength', 'downLength',
+                                                        'deferred', 'cellVehicles')}
+      arrays['sendingFlow'] = numpy.zeros((K, self.numLinks))
+      arrays['receivingFlow'] = numpy.zeros((K, self.numLinks))
+      for name in ('loaded', 'terminated', 'freeFlowTravelTime'):
+         arrays[name] = numpy.zeros((P, K, rows))
+      arrays['meterFlows'] = numpy.zeros((K, rows, len(self.meters)))
+      self.state = SharedState(arrays)
+      for name in ('up', 'down', 'upTotal', 'downTotal', 'upLength', 'downLength', 'deferred', 'cellVehicles'):
+         setattr(self, name, getattr(self.state, name))
+      self.attach()
+
+      nodePart = nodeParts(self.network, self.parts)
+      self.barrier = Barrier(P)
+      self.remotes, workerRemotes = zip(*[Pipe() for p in range(P)])
+      self.processes = list()
+      for p in range(P):
+         process = Process(target=worker, args=(workerRemotes[p], self.remotes[p], Partition(self, p, nodePart),
+                                                self.state, self.barrier), daemon=True)
+         process.start()
+         workerRemotes[p].close()
+         self.processes.append(process)
+
+   def close(self):
+      """
+      Stops the workers, if running.
+      """
+      for p, process in enumerate(self.processes):
+         self.remotes[p].send(None)
+         process.join()
+         self.remotes[p].close()
+      self.processes = list()
+
+   def loadCompiled(self, r, phaseStart, phaseIn, phaseOut, vpts, loaded, terminated, freeFlowTravelTime, meterFlows):
+      """
+      The loading loop of loadNetwork, run by the workers.
+      """
+      t0, t1 = r[0], r[-1] + 1
+      for remote in self.remotes:
+         remote.send((t0, t1, phaseStart, phaseIn, phaseOut, vpts))
+      errors = [error for error in (remote.recv() for remote in self.remotes) if error is not None]
+      if len(errors) > 0:
+         self.barrier.reset()
+         # the other workers only report the broken barrier
+         errors.sort(key=lambda error: 'BrokenBarrierError' in error)
+         print("Partitioned loading failed in a worker:\n%s" % errors[0])
+         raise PartitionException
+      loaded[:] = self.state.loaded[:, :, t0:t1].sum(axis=0)
+      terminated[:] = self.state.terminated[:, :, t0:t1].sum(axis=0)
+      freeFlowTravelTime[:] = self.state.freeFlowTravelTime[:, :, t0:t1].sum(axis=0)
+      meterFlows[:] = self.state.meterFlows[:, t0:t1]
+
+   def fork(self, network):
+      engine = FastEngine.fork(self, network)
+      for name in ('parts', 'processes', 'remotes', 'barrier', 'state'):
+         engine.__dict__.pop(name, None)
+      engine.jit = kernels.HAVE_NUMBA
+      return engine
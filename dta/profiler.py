@@ -0,0 +1,58 @@
+import time
+
+PHASES = ['linkUpdate', 'calculateProportions', 'calculateTransitionFlows', 'moveFlow', 'loadTrips', 'terminateTrips',
+          'sampleDetectors', 'engine']
+
+class Profile:
+    """
+    Accumulates wall time and call counts of network loading, by phase and, within each phase, by the link or
+    node model (or loading engine) doing the work.  Network.setProfiling attaches one to a network, and the
+    loading loop then times its phases with clock and records them with add.
+    """
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all times and counts.
+        """
+        self.seconds = dict()
+        self.calls = dict()
+
+    def add(self, phase, kind, seconds, calls=1):
+        key = (phase, kind)
+        self.seconds[key] = self.seconds.get(key, 0.0) + seconds
+        self.calls[key] = self.calls.get(key, 0) + calls
+
+    def stats(self):
+        """
+        Returns the accumulated times as a dictionary of dictionaries: the first key is the phase (in the order of
+        PHASES), the second the link or node model, and each value a dictionary with the total 'seconds' and the
+        number of 'calls'.
+        """
+        stats = dict()
+        for phase, kind in sorted(self.seconds, key=lambda key: (PHASES.index(key[0]), key[1])):
+            stats.setdefault(phase, dict())[kind] = {'seconds' : self.seconds[phase, kind], 'calls' : self.calls[phase, kind]}
+        return stats
+
+    def total(self):
+        """
+        Returns the total time, in seconds, over all phases.
+        """
+        return sum(self.seconds.values())
+
+class NoProfile:
+    """
+    The timer the loading loop uses when profiling is off: its clock and add do nothing.
+    """
+
+    @staticmethod
+    def clock():
+        return 0.0
+
+    def add(self, phase, kind, seconds, calls=1):
+        pass
+
+NO_PROFILE = NoProfile()
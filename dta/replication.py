@@ -0,0 +1,49 @@
+"""
+Parallel replications: runs a simulation for many demand seeds in worker processes (network loading is pure
+Python, so threads would run one at a time under the GIL) and collects the measures each replication returns
+into one structured array.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+import numpy.random as random
+
+def replicationSeeds(n, seed=1883):
+    """
+    The demand seeds of n replications, drawn from seed: the same seed always gives the same replications, and
+    the first k of n seeds are the seeds of k replications.
+    """
+    return [int(s) for s in random.RandomState(seed).randint(2**31 - 1, size=n)]
+
+def results(seeds, measures):
+    """
+    A structured array with one row per replication: its 'seed' and one float field per measure, from the list of
+    measure dictionaries the replications returned.
+    """
+    names = list(measures[0]) if len(measures) > 0 else []
+    rows = numpy.zeros(len(seeds), dtype=[('seed', 'i8')] + [(name, 'f8') for name in names])
+    rows['seed'] = seeds
+    for name in names:
+        rows[name] = [m[name] for m in measures]
+    return rows
+
+def replicate(simulate, seeds, workers=None, chunksize=None, pool=None):
+    """
+    Runs simulate(seed) for every seed in seeds, where simulate is a picklable callable (a module-level function,
+    functools.partial of one, or an object such as experiment.RampMeterRun) returning a dictionary of measures,
+    and returns them as a structured array in the order of seeds (see results).  Replications are submitted to a
+    pool of workers processes (by default one per CPU; 0 runs them in this process) in chunks of chunksize
+    seeds, by default about four chunks per worker.  An open ProcessPoolExecutor may be passed as pool to reuse
+    its workers across calls.
+    """
+    seeds = [int(seed) for seed in seeds]
+    if workers == 0 and pool is None:
+        return results(seeds, [simulate(seed) for seed in seeds])
+    if workers is None:
+        workers = os.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, len(seeds) // (4 * workers))
+    if pool is not None:
+        return results(seeds, list(pool.map(simulate, seeds, chunksize=chunksize)))
+    with ProcessPoolExecutor(workers) as pool:
+        return results(seeds, list(pool.map(simulate, seeds, chunksize=chunksize)))
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy
+from dta import nodeModel
+from .network import Network, ArrayOD, DemandStream, StreamOD, StreamRates, createLink
+
+# bump when the compiled form changes, so that cached compilations of older versions are not read
+SPEC_VERSION = 1
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'dta-specs')
+CONTROLLER_KINDS = ['meter', 'signal']
+# timesteps of demand drawn at a time by streamDemand
+STREAM_BLOCK = 3600
+
+class SpecException(Exception):
+    pass
+
+def specError(message):
+    print("Network specification error: %s" % message)
+    raise SpecException
+
+def readSpec(specFile, cacheDir=CACHE_DIR):
+    """
+    Returns the compiled form of the JSON network specification in specFile (see compileSpec).  Compilations
+    are cached in cacheDir under the hash of the specification's contents, so a specification is only
+    validated and its paths found the first time it is read; cacheDir None turns the cache off.
+    """
+    with open(specFile, 'rb') as f:
+        text = f.read()
+    key = hashlib.sha256(b'%d\n' % SPEC_VERSION + text).hexdigest()
+    cached = None if cacheDir is None else os.path.join(cacheDir, key + '.json')
+    if cached is not None and os.path.exists(cached):
+        with open(cached) as f:
+            return json.load(f)
+    compiled = compileSpec(json.loads(text))
+    compiled['hash'] = key
+    if cached is not None:
+        os.makedirs(cacheDir, exist_ok=True)
+        # write under a temporary name first, so that concurrent readers never see a partial file
+        partial = '%s.%d' % (cached, os.getpid())
+        with open(partial, 'w') as f:
+            json.dump(compiled, f)
+        os.replace(partial, cached)
+    return compiled
+
+def compileSpec(spec):
+    """
+    Validates a network specification and compiles it into integer-indexed tables.  The specification is a
+    dictionary with
+        timestep --- the timestep in seconds
+        linkTypes -- named link parameters: model ('PQ', 'SQ', 'CTM' or 'LTM'), freeFlowSpeed and
+                      backwardWaveSpeed (mi/hr) and jamDensity (veh/mi)
+        links ------ in order, each with an id, a type and its length (ft) and capacity (veh/hr)
+        nodes ------ in order, each with an id, a kind ('origin', 'destination', 'series', 'meter', 'diverge',
+                      'merge' or 'signal') and the ids of the links entering ('in') and leaving ('out') it, which
+                      also place the links; merges give the priorities of their in links, and signals their
+                      barriers (each a list of rings, each with two phases and a split) and permissive phases,
+                      phases being [in link, out link] pairs
+        ODs -------- in order, each with origin ('from') and destination ('to') node ids and the key of its
+                      volume in the volumes passed to setDemand
+    The compiled form holds the links as [id, model, freeFlowSpeed, backwardWaveSpeed, jamDensity, length,
+    capacity, tail, head] rows, the nodes with link indices in place of ids, the node index of each meter and
+    signal (the controllers, by node id), the ODs as [origin, destination, volume] rows, every simple path of
+    each OD as lists of link indices, and the index among them of the path a free-flow all-or-nothing
+    assignment would use.
+    """
+    links = spec['links']
+    linkIndex = dict()
+    for l, link in enumerate(links):
+        if link['id'] in linkIndex:
+            specError("link %s is listed twice" % link['id'])
+        if link['type'] not in spec['linkTypes']:
+            specError("link %s has unknown type %s" % (link['id'], link['type']))
+        linkIndex[link['id']] = l
+    nodeIndex = {node['id'] : i for i, node in enumerate(spec['nodes'])}
+    if len(nodeIndex) != len(spec['nodes']):
+        specError("node ids are not unique")
+
+    def index(ij, where):
+        if ij not in linkIndex:
+            specError("%s refers to unknown link %s" % (where, ij))
+        return linkIndex[ij]
+
+    tails = [None] * len(links)
+    heads = [None] * len(links)
+    nodes = list()
+    for i, node in enumerate(spec['nodes']):
+        ins = [index(ij, node['id']) for ij in node.get('in', [])]
+        outs = [index(ij, node['id']) for ij in node.get('out', [])]
+        for l in ins:
+            if heads[l] is not None:
+                specError("link %s enters both %s and %s" % (links[l]['id'], spec['nodes'][heads[l]]['id'], node['id']))
+            heads[l] = i
+        for l in outs:
+            if tails[l] is not None:
+                specError("link %s leaves both %s and %s" % (links[l]['id'], spec['nodes'][tails[l]]['id'], node['id']))
+            tails[l] = i
+        kind = node['kind']
+        valid = {'origin' : len(ins) == 0 and len(outs) > 0,
+                 'destination' : len(ins) > 0 and len(outs) == 0,
+                 'series' : len(ins) == 1 and len(outs) == 1,
+                 'meter' : len(ins) == 1 and len(outs) == 1,
+                 'diverge' : len(ins) == 1 and len(outs) > 0,
+                 'merge' : len(ins) > 0 and len(outs) == 1 and len(node.get('priorities', [])) == len(ins),
+                 'signal' : len(ins) > 0 and len(outs) > 0}
+        if kind not in valid:
+            specError("node %s has unknown kind %s" % (node['id'], kind))
+        if not valid[kind]:
+            specError("node %s has the wrong links (or priorities) for a %s node" % (node['id'], kind))
+        compiled = {'kind' : kind, 'in' : ins, 'out' : outs}
+        if kind == 'merge':
+            compiled['priorities'] = node['priorities']
+        if kind == 'signal':
+            def phase(p):
+                if p[0] not in node['in'] or p[1] not in node['out']:
+                    specError("signal %s has a phase from %s to %s, which do not enter and leave it" % (node['id'], p[0], p[1]))
+                return [linkIndex[p[0]], linkIndex[p[1]]]
+            compiled['barriers'] = [[[ring['split'], [phase(p) for p in ring['phases']]] for ring in barrier['rings']]
+                                    for barrier in node['barriers']]
+            compiled['permissive'] = [phase(p) for p in node.get('permissive', [])]
+        nodes.append(compiled)
+    for l, link in enumerate(links):
+        if tails[l] is None or heads[l] is None:
+            specError("link %s is not attached at both ends" % link['id'])
+
+    compiledLinks = list()
+    for l, link in enumerate(links):
+        linkType = spec['linkTypes'][link['type']]
+        compiledLinks.append([link['id'], linkType['model'], linkType['freeFlowSpeed'], linkType['backwardWaveSpeed'],
+                              linkType['jamDensity'], link['length'], link['capacity'], tails[l], heads[l]])
+
+    ODs = list()
+    for od in spec['ODs']:
+        for end, kind in (('from', 'origin'), ('to', 'destination')):
+            if od[end] not in nodeIndex or nodes[nodeIndex[od[end]]]['kind'] != kind:
+                specError("OD %s -> %s: %s is not an %s node" % (od['from'], od['to'], od[end], kind))
+        ODs.append([nodeIndex[od['from']], nodeIndex[od['to']], od['volume']])
+
+    compiled = {'version' : SPEC_VERSION, 'timestep' : spec['timestep'], 'links' : compiledLinks, 'nodes' : nodes,
+                'nodeIDs' : [node['id'] for node in spec['nodes']],
+                'controllers' : {spec['nodes'][i]['id'] : i for i, node in enumerate(nodes) if node['kind'] in CONTROLLER_KINDS},
+                'ODs' : ODs}
+
+    # find paths on the network itself, as finalizeODs and initializePathFlows would
+    net = SpecNetwork(compiled, sum(SpecNetwork.linkFreeFlowTimes(compiled)) + 1)
+    originPaths = {origin : net.enumeratePaths(origin) for origin in set(od[0] for od in ODs)}
+    compiled['paths'] = list()
+    compiled['initialPaths'] = list()
+    for origin, destination, volume in ODs:
+        paths = [path for path in originPaths[origin] if net.links[path[-1]].head == destination]
+        if len(paths) == 0:
+            specError("no paths from %s to %s" % (compiled['nodeIDs'][origin], compiled['nodeIDs'][destination]))
+        cost, backlink = net.TDSP(origin, 0)
+        shortest = list()
+        i = destination
+        while i != origin:
+            shortest.insert(0, backlink[i])
+            i = net.links[backlink[i]].tail
+        compiled['paths'].append([[linkIndex[ij] for ij in path] for path in paths])
+        compiled['initialPaths'].append(paths.index(tuple(shortest)))
+    return compiled
+
+def periodic(values, times):
+    """
+    values at the given times: a constant, or an array of values per timestep repeating with its length.
+    """
+    values = numpy.asarray(values, dtype=float)
+    return numpy.broadcast_to(values, times.shape) if values.ndim == 0 else values[times % len(values)]
+
+class SpecNetwork(Network):
+    """
+    A network built from a compiled specification (see compileSpec), or from a specification file, which is
+    compiled or read from the cache by readSpec.  Links and nodes are created straight from the compiled tables
+    (in the order the specification lists them), controllers are addressed by name, and the specification's
+    paths and free-flow assignment replace path enumeration in finalizeODs and shortest path searches in
+    initializePathFlows.
+    """
+
+    def __init__(self, spec, timeHorizon=3600, cacheDir=CACHE_DIR):
+        self.spec = spec if isinstance(spec, dict) else readSpec(spec, cacheDir)
+        self.timestep = self.spec['timestep']
+        self.timeHorizon = timeHorizon
+        self.numLinks = len(self.spec['links'])
+        self.numNodes = len(self.spec['nodes'])
+        self.controllers = self.spec['controllers']
+        self.linkPriorities = dict()
+        self.totalDemand = 0.0
+        self.detectorPeriod = 1
+        self.engine = None
+        self.profile = None
+        self.gridlockWatch = None
+        self.gridlock = None
+        self.ODs = list()
+        self.stream = None
+        self.reset()
+
+    @staticmethod
+    def linkFreeFlowTimes(spec):
+        return [createLink(model, spec['timestep'], uf, w, kj, L, q, ij).freeFlowTime
+                for ij, model, uf, w, kj, L, q, tail, head in spec['links']]
+
+    def reset(self):
+        """
+        Rebuilds the links and nodes, with empty path tables, as at construction.
+        """
+        self.pathFlows = dict()
+        self.pathTravelTimes = dict()
+        self.linkIDs = list()
+        self.links = dict()
+        for ij, model, uf, w, kj, L, q, tail, head in self.spec['links']:
+            link = createLink(model, self.timestep, uf, w, kj, L, q, ij)
+            link.tail = tail
+            link.head = head
+            self.links[ij] = link
+            self.linkIDs.append(ij)
+        links = [self.links[ij] for ij in self.linkIDs]
+        self.nodes = list()
+        for node in self.spec['nodes']:
+            ins = [links[l] for l in node['in']]
+            outs = [links[l] for l in node['out']]
+            kind = node['kind']
+            if kind == 'origin':          self.nodes.append(nodeModel.OriginNode(ins, outs))
+            elif kind == 'destination':   self.nodes.append(nodeModel.DestinationNode(ins, outs))
+            elif kind == 'series':        self.nodes.append(nodeModel.SeriesNode(ins, outs))
+            elif kind == 'meter':         self.nodes.append(nodeModel.RampMeterNode(ins, outs))
+            elif kind == 'diverge':       self.nodes.append(nodeModel.DivergeNode(ins, outs))
+            elif kind == 'merge':         self.nodes.append(nodeModel.MergeNode(ins, outs, dict(zip(ins, node['priorities']))))
+            else:
+                barriers = [nodeModel.Barrier([nodeModel.Ring([(links[i], links[j]) for i, j in phases], split)
+                                               for split, phases in rings], None) for rings in node['barriers']]
+                permissivePhases = [(links[i], links[j]) for i, j in node['permissive']]
+                self.nodes.append(nodeModel.FullyProtectedIntersectionNode(ins, outs, barriers, permissivePhases))
+        self.finalizeLinks()
+
+    def setConfig(self, config):
+        """
+        Sets controller parameters from a dictionary keyed by controller (meter or signal node id), whose values
+        are passed to the controller's setParams.
+        """
+        for c in config:
+            self.nodes[self.controllers[c]].setParams(config[c])
+
+    def setDemand(self, volumes, rng, profile=None):
+        """
+        Draws Poisson demand for every OD pair at the rate volumes gives for its volume key, either a constant
+        rate or an array of rates, one per timestep.  If given, profile (an array with one factor per timestep,
+        e.g. from volumes.piecewiseProfile) scales every rate over the time of day.  All OD pairs are drawn at
+        once into self.demand, with one row per OD pair in the specification's order (the same numbers as
+        drawing each OD pair's demand in turn), and each OD's demandRates is its row.
+        """
+        T = self.timeHorizon
+        rates = numpy.array([numpy.broadcast_to(volumes[volume], (T,)) for origin, destination, volume in self.spec['ODs']], dtype=float)
+        if profile is not None:
+            rates = rates * numpy.asarray(profile, dtype=float)[:T]
+        self.useDemand(rng.poisson(rates, (len(rates), T)))
+
+    def streamDemand(self, volumes, rng, profile=None, blockSize=STREAM_BLOCK):
+        """
+        Streams Poisson demand at the rates setDemand draws, blockSize timesteps at a time, so that loading can
+        run past timeHorizon without drawing the demand in advance.  Only demand is held in constant memory: the
+        link counts and path counts kept while loading still grow with the number of timesteps loaded.  Each OD's demandRates (and the path flows set by
+        initializePathFlows) read from one DemandStream, which draws all OD pairs' next block as loading reaches
+        it; rates and profile given as arrays repeat with their length (e.g. a daily profile).  The draws are not
+        those of setDemand with the same rng, and totalDemand is not known in advance, so it is left unchanged.
+        Loading must use the reference engine.
+        """
+        def blocks():
+            start = 0
+            while True:
+                times = numpy.arange(start, start + blockSize)
+                rates = numpy.array([periodic(volumes[volume], times) for origin, destination, volume in self.spec['ODs']])
+                if profile is not None:
+                    rates = rates * periodic(profile, times)
+                yield rng.poisson(rates)
+                start += blockSize
+        self.stream = DemandStream(blocks())
+        self.ODs = [StreamOD(origin, destination, StreamRates(self.stream, k)) for k, (origin, destination, volume) in enumerate(self.spec['ODs'])]
+
+    def useDemand(self, demand):
+        """
+        Sets the demand to a matrix already drawn, with one row per OD pair in the specification's order and one
+        column per timestep, as setDemand draws it (for instance a row of a demand bank, see DemandBank).
+        """
+        self.demand = demand
+        self.stream = None
+        self.ODs = [ArrayOD(origin, destination, self.demand[k]) for k, (origin, destination, volume) in enumerate(self.spec['ODs'])]
+        self.totalDemand += self.demand.sum()
+
+    def finalizeODs(self):
+        """
+        Gives each OD pair the paths found when the specification was compiled, and sets their travel times to
+        free flow, as calculatePathTravelTimes does on a network with free-flow link travel times (except with
+        streamed demand, where a travel time per timestep of the horizon would grow with it).
+        """
+        for od, paths in zip(self.ODs, self.spec['paths']):
+            od.paths = [tuple(self.linkIDs[l] for l in path) for path in paths]
+            if self.stream is not None:
+                continue
+            for path in od.paths:
+                self.pathTravelTimes[path] = dict.fromkeys(range(self.timeHorizon), sum(self.links[ij].freeFlowTime for ij in path))
+
+    def initializePathFlows(self):
+        """
+        Assigns all of each OD pair's demand to its free-flow shortest path, the all-or-nothing assignment
+        Network.initializePathFlows gives on a network whose travel times are at free flow.  Streamed demand
+        (see streamDemand) is assigned the same way, with path flows reading the stream.
+        """
+        if self.stream is not None:
+            for k, (od, initial) in enumerate(zip(self.ODs, self.spec['initialPaths'])):
+                for p, path in enumerate(od.paths):
+                    self.pathFlows[path] = StreamRates(self.stream, k, 1.0 if p == initial else 0.0)
+            return
+        for od, initial in zip(self.ODs, self.spec['initialPaths']):
+            for path in od.paths:
+                self.pathFlows[path] = [0 for t in range(self.timeHorizon)]
+            self.pathFlows[od.paths[initial]] = (od.demandRates * 1.0).tolist()
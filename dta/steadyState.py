@@ -0,0 +1,193 @@
+"""
+Analytic initialization of a network's loading state, in place of simulating a warmup from an empty network.
+Every path carries its mean demand rate from its origin; each link passes on at most its outflow capacity (its
+capacity, limited by the green shares of its movements at a signal and by a ramp meter's rate), the demand it
+cannot pass queues on it, and a queue that outgrows its link holds back the links upstream.  Cumulative counts
+through the start time follow from these rates and the links' free-flow times, and cell transmission model
+cells hold the vehicles that entered over the last free-flow time, with queued vehicles packed into the
+downstream cells.  This is an approximation: it ignores start-up and blocking losses at signals, so it
+typically starts with fewer vehicles queued than a simulated warmup would leave, and a settling period helps.
+Loading then continues from the start time (e.g. over a short settling period before an episode), with the
+reference or the fast engine.
+"""
+from collections import Counter
+import numpy
+from . import linkModel
+from . import nodeModel
+from .partition import PartitionedEngine
+
+def greenShares(node, cycles=4):
+    """
+    The share of time each movement (a pair of incoming and outgoing links) of a signal has an active or permissive
+    phase, over cycles signal cycles of a fork of node (so its own timing state is untouched).
+    """
+    links = {link : link for link in node.upstreamLinks + node.downstreamLinks}
+    signal = node.fork(links)
+    signal.currentBarrier = None
+    signal.currentIdx = 0
+    length = int(sum(barrier.length + 1 for barrier in node.barriers) * cycles) or 1
+    active = Counter()
+    for t in range(length):
+        for movement in set(signal.getActivePhases(t)):
+            active[movement] += 1
+    shares = {movement : count / length for movement, count in active.items()}
+    for movement in node.getPermissivePhases(0):
+        shares[movement] = 1.0
+    return shares
+
+def outflowCapacities(net, turns):
+    """
+    Each link's outflow capacity per timestep, given the share of its flow turning onto each next link (turns, a
+    dictionary keyed by (link ID, next link ID)): its capacity, limited at a ramp meter by the meter rate and at
+    a signal by its most constraining movement, since vehicles leave in order (a movement with green for a
+    share g of the cycle, carrying a share f of the link's flow, allows at most capacity * g / f).
+    """
+    capacities = {ij : net.links[ij].capacity for ij in net.links}
+    for node in net.nodes:
+        if isinstance(node, nodeModel.FullyProtectedIntersectionNode):
+            shares = greenShares(node)
+            for inLink in node.upstreamLinks:
+                for outLink in node.downstreamLinks:
+                    f = turns.get((inLink.ID, outLink.ID), 0.0)
+                    if f > 0:
+                        g = shares.get((inLink, outLink), 0.0)
+                        capacities[inLink.ID] = min(capacities[inLink.ID], inLink.capacity * g / f)
+        elif isinstance(node, nodeModel.RampMeterNode):
+            link = node.upstreamLinks[0]
+            capacities[link.ID] = min(capacities[link.ID], node.vpts)
+    return capacities
+
+def steadyRates(net, rates, start, iterations=None):
+    """
+    The rate at which each path's flow enters each of its links, as a dictionary keyed by (path, position), and the
+    share of each link's inflow that it passes on, given each path's demand rate (a dictionary keyed by path).
+    A link passes on at most its outflow capacity; the rest queues on it, and once a link's queue would have
+    outgrown its storage by time start, the links feeding it pass on only what it can take (links leaving
+    origins store any queue).  Shares are found by repeated passes along the paths.
+    """
+    passed = dict.fromkeys(net.links, 1.0)
+    if iterations is None:
+        iterations = 2 * max([len(path) for path in rates] + [0]) + 2
+    origins = {ij for ij, link in net.links.items() if hasattr(net.nodes[link.tail], 'isCentroid')}
+    for _ in range(iterations):
+        entering = dict()
+        inflow = dict.fromkeys(net.links, 0.0)
+        flows = Counter()
+        offsets = Counter()
+        for path, rate in rates.items():
+            offset = 0
+            for j, ij in enumerate(path):
+                entering[path, j] = rate
+                inflow[ij] += rate
+                offsets[ij] += rate * offset
+                if j + 1 < len(path):
+                    flows[ij, path[j + 1]] += rate
+                offset += net.links[ij].freeFlowTime
+                rate *= passed[ij]
+        turns = {(ij, next) : flow / inflow[ij] for (ij, next), flow in flows.items()}
+        capacities = outflowCapacities(net, turns)
+        shares = {ij : min(1.0, capacities[ij] / inflow[ij]) if inflow[ij] > 0 else 1.0 for ij in net.links}
+        # the share of what each link is sent that it can take before its queue outgrows its storage
+        accepted = dict.fromkeys(net.links, 1.0)
+        for ij, link in net.links.items():
+            elapsed = start - offsets[ij] / inflow[ij] if inflow[ij] > 0 else 0
+            growth = inflow[ij] * (1 - shares[ij])
+            storage = link.maxVehicles - inflow[ij] * link.freeFlowTime
+            if ij not in origins and elapsed > 0 and growth * elapsed > max(storage, 0):
+                accepted[ij] = (inflow[ij] - growth + max(storage, 0) / elapsed) / inflow[ij]
+        for (ij, next) in flows:
+            shares[ij] = min(shares[ij], accepted[next])
+        passed = shares
+    return entering, passed
+
+def pathCounts(net, entering, passed, start):
+    """
+    The cumulative counts of each path on each link through time start, as a dictionary keyed by (path,
+    position) of (upstream, downstream) arrays with start + 1 entries: flow enters a link at its steady rate
+    once it has travelled the path's earlier links at free flow, and leaves at the share the link passes on one
+    free-flow time later.
+    """
+    k = numpy.arange(start + 1)
+    counts = dict()
+    for (path, j), rate in entering.items():
+        offset = sum(net.links[ij].freeFlowTime for ij in path[:j])
+        link = net.links[path[j]]
+        up = rate * numpy.maximum(k - offset, 0)
+        down = rate * passed[path[j]] * numpy.maximum(k - offset - link.freeFlowTime, 0)
+        counts[path, j] = (up, down)
+    return counts
+
+def fillCells(link, up, down):
+    """
+    Sets the vehicles in a cell transmission model link's cells from its total counts: vehicles that entered
+    over the last free-flow time in the cells they have reached, and the rest (the queue) packed from the
+    downstream end, with any left over in the first cell.
+    """
+    n = len(link.cells)
+    T = len(up) - 1
+    moving = [up[T - c] - up[T - c - 1] if T - c - 1 >= 0 else 0.0 for c in range(n)]
+    queue = max(0.0, up[T] - down[T] - sum(moving))
+    for c in reversed(range(n)):
+        add = min(max(0.0, link.cells[c].maxVehicles - moving[c]), queue)
+        moving[c] += add
+        queue -= add
+    moving[0] += queue
+    for c in range(n):
+        link.cells[c].vehicles = float(moving[c])
+
+def initializeSteadyState(net, start):
+    """
+    Initializes loading as if net had been loaded through time start (as by loadNetwork(range(start))), from
+    each path's mean path flow: resets the network as an initializing load does, then sets the links'
+    cumulative counts (or the fast engine's), the cells, the ramp meters' flows and the running totals.
+    Continue with loadNetwork(range(start, end), False).
+    """
+    if isinstance(net.engine, PartitionedEngine):
+        print("Steady state initialization is not implemented for the partitioned engine.")
+        raise linkModel.NotYetAttemptedException
+    rates = {path : float(numpy.mean(net.pathFlows[path][:net.timeHorizon])) for path in net.pathFlows}
+    rates = {path : rate for path, rate in rates.items() if rate > 0}
+    entering, passed = steadyRates(net, rates, start)
+    counts = pathCounts(net, entering, passed, start)
+
+    net.startLoading(range(0), True)
+    totals = {ij : (numpy.zeros(start + 1), numpy.zeros(start + 1)) for ij in net.links}
+    for (path, j), (up, down) in counts.items():
+        totals[path[j]][0][:] += up
+        totals[path[j]][1][:] += down
+    for ij, link in net.links.items():
+        if isinstance(link, linkModel.CellTransmissionModelLink):
+            fillCells(link, *totals[ij])
+    for node in net.nodes:
+        if isinstance(node, nodeModel.RampMeterNode):
+            node.flows = numpy.diff(totals[node.upstreamLinks[0].ID][1]).tolist()
+
+    if net.engine is None:
+        for ij, link in net.links.items():
+            onLink = [(path, j) for (path, j) in counts if path[j] == ij]
+            link.upstreamTotal = totals[ij][0].tolist()
+            link.downstreamTotal = totals[ij][1].tolist()
+            link.upstreamPathCount = [{path : float(counts[path, j][0][t]) for path, j in onLink} for t in range(start + 1)]
+            link.downstreamPathCount = [{path : float(counts[path, j][1][t]) for path, j in onLink} for t in range(start + 1)]
+    else:
+        engine = net.engine
+        engine.compile()
+        engine.reset()
+        for (path, j), (up, down) in counts.items():
+            if path in engine.paths:
+                s = engine.slotIndex[engine.paths.index(path), j]
+                engine.up[0, :start + 1, s] = up
+                engine.down[0, :start + 1, s] = down
+        for l, ij in enumerate(engine.linkIDs):
+            engine.upTotal[0, l, :start + 1] = totals[ij][0]
+            engine.downTotal[0, l, :start + 1] = totals[ij][1]
+        engine.upLength[:] = start + 1
+        engine.downLength[:] = start + 1
+
+    loaded = float(sum(up[-1] for (path, j), (up, down) in counts.items() if j == 0))
+    terminated = float(sum(down[-1] for (path, j), (up, down) in counts.items() if j == len(path) - 1))
+    net.totalLoaded = loaded
+    net.totalTerminated = terminated
+    net.vehiclesInNetwork = loaded - terminated
+    net.TSTT = float(sum((up[:start] - down[:start]).sum() for up, down in totals.values()))
+    net.TFFT = float(sum(counts[path, 0][0][-1] * net.pathFreeFlowTimes[path] for path in rates))
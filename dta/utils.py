@@ -1,6 +1,23 @@
+import sys
+
 class NotYetAttemptedException(Exception):
    pass   
    
 class BadFileFormatException(Exception):
-   pass   
-   
+   pass
+
+def deepSize(obj, seen):
+   """
+   Returns the bytes taken by obj and everything in it, following lists, tuples, sets and dictionaries (keys and
+   values) and counting each object whose id is not yet in seen, which is updated.  sys.getsizeof counts a NumPy
+   array's data only if the array owns it, so views of another array are not counted twice.
+   """
+   if id(obj) in seen:
+      return 0
+   seen.add(id(obj))
+   size = sys.getsizeof(obj)
+   if isinstance(obj, dict):
+      size += sum(deepSize(key, seen) + deepSize(value, seen) for key, value in obj.items())
+   elif isinstance(obj, (list, tuple, set, frozenset)):
+      size += sum(deepSize(item, seen) for item in obj)
+   return size
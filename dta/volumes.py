@@ -1,3 +1,5 @@
+import numpy
+
 def getVolumes(timestep):
     #volumes in vehicles per hour
     vols = {'nFwy' : 3000,
@@ -67,4 +69,12 @@ def getVolumes(timestep):
     for key in vols:
         vols[key] = vols[key]*timestep/3600
 
-    return vols
\ No newline at end of file
+    return vols
+
+def piecewiseProfile(factors, timeHorizon):
+    """
+    A time-of-day demand profile for setDemand: the horizon is split into len(factors) equal periods, and each
+    timestep's factor is that of its period (e.g. [0.5, 1, 1.5, 1] for a peak in the third quarter).
+    """
+    periods = numpy.minimum(numpy.arange(timeHorizon) * len(factors) // timeHorizon, len(factors) - 1)
+    return numpy.asarray(factors, dtype=float)[periods]
\ No newline at end of file
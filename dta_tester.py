@@ -1,13 +1,15 @@
-from dta.dta_env import dta_env
+from dta.dta_batch_env import dta_batch_env
 
 ni = 60//5
-env = dta_env(interval=60*5,numIntervals = ni)
-for i in range(30):
-    # env = dta_env(interval=60*5, numIntervals=ni)
+days = 30
+# all 30 days are loaded together, one scenario per day (see dta_batch_env)
+env = dta_batch_env(days, interval=60*5, numIntervals=ni)
+state = env.reset()
+rewards = []
+for _ in range(ni):
+    _, rew, _ = env.step()
+    rewards.append(rew)
+for i in range(days):
     with open(""+str(i)+".txt",'w') as outfile:
-        
-        state = env.reset()
-        for _ in range(ni):
-            _, rew, _ = env.step()
-            outfile.write(str(rew)+"\n")
-            outfile.flush()
\ No newline at end of file
+        for rew in rewards:
+            outfile.write(str(rew[i])+"\n")
\ No newline at end of file